@@ -8,6 +8,7 @@ import streamlit as st
 from services import oauth
 import logging
 from services import inoreader
+from utils.classifier import retrain_classifiers
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -113,12 +114,25 @@ def upload_file(temp_dir):
         options=["LeadIT-Iron", "LeadIT-Steel", "LeadIT-Cement"],
         key="target_folder_input"
     )
+    other_folders = st.multiselect(
+        "Also process these folders in the same run",
+        options=[folder for folder in ["LeadIT-Iron", "LeadIT-Steel", "LeadIT-Cement"] if folder != folder_choice],
+        key="other_folders_input",
+        help="Folders of one run share the work on the articles they have in common.",
+    )
+    st.checkbox(
+        "Write one combined workbook for all folders",
+        value=False,
+        key="combined_workbook",
+        disabled=not other_folders,
+    )
     
     # Display a "Fetch Articles" button.
     if st.button("Fetch Articles", key="fetch_articles_button"):
         st.session_state["target_folder"] = folder_choice
+        st.session_state["target_folders"] = [folder_choice] + other_folders
         # Fetch articles using the chosen folder.
-        articles = inoreader.fetch_inoreader_articles(folder_choice)
+        articles = inoreader.fetch_inoreader_articles(folder_choice, st.session_state.get("access_token"))
         st.session_state["json"] = articles
         st.session_state["selected_json"] = articles
         st.session_state["run_disabled"] = False
@@ -155,6 +169,257 @@ def input_data_specs():
 
 
 
+def input_run_options():
+    """
+    Advanced settings that control how a run uses the OpenAI API.
+    The defaults match an OpenAI tier 1 account for gpt-4o.
+    """
+    with st.expander("Advanced settings"):
+        st.checkbox(
+            "Batch mode (half price, results within 24 hours)",
+            value=False,
+            key="batch_mode",
+            help="Sends screening and extraction requests through the OpenAI Batch API and waits for the results. "
+            "Uses one screening call per headline and single-call extraction.",
+        )
+        st.selectbox(
+            "Batch backend",
+            options=["OpenAI Batch API", "Local stand-in"],
+            key="batch_backend",
+            help="The local stand-in writes the same batch files but answers them with regular API calls, for testing.",
+        )
+        st.number_input(
+            "Seconds between batch status checks",
+            min_value=5,
+            value=60,
+            step=5,
+            key="batch_poll_seconds",
+        )
+        st.number_input(
+            "Give up on a batch after (hours)",
+            min_value=1,
+            max_value=24,
+            value=24,
+            step=1,
+            key="batch_timeout_hours",
+        )
+        st.checkbox(
+            "Resume an interrupted run",
+            value=True,
+            key="resume_run",
+            help="If the last run of this folder did not finish, its completed steps are reused instead of being repeated.",
+        )
+        st.checkbox(
+            "Only process articles not seen in earlier runs",
+            value=False,
+            key="incremental_run",
+            help="Fetches articles since the last successful run of this folder and skips articles already processed.",
+        )
+        st.checkbox(
+            "Include earlier results from the past week in the workbook",
+            value=True,
+            key="reemit_prior_results",
+        )
+        st.checkbox(
+            "Reuse cached GPT responses",
+            value=True,
+            key="use_response_cache",
+            help="Identical prompts from previous runs are answered from a local cache instead of calling OpenAI again.",
+        )
+        st.checkbox(
+            "Reuse cached article links and text",
+            value=True,
+            key="use_article_cache",
+            help="Links resolved and articles downloaded by previous runs are not fetched again.",
+        )
+        st.checkbox(
+            "Collapse near-duplicate headlines",
+            value=True,
+            key="collapse_duplicates",
+            help="Only the first of several near-identical headlines is screened; the others share its result.",
+        )
+        st.slider(
+            "Duplicate similarity threshold",
+            min_value=70,
+            max_value=100,
+            value=90,
+            key="duplicate_threshold",
+        )
+        st.checkbox(
+            "Drop clearly unrelated headlines before GPT screening",
+            value=False,
+            key="use_prefilter",
+            help="Headlines are compared with the exclusion questions and examples of relevant headlines using embeddings. "
+            "Dropped headlines are listed in the 'Prefiltered' sheet. Check that sheet after a few runs and adjust the "
+            "thresholds below before relying on it, as dropped headlines are never screened by GPT.",
+        )
+        st.slider(
+            "Prefilter: minimum similarity to a relevant example",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.15,
+            step=0.01,
+            key="prefilter_min_positive_score",
+        )
+        st.slider(
+            "Prefilter: margin by which an exclusion question must be closer",
+            min_value=0.0,
+            max_value=1.0,
+            value=0.2,
+            step=0.01,
+            key="prefilter_exclusion_margin",
+        )
+        st.checkbox(
+            "Reuse verdicts of near-identical headlines from earlier runs",
+            value=False,
+            key="use_semantic_cache",
+            help="Headlines whose embedding is within the distance below of a headline screened before get its verdict without a GPT call. "
+            "Only verdicts screened with the same model and questions are reused.",
+        )
+        st.number_input(
+            "Semantic cache: maximum cosine distance",
+            min_value=0.0,
+            max_value=0.5,
+            value=0.05,
+            step=0.01,
+            key="semantic_cache_max_distance",
+        )
+        st.number_input(
+            "Semantic cache: forget verdicts after (days)",
+            min_value=1,
+            value=60,
+            step=1,
+            key="semantic_cache_max_age_days",
+        )
+        st.checkbox(
+            "Reject headlines the local classifier is sure about",
+            value=False,
+            key="use_classifier",
+            help="A model trained on earlier GPT verdicts rejects very likely irrelevant headlines without a GPT call. "
+            "It is used once it has been retrained with enough verdicts for the folder.",
+        )
+        st.slider(
+            "Local classifier: minimum probability of irrelevance",
+            min_value=0.5,
+            max_value=1.0,
+            value=0.97,
+            step=0.01,
+            key="classifier_threshold",
+        )
+        if st.button("Retrain local classifiers"):
+            st.json(retrain_classifiers(threshold=st.session_state.get("classifier_threshold", 0.97)))
+        st.checkbox(
+            "Ask the most effective exclusion questions first",
+            value=True,
+            key="adaptive_question_order",
+            help="Questions are ordered by how often they excluded a headline in earlier runs, per prompt token.",
+        )
+        st.checkbox(
+            "Start with the exclusion question closest to the headline",
+            value=True,
+            key="prefilter_first_question",
+            help="Uses the embedding prefilter to pick the first question for each headline.",
+        )
+        st.selectbox(
+            "Screening strategy",
+            options=["Concurrent", "Batched", "One call per headline", "Cascade"],
+            key="screening_strategy",
+            help="Batched asks each question about many headlines in one request. "
+            "One call per headline asks all questions about a headline in one request. "
+            "Cascade asks a small model first and only sends uncertain answers to the large model.",
+        )
+        st.slider(
+            "Cascade confidence threshold",
+            min_value=0.5,
+            max_value=1.0,
+            value=0.9,
+            step=0.01,
+            key="cascade_confidence_threshold",
+            help="Small-model answers with a lower probability are asked again to the large model.",
+        )
+        st.number_input(
+            "Articles screened in parallel",
+            min_value=1,
+            max_value=64,
+            value=8,
+            key="max_concurrency",
+            help="Also the most OpenAI calls in flight at once; fewer are sent while OpenAI throttles the account.",
+        )
+        st.number_input(
+            "Browser pages used to resolve article links",
+            min_value=1,
+            max_value=16,
+            value=4,
+            key="browser_parallelism",
+        )
+        st.selectbox(
+            "Links of irrelevant articles",
+            options=["Keep feed links", "Resolve in background after output", "Resolve all links"],
+            key="irrelevant_url_mode",
+            help="Resolving links takes a browser for some sites; by default only relevant articles are resolved.",
+        )
+        st.number_input(
+            "Article links resolved in parallel",
+            min_value=1,
+            max_value=32,
+            value=8,
+            key="resolve_workers",
+        )
+        st.number_input(
+            "Articles downloaded in parallel",
+            min_value=1,
+            max_value=32,
+            value=8,
+            key="fetch_workers",
+        )
+        st.number_input(
+            "Project detail extractions in parallel",
+            min_value=1,
+            max_value=16,
+            value=4,
+            key="extract_workers",
+        )
+        st.number_input(
+            "OpenAI requests per minute",
+            min_value=1,
+            value=500,
+            key="requests_per_minute",
+        )
+        st.number_input(
+            "OpenAI tokens per minute",
+            min_value=1000,
+            value=30000,
+            step=1000,
+            key="tokens_per_minute",
+        )
+        st.selectbox(
+            "Project detail extraction",
+            options=["Two calls", "Single call"],
+            key="extraction_mode",
+            help="Single call sends the article text once and asks for all details in a strict JSON format.",
+        )
+        st.checkbox(
+            "Send only relevant excerpts of long articles",
+            value=True,
+            key="use_excerpts",
+            help="Long articles are split into passages and only those closest to the extracted fields are sent to GPT.",
+        )
+        st.number_input(
+            "Excerpt token budget",
+            min_value=500,
+            value=3000,
+            step=500,
+            key="excerpt_token_budget",
+        )
+        st.number_input(
+            "Token budget per batched request",
+            min_value=500,
+            value=2000,
+            step=500,
+            key="batch_token_budget",
+        )
+
+
 def process_table():
     df = st.session_state["schema_table"]
     df = df.fillna("")
@@ -201,6 +466,7 @@ def build_interface(tmp_dir):
         st.session_state["output_detail_df"] = None
     # Unconditionally call input_data_specs to populate section III.
     input_data_specs()
+    input_run_options()
 
 def get_user_inputs():
     json = st.session_state["json"]
@@ -225,7 +491,116 @@ def display_output(xlsx_fname):
         st.download_button(
             label="Download Results",
             data=binary_file,
-            file_name="results.xlsx",
+            file_name=os.path.basename(xlsx_fname),
+            key=xlsx_fname,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
 
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} min {seconds:02d} s" if minutes else f"{seconds} s"
+
+
+def display_job_status(status):
+    if status["status"] == "queued":
+        st.info(f"Run of {status['folder']} is queued behind {status['queue_position']} other run(s).")
+    elif status["status"] == "running":
+        eta = f", about {format_duration(status['eta_seconds'])} left" if status["eta_seconds"] is not None else ""
+        st.progress(status["fraction_done"], text=f"{status['folder']}: {status['phase']}{eta}")
+        if status["total"] is not None:
+            st.caption(
+                f"{status['total']} articles: {status['screened']} screened, {status['resolved']} resolved, "
+                f"{status['extracted']} through extraction. You can leave this page and come back."
+            )
+
+
+def display_run_metrics(metrics):
+    """
+    Shows a summary of a run report (see utils.metrics.RunMetrics.report): OpenAI calls, tokens,
+    estimated cost and cache hit rates, with the time per stage, the calls per question, the
+    learned statistics of the screening questions and the cascade escalation rates.
+    """
+    if not metrics:
+        return
+    totals = metrics["totals"]
+    hit_rate = metrics["caches"].get("response_cache", {}).get("hit_rate")
+    with st.expander("Run metrics"):
+        columns = st.columns(4)
+        columns[0].metric("OpenAI calls", totals["calls"])
+        columns[1].metric("Tokens", f"{totals['prompt_tokens'] + totals['completion_tokens']:,}")
+        columns[2].metric("Estimated cost", f"${totals['cost_usd']:.2f}")
+        columns[3].metric("Response cache hits", f"{hit_rate:.0%}" if hit_rate is not None else "-")
+        st.caption("Seconds per stage (pipeline stages: summed over their workers)")
+        st.dataframe(pd.DataFrame([metrics["stage_seconds"]]), hide_index=True)
+        if metrics["calls"]:
+            st.caption("OpenAI calls per question or purpose, with latency percentiles in seconds")
+            st.dataframe(
+                pd.DataFrame.from_dict(metrics["calls"], orient="index").rename_axis("label").reset_index(),
+                hide_index=True,
+            )
+        if metrics.get("questions"):
+            st.caption("Screening questions: calls and hits of this run, learned hit rate and prompt tokens per call")
+            st.dataframe(
+                pd.DataFrame([
+                    {"folder": folder, "question": question, **question_stats}
+                    for folder, questions in metrics["questions"].items()
+                    for question, question_stats in questions.items()
+                ]),
+                hide_index=True,
+            )
+        if metrics.get("cascade_escalations"):
+            st.caption("Cascade: headlines the small model answered and escalated to the large model, per question")
+            st.dataframe(
+                pd.DataFrame([
+                    {"folder": folder, "question": question, **counts}
+                    for folder, questions in metrics["cascade_escalations"].items()
+                    for question, counts in questions.items()
+                ]),
+                hide_index=True,
+            )
+        if metrics["caches"]:
+            st.caption("Cache hit rates")
+            st.dataframe(
+                pd.DataFrame.from_dict(metrics["caches"], orient="index").rename_axis("cache").reset_index(),
+                hide_index=True,
+            )
+
+
+def display_job_progress(job_runner, job_id, poll_seconds=2):
+    """
+    Shows the progress of a background run, polled every poll_seconds without rerunning the rest
+    of the app, and the download button and run metrics once the run is done.
+    """
+    status = job_runner.status(job_id)
+    if status is None:
+        st.warning("This run is no longer available; the app may have been restarted. Please run it again.")
+        st.session_state.pop("job_id", None)
+        return
+
+    @st.fragment(run_every=poll_seconds)
+    def poll_job():
+        status = job_runner.status(job_id)
+        if status is None:
+            # The job expired or the process restarted while polling
+            st.session_state.pop("job_id", None)
+            st.error("This run is no longer available; the app may have been restarted. Please run it again.")
+            return
+        if status["status"] in ("done", "failed"):
+            # Rerun the whole app, which then shows the result without polling
+            st.rerun()
+        display_job_status(status)
+
+    if status["status"] in ("queued", "running"):
+        poll_job()
+    elif status["status"] == "failed":
+        st.error(f"Could not generate document: {status['error']}")
+    else:
+        st.success(
+            f"Document generated! {status['relevant']} relevant articles in "
+            f"{format_duration(status['finished_at'] - status['started_at'])}."
+        )
+        for output_location in status["output_locations"]:
+            if os.path.isfile(output_location):
+                display_output(output_location)
+        display_run_metrics(status["metrics"])
@@ -0,0 +1,9 @@
+"""
+The LeadIT headline pipeline, independent of any user interface.
+
+Run a folder from the command line with "python -m leadit run --folder LeadIT-Steel", or from
+Python with run_folder(RunConfig("LeadIT-Steel"), Credentials.from_env()).
+"""
+
+from leadit.config import Credentials, RunConfig, read_onedrive_credentials
+from leadit.pipeline import RunFailedError, default_analyzer, run_folder
@@ -0,0 +1,96 @@
+"""
+Command line entry point of the pipeline, for scheduled or scripted runs without the Streamlit app.
+
+Usage:
+    python -m leadit run --folder LeadIT-Steel [--settings settings.json] [--set key=value ...] [--output-dir DIR]
+    python -m leadit run --folder LeadIT-Iron --folder LeadIT-Steel [--combined]
+
+Credentials are read from the environment (see leadit.config.Credentials.from_env). Settings are
+the keys of the app's advanced settings (see leadit.config.RunConfig).
+"""
+
+import argparse
+import json
+import sys
+
+from leadit.config import Credentials, RunConfig
+from leadit.pipeline import RunFailedError, run_folder, run_folders, wait_for_deferred_urls
+
+
+def parse_setting(setting):
+    """
+    Parses a key=value setting; values are read as JSON when possible (true, 8, 0.9), else as text.
+    """
+    key, sep, value = setting.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got {setting!r}")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m leadit", description="Run the LeadIT headline pipeline without the Streamlit app.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Process the headlines of a folder and write the results workbook")
+    run_parser.add_argument(
+        "--folder", required=True, action="append", help="Inoreader folder, e.g. LeadIT-Steel; repeat to process several folders in one run"
+    )
+    run_parser.add_argument("--combined", action="store_true", help="With several folders, write one combined workbook")
+    run_parser.add_argument("--settings", help="JSON file of settings")
+    run_parser.add_argument("--set", action="append", default=[], type=parse_setting, metavar="KEY=VALUE", help="Setting overriding the settings file")
+    run_parser.add_argument("--json-feed", help="Read headlines from a JSON feed file instead of Inoreader")
+    run_parser.add_argument(
+        "--output-dir",
+        help="Directory to write the workbook to (default: the current directory if no OneDrive credentials are set)",
+    )
+    args = parser.parse_args(argv)
+
+    credentials = Credentials.from_env()
+    if not credentials.openai_api_key:
+        parser.error("OPENAI_API_KEY is not set")
+    if not args.json_feed and not credentials.inoreader_access_token:
+        parser.error("INOREADER_ACCESS_TOKEN is not set (or pass --json-feed)")
+    overrides = dict(args.set)
+    overrides["json_feed"] = args.json_feed
+    overrides["output_dir"] = args.output_dir or (None if credentials.onedrive else ".")
+    try:
+        if args.settings:
+            config = RunConfig.from_file(args.folder[0], args.settings, **overrides)
+        else:
+            config = RunConfig.from_mapping(args.folder[0], {}, **overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        if len(args.folder) > 1:
+            result = run_folders(args.folder, config, credentials, combined_workbook=args.combined)
+        else:
+            result = run_folder(config, credentials)
+    except RunFailedError as e:
+        print(f"Run failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        # Links resolved in the background are written into the workbook before the process exits
+        wait_for_deferred_urls()
+    if result is None:
+        return 1
+    print(json.dumps({
+        "folders": args.folder,
+        "output_locations": result["output_locations"],
+        "relevant": len(result["relevant_articles"]),
+        "irrelevant": len(result["irrelevant_articles"]),
+        "duplicates": len(result["duplicate_articles"]),
+        "prefiltered": len(result["prefiltered_articles"]),
+        "errors": len(result["error_articles"]),
+        "stage_seconds": result["stage_seconds"],
+        "openai_calls": result["openai_calls"],
+        "openai_totals": result["metrics"]["totals"],
+        "report_location": result["report_location"],
+    }, indent=2, default=str))
+    return 0 if result["output_locations"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
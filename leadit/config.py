@@ -0,0 +1,141 @@
+"""
+This module defines what a run of the pipeline needs from its caller: the settings of the run and
+the credentials of the services it talks to. Nothing here reads Streamlit state or secrets; the
+Streamlit app builds both from its session state and secrets, the command line from a settings
+file and environment variables.
+
+Classes:
+- RunConfig: The folder and the settings of one run, with the defaults of the app's advanced settings.
+- Credentials: OpenAI, Inoreader and OneDrive credentials of one run.
+
+Functions:
+- read_onedrive_credentials: Reads the OneDrive app credentials from a mapping of secrets.
+"""
+
+from dataclasses import dataclass, fields
+import json
+import os
+
+# Credentials field -> name of the secret in .streamlit/secrets.toml (upper-cased in the environment)
+ONEDRIVE_SECRET_KEYS = {
+    "tenant_id": "od_tenantid",
+    "client_id": "od_client_id",
+    "client_secret": "od_client_value",
+    "drive_id": "od_drive_id",
+    "parent_item_id": "od_parent_item",
+}
+
+
+@dataclass
+class RunConfig:
+    """
+    The folder to process and the settings of the run. Field names match the session state keys
+    of the app's advanced settings (see interface.input_run_options), and defaults match their defaults.
+    """
+
+    folder: str
+    # A JSON feed file to read instead of the Inoreader folder
+    json_feed: str = None
+    # Directory the workbook is also written to; without OneDrive credentials, the only copy
+    output_dir: str = None
+    batch_mode: bool = False
+    batch_backend: str = "OpenAI Batch API"
+    batch_poll_seconds: int = 60
+    batch_timeout_hours: int = 24
+    resume_run: bool = True
+    incremental_run: bool = False
+    reemit_prior_results: bool = True
+    use_response_cache: bool = True
+    use_article_cache: bool = True
+    collapse_duplicates: bool = True
+    duplicate_threshold: int = 90
+    use_prefilter: bool = False
+    prefilter_min_positive_score: float = 0.15
+    prefilter_exclusion_margin: float = 0.2
+    use_semantic_cache: bool = False
+    semantic_cache_max_distance: float = 0.05
+    semantic_cache_max_age_days: int = 60
+    use_classifier: bool = False
+    classifier_threshold: float = 0.97
+    adaptive_question_order: bool = True
+    prefilter_first_question: bool = True
+    screening_strategy: str = "Concurrent"
+    cascade_confidence_threshold: float = 0.9
+    max_concurrency: int = 8
+    browser_parallelism: int = 4
+    irrelevant_url_mode: str = "Keep feed links"
+    resolve_workers: int = 8
+    fetch_workers: int = 8
+    extract_workers: int = 4
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 30000
+    extraction_mode: str = "Two calls"
+    use_excerpts: bool = True
+    excerpt_token_budget: int = 3000
+    batch_token_budget: int = 2000
+
+    @classmethod
+    def from_mapping(cls, folder, mapping, **overrides):
+        """
+        Builds a RunConfig from the settings found in mapping (e.g. st.session_state or a parsed
+        settings file); other keys of mapping are ignored and missing settings keep their defaults.
+
+        Raises:
+            ValueError: If an override is not a setting.
+        """
+        names = {field.name for field in fields(cls)} - {"folder"}
+        unknown = set(overrides) - names
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        values = {name: mapping[name] for name in names if name in mapping}
+        values.update(overrides)
+        return cls(folder=folder, **values)
+
+    @classmethod
+    def from_file(cls, folder, path, **overrides):
+        """
+        Builds a RunConfig from a JSON file of settings, e.g. {"screening_strategy": "Cascade"}.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_mapping(folder, json.load(f), **overrides)
+
+
+def read_onedrive_credentials(mapping, uppercase=False):
+    """
+    Reads the OneDrive app credentials from a mapping of secrets (st.secrets, or os.environ with
+    uppercase=True).
+
+    Returns:
+        dict: The credentials by Credentials field name, or None if any of them is missing.
+    """
+    credentials = {}
+    for field_name, key in ONEDRIVE_SECRET_KEYS.items():
+        key = key.upper() if uppercase else key
+        if key not in mapping:
+            return None
+        credentials[field_name] = mapping[key]
+    return credentials
+
+
+@dataclass
+class Credentials:
+    """
+    Credentials of one run. Without OneDrive credentials the workbook is only written locally.
+    """
+
+    openai_api_key: str
+    inoreader_access_token: str = None
+    # Keys of ONEDRIVE_SECRET_KEYS
+    onedrive: dict = None
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """
+        Reads OPENAI_API_KEY, INOREADER_ACCESS_TOKEN and the OneDrive secrets (OD_TENANTID,
+        OD_CLIENT_ID, OD_CLIENT_VALUE, OD_DRIVE_ID, OD_PARENT_ITEM) from the environment.
+        """
+        return cls(
+            openai_api_key=environ.get("OPENAI_API_KEY"),
+            inoreader_access_token=environ.get("INOREADER_ACCESS_TOKEN"),
+            onedrive=read_onedrive_credentials(environ, uppercase=True),
+        )
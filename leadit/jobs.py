@@ -0,0 +1,161 @@
+"""
+This module runs pipeline runs as background jobs, so that a client submits a run, gets a job id
+back immediately and polls the job's progress instead of waiting for the run to finish. The
+Streamlit app uses it so that a run survives reruns and page refreshes, and so that runs
+submitted from several sessions queue instead of blocking each other.
+
+Classes:
+- Job: The state of one submitted run.
+- JobRunner: Queues runs and executes them on a pool of worker threads.
+
+Functions:
+- get_job_runner: Returns the job runner shared by every session of the process.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import os
+import threading
+import time
+import uuid
+
+from leadit.pipeline import run_folder, run_folders
+from leadit.progress import RunProgress
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Finished jobs are forgotten after a day; their workbooks stay where the run wrote them
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+@dataclass
+class Job:
+    """
+    A submitted run. status is "queued", "running", "done" or "failed".
+    """
+
+    job_id: str
+    folder: str
+    submitted_at: float
+    status: str = "queued"
+    progress: RunProgress = field(default_factory=RunProgress)
+    started_at: float = None
+    finished_at: float = None
+    result: dict = None
+    error: str = None
+
+
+class JobRunner:
+    """
+    Executes submitted runs on max_workers threads, in submission order. Runs share the process's
+    GPT response and article caches, whose enabled flags are set per run; a run whose cache
+    settings differ from those of the runs in progress waits for them to finish (see
+    leadit.pipeline.run_folder). By default one run executes at a time and the others wait in the queue.
+    """
+
+    def __init__(self, max_workers=1):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="leadit-job")
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, config, credentials, gpt_analyzer=None, folders=None, combined_workbook=False):
+        """
+        Queues a run of run_folder(config, credentials, gpt_analyzer), or of run_folders if
+        several folders are given.
+
+        Returns:
+            str: The id of the job.
+        """
+        self._forget_old_jobs()
+        folders = folders or [config.folder]
+        job = Job(job_id=uuid.uuid4().hex[:12], folder=", ".join(folders), submitted_at=time.time())
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.executor.submit(self._run, job, config, credentials, gpt_analyzer, folders, combined_workbook)
+        logger.info("Queued job %s for %s", job.job_id, job.folder)
+        return job.job_id
+
+    def _run(self, job, config, credentials, gpt_analyzer, folders, combined_workbook):
+        job.status, job.started_at = "running", time.time()
+        logger.info("Started job %s for %s", job.job_id, job.folder)
+        try:
+            if len(folders) > 1:
+                job.result = run_folders(folders, config, credentials, gpt_analyzer, job.progress, combined_workbook)
+            else:
+                job.result = run_folder(config, credentials, gpt_analyzer, job.progress)
+            if job.result is None:
+                job.status, job.error = "failed", "The headlines of the folder could not be read."
+            else:
+                job.status = "done"
+        except Exception as e:
+            logger.exception("Job %s failed", job.job_id)
+            job.status, job.error = "failed", str(e)
+        job.finished_at = time.time()
+        job.progress.set_phase("Finished" if job.status == "done" else "Failed")
+        logger.info("Job %s %s after %.0f seconds", job.job_id, job.status, job.finished_at - job.started_at)
+
+    def _forget_old_jobs(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        """
+        Returns the Job with id job_id, or None if it is unknown (e.g. the process restarted).
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def queue_position(self, job_id):
+        """
+        Returns how many queued jobs were submitted before job_id, or None if it is not queued.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return None
+            return sum(
+                1 for other in self.jobs.values() if other.status == "queued" and other.submitted_at < job.submitted_at
+            )
+
+    def status(self, job_id):
+        """
+        Returns the status of a job with its progress (see RunProgress.snapshot), queue position,
+        output locations, run report (see utils.metrics.RunMetrics.report) and error, as a dict;
+        None if the job is unknown.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job.job_id,
+            "folder": job.folder,
+            "status": job.status,
+            "queue_position": self.queue_position(job_id),
+            "submitted_at": job.submitted_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "output_locations": job.result["output_locations"] if job.result else [],
+            "relevant": len(job.result["relevant_articles"]) if job.result else None,
+            "metrics": job.result["metrics"] if job.result else None,
+            "error": job.error,
+            **job.progress.snapshot(),
+        }
+
+
+def get_job_runner():
+    """
+    Returns the job runner shared by every session of the process. LEADIT_JOB_WORKERS sets how
+    many runs execute at the same time (default 1).
+    """
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner(max_workers=int(os.environ.get("LEADIT_JOB_WORKERS", 1)))
+        return _job_runner
@@ -0,0 +1,1387 @@
+"""
+This module runs the headline pipeline of one folder without any user interface: fetch the
+headlines, screen them, resolve, download and excerpt the relevant articles, extract their
+project details and write the results workbook. The Streamlit app (main.py) and the command line
+(python -m leadit) are thin clients of run_folder, and of run_folders for several folders at once.
+
+Everything a run needs is passed in explicitly, as a RunConfig and Credentials (see leadit.config).
+Every run writes a JSON report of its metrics (stage timings, OpenAI calls and tokens, cache hit
+rates; see utils.metrics) next to its workbook.
+
+Classes:
+- RunFailedError: Raised when a run fails as a whole instead of article by article.
+- SharedResources: Browser pool, rate limiter and per-article work shared by the folders of a run.
+- ArticleStages: The per-article pipeline stages of one folder (screen, resolve, fetch, excerpt, extract, validate).
+
+Functions:
+- default_analyzer: Returns the analyzer the app uses for headline extraction.
+- resolve_deferred_urls: Resolves deferred article links and rewrites the workbook.
+- wait_for_deferred_urls: Waits for the background link resolution of finished runs.
+- fetch_headlines: Reads the headlines of a folder from Inoreader or a JSON feed.
+- run_folder: Processes the headlines of one folder and writes the results workbook.
+- group_articles_across_folders: Groups the headlines of several folders by article.
+- run_folders: Processes several folders concurrently, sharing the work on articles they have in common.
+"""
+
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import replace
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from leadit.progress import RunProgress
+from services.batch import get_batch_backends, prime_response_cache
+from services.openai_calls import OpenAIUnavailableError, call_label, get_call_layer, sent_calls
+from services.inoreader import ResolverService, build_df_for_folder, fetch_full_article_text, get_article_cache, resolve_urls
+from services.query_gpt import (
+    new_openai_session,
+    get_screening_strategies,
+    get_article_screeners,
+    get_extraction_modes,
+    get_response_cache,
+    CascadeStats,
+    estimate_screening_tokens,
+    estimate_batched_screening_tokens,
+    create_gpt_messages,
+    build_verdict_vector_query,
+    get_verdict_vector_format,
+    build_project_details_messages,
+    get_project_details_format,
+)
+from site_text.questions import (
+    STEEL_YES, STEEL_NO, IRON_YES, IRON_NO, STEEL_IRON_TECH, CEMENT_YES, CEMENT_NO, CEMENT_TECH, PROJECT_DETAIL_FIELDS
+)
+from utils.analysis import get_analyzer
+from utils.cache import hash_key
+from utils.checkpoint import RunCheckpoint
+from utils.classifier import HeadlineClassifier, VerdictStore
+from utils.dedupe import find_duplicate_clusters
+from utils.ledger import ProcessedLedger
+from utils.metrics import RunMetrics
+from utils.pipeline import Stage, run_pipeline
+from utils.prefilter import prefilter_headlines
+from utils.question_scheduler import QuestionScheduler
+from utils.rate_limit import RateLimiter
+from utils.read_json import parse_json_feed
+from utils.relevant_excerpts import embed_texts, select_relevant_excerpts
+from utils.results import get_output_fname, output_results_excel, output_run_report
+from utils.semantic_cache import SemanticVerdictCache, get_verdict_scope
+from utils.validate_results import get_check_results_flag
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Incremental runs fetch from one day before the last watermark, to catch items that
+# Inoreader indexed late; items seen before are skipped by id.
+INCREMENTAL_OVERLAP_SECONDS = 24 * 60 * 60
+# Earlier results re-emitted into an incremental workbook cover the same window as a full run.
+REEMIT_WINDOW_SECONDS = 7 * 24 * 60 * 60
+# Name of the combined workbook of a run of several folders
+COMBINED_FOLDER_NAME = "LeadIT-Combined"
+# The "fetch" pipeline stage downloads article texts; in run metrics "fetch" is fetching the headlines
+METRIC_STAGE_NAMES = {"fetch": "download"}
+ARTICLE_LISTS = ["relevant_articles", "irrelevant_articles", "duplicate_articles", "prefiltered_articles", "error_articles"]
+# A run in which more than this fraction of the articles failed (e.g. during an OpenAI outage) fails as a whole
+MAX_ERROR_FRACTION = 0.5
+
+# Settings that decide what the checkpointed stages produce, on top of the screening strategy,
+# extraction mode, model and questions; an interrupted run is only resumed with the same values
+CHECKPOINT_SETTINGS = [
+    "use_classifier",
+    "classifier_threshold",
+    "use_semantic_cache",
+    "semantic_cache_max_distance",
+    "cascade_confidence_threshold",
+    "batch_token_budget",
+    "irrelevant_url_mode",
+    "use_excerpts",
+    "excerpt_token_budget",
+]
+# Background link resolutions started by runs (see resolve_deferred_urls) that may still be running
+_deferred_threads = []
+_deferred_threads_lock = threading.Lock()
+# The cache switches applied by the runs in progress, how many runs use them, how many runs wait
+# for other switches and the switches to restore after the last run (see _cache_settings)
+_cache_switches = {"switches": None, "runs": 0, "waiting": 0, "previous": None}
+_cache_switches_condition = threading.Condition()
+
+MAIN_QUERY = "Extract any quote that addresses “{variable_name}” which we define as “{variable_description}”. "
+
+
+def default_analyzer(json_feed=None):
+    """
+    Returns the analyzer the Streamlit app builds with its default settings: headline extraction
+    of the variables in site_text/default_var_specs.json, answered as plain GPT responses.
+    """
+    var_info_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "site_text", "default_var_specs.json")
+    with open(var_info_path, "r", encoding="utf-8") as file:
+        variable_specs = {
+            spec["variable_name"]: {"variable_description": spec["variable_description"], "context": spec.get("context", "")}
+            for spec in json.load(file)
+            if spec.get("variable_name")
+        }
+    return get_analyzer(
+        "Headline extraction", "quotes_gpt_resp", [json_feed] if json_feed else "Inoreader", MAIN_QUERY, variable_specs, None
+    )
+
+
+def resolve_deferred_urls(
+    relevant_articles,
+    irrelevant_articles,
+    duplicate_articles,
+    output_fname,
+    ledger=None,
+    folder=None,
+    ledger_entries=(),
+    prefiltered_articles=(),
+    onedrive_credentials=None,
+    output_dir=None,
+    error_articles=(),
+):
+    """
+    Resolves the feed URLs of articles whose resolution was deferred (irrelevant articles,
+    near-duplicates and prefiltered headlines) in one cheap batch, then rewrites the workbook with the resolved links.
+    Meant to run in a background thread once the main output has been written.
+    """
+    deferred_articles = [article for article in irrelevant_articles if article.get("resolve_tier") == "deferred"]
+    deferred_articles += duplicate_articles
+    deferred_articles += prefiltered_articles
+    if not deferred_articles:
+        return
+    try:
+        resolved, _ = resolve_urls([article["url"] for article in deferred_articles])
+        for article in deferred_articles:
+            article["url"] = resolved.get(article["url"]) or article["url"]
+            article.pop("resolve_tier", None)
+        output_results_excel(
+            list(relevant_articles), list(irrelevant_articles), output_fname, list(duplicate_articles), prefiltered_articles,
+            onedrive_credentials, output_dir, error_articles=error_articles,
+        )
+        if ledger:
+            ledger.record(folder, ledger_entries)
+        logger.info("Rewrote %s with %s resolved links", output_fname, len(deferred_articles))
+    except Exception:
+        logger.exception("Background link resolution failed")
+
+
+def wait_for_deferred_urls():
+    """
+    Waits for the background link resolution of finished runs (irrelevant_url_mode "Resolve in
+    background after output"). It runs on daemon threads that die with the process, so clients
+    that exit after a run, like the command line, must call this first.
+
+    Returns:
+        int: The number of workbooks whose links were still being resolved.
+    """
+    with _deferred_threads_lock:
+        threads = [thread for thread in _deferred_threads if thread.is_alive()]
+        _deferred_threads.clear()
+    if threads:
+        logger.info("Waiting for the background link resolution of %s workbooks", len(threads))
+    for thread in threads:
+        thread.join()
+    return len(threads)
+
+
+def fetch_headlines(config, credentials, ledger=None):
+    """
+    Reads the headlines of config.folder from Inoreader, or from config.json_feed if set. With a
+    ledger (incremental runs), only headlines since the folder's last run are fetched.
+
+    Returns:
+        pd.DataFrame: The headlines, or None if they could not be read.
+    """
+    if config.json_feed:
+        try:
+            headlines = parse_json_feed(config.json_feed)
+            logger.info("Parsed %s headlines from JSON", len(headlines))
+        except Exception as e:
+            logger.warning("Failed to parse JSON: %s", e)
+            return None
+    else:
+        try:
+            since = None
+            if ledger:
+                watermark = ledger.get_watermark(config.folder)
+                if watermark:
+                    since = watermark - INCREMENTAL_OVERLAP_SECONDS
+            headlines = build_df_for_folder(config.folder, credentials.inoreader_access_token, since)
+            logger.debug("Headlines of %s:\n%s", config.folder, headlines)
+            logger.info("Fetched %s headlines of %s", len(headlines), config.folder)
+        except Exception as e:
+            logger.warning("Failed to fetch the headlines of %s: %s", config.folder, e)
+            return None
+    return headlines
+
+
+# Errors every later article would hit as well; they abort the run instead of failing each article
+ABORT_ON = (OpenAIUnavailableError,)
+
+
+class RunFailedError(RuntimeError):
+    """
+    Raised when a run fails as a whole, e.g. because most of its articles could not be
+    processed, so that it is reported as failed rather than done with a misleading workbook.
+    """
+
+
+class SharedResources:
+    """
+    What the pipelines of the folders of one run share: the browser pool that resolves links, the
+    OpenAI rate limiter, and the link and text of each article. An article that appears in several
+    folders is resolved and downloaded once, even when the folders' pipelines reach it at the same time.
+    """
+
+    def __init__(self, resolver, rate_limiter):
+        self.resolver = resolver
+        self.rate_limiter = rate_limiter
+        self.lock = threading.Lock()
+        self.results = {}
+        self.reused = {"resolve": 0, "fetch": 0}
+
+    def _once(self, kind, key, fxn):
+        with self.lock:
+            future = self.results.get((kind, key))
+            owner = future is None
+            if owner:
+                future = self.results[(kind, key)] = Future()
+            else:
+                self.reused[kind] += 1
+        if owner:
+            try:
+                future.set_result(fxn())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def resolve(self, feed_url):
+        """
+        Returns (url, tier) of the article at feed_url, resolving it on the first call only.
+        """
+        return self._once("resolve", feed_url, lambda: self.resolver.resolve(feed_url))
+
+    def fetch_text(self, article):
+        """
+        Returns the full text of the article at article["url"], downloading it on the first call only.
+        """
+        return self._once("fetch", article.get("url"), lambda: fetch_full_article_text(article))
+
+
+@contextmanager
+def _cache_settings(config):
+    """
+    Applies the cache switches of config to the process-wide response and article caches for the
+    duration of a run, and restores the previous switches after the last run using them. Batch
+    mode needs the response cache, which delivers the batched answers, whatever the setting.
+
+    Runs with the same switches proceed concurrently; a run with other switches waits until the
+    runs in progress are done, so that no run changes the caches under another one. Once a run
+    waits, later runs wait too, so that the waiting run is not starved.
+    """
+    response_cache, article_cache = get_response_cache(), get_article_cache()
+    switches = (config.use_response_cache or config.batch_mode, config.use_article_cache)
+    with _cache_switches_condition:
+        if _cache_switches["runs"] and (_cache_switches["switches"] != switches or _cache_switches["waiting"]):
+            logger.info("Waiting for other runs before applying the cache settings of this run")
+            _cache_switches["waiting"] += 1
+            _cache_switches_condition.wait_for(lambda: not _cache_switches["runs"])
+            _cache_switches["waiting"] -= 1
+        if not _cache_switches["runs"]:
+            _cache_switches["previous"] = response_cache.enabled, article_cache.enabled
+            _cache_switches["switches"] = switches
+            response_cache.enabled, article_cache.enabled = switches
+        _cache_switches["runs"] += 1
+    try:
+        yield
+    finally:
+        with _cache_switches_condition:
+            _cache_switches["runs"] -= 1
+            if not _cache_switches["runs"]:
+                response_cache.enabled, article_cache.enabled = _cache_switches["previous"]
+                _cache_switches_condition.notify_all()
+
+
+def run_folder(
+    config,
+    credentials,
+    gpt_analyzer=None,
+    progress=None,
+    headlines=None,
+    shared=None,
+    write_workbook=True,
+    metrics=None,
+):
+    """
+    Processes the headlines of one folder and writes the results workbook. This is the whole
+    pipeline behind both the Streamlit app and the command line; it reads nothing from Streamlit.
+    Unless metrics are passed in, the run's metrics are collected and written next to the workbook.
+
+    Args:
+        config: A RunConfig with the folder and the settings of the run.
+        credentials: A Credentials with the OpenAI key, the Inoreader access token and the
+            OneDrive app credentials (optional).
+        gpt_analyzer: The GPT analyzer object; defaults to default_analyzer().
+        progress: Optional RunProgress (see leadit.progress) updated as the run advances.
+        headlines: Optional headlines already fetched with fetch_headlines.
+        shared: Optional SharedResources of a run of several folders (see run_folders).
+        write_workbook: If False, no workbook is written (run_folders writes a combined one).
+        metrics: Optional RunMetrics (see utils.metrics) of a run of several folders, which
+            then reports them itself.
+
+    Returns:
+        dict: The workbook name ("output_fname"), where it was written ("output_location", and
+        as a list in "output_locations"), the
+        relevant, irrelevant, duplicate and prefiltered articles, the articles that hit errors
+        ("error_articles", with what went wrong in "errors"), the seconds spent per stage,
+        the OpenAI calls, retries and throttling during the run ("openai_calls"), the run
+        report ("metrics", see RunMetrics.report) and where it was written ("report_location");
+        None if the headlines could not be read.
+
+    Raises:
+        RunFailedError: If more than MAX_ERROR_FRACTION of the articles hit errors, or the run was
+            aborted because OpenAI is unavailable.
+    """
+    # The folders of run_folders share its cache settings, which it applies for the whole run
+    with _cache_settings(config) if shared is None else nullcontext():
+        try:
+            if metrics is not None:
+                return _process_folder(config, credentials, gpt_analyzer, progress, headlines, shared, write_workbook, metrics)
+            metrics = RunMetrics()
+            with get_call_layer().observe(metrics.record_call):
+                result = _process_folder(config, credentials, gpt_analyzer, progress, headlines, shared, write_workbook, metrics)
+        except OpenAIUnavailableError as e:
+            # The checkpoints are kept, so a rerun with resume_run continues where this one stopped
+            raise RunFailedError(f"The run of {config.folder} was aborted because OpenAI is unavailable: {e}") from e
+        if result is None:
+            return None
+        result["metrics"] = metrics.report(
+            folders=[config.folder], relevant=len(result["relevant_articles"]), openai_calls=result["openai_calls"]
+        )
+    result["report_location"] = None
+    if result["output_fname"]:
+        try:
+            result["report_location"] = output_run_report(
+                result["metrics"], result["output_fname"], credentials.onedrive, config.output_dir
+            )
+        except Exception as e:
+            logger.warning("Could not write the run report: %s", e)
+    return result
+
+
+def _folder_questions(folder):
+    """
+    Returns the exclusion questions, the relevant exemplars and the technology list of a folder.
+    """
+    if folder == "LeadIT-Steel":
+        target_questions, positive_exemplars = STEEL_NO, STEEL_YES
+    elif folder == "LeadIT-Iron":
+        target_questions, positive_exemplars = IRON_NO, IRON_YES
+    elif folder == "LeadIT-Cement":
+        target_questions, positive_exemplars = CEMENT_NO, CEMENT_YES
+    else:
+        target_questions, positive_exemplars = [], []  # or some default
+    tech_list = CEMENT_TECH if folder == "LeadIT-Cement" else STEEL_IRON_TECH
+    return target_questions, positive_exemplars, tech_list
+
+
+def _collapse_duplicates(headlines, threshold):
+    """
+    Collapses syndicated copies of the same story; only the first headline of each cluster is screened.
+
+    Returns:
+        tuple: (screened_headlines, duplicate_articles) where duplicate_articles are the other
+        headlines of each cluster, with the id of their representative in "duplicate_of".
+    """
+    duplicate_articles = []
+    clusters = find_duplicate_clusters(headlines["title"], threshold)
+    for article_index, representative_index in clusters.items():
+        if article_index != representative_index:
+            duplicate_articles.append({
+                "title": headlines.loc[article_index, "title"].split(" - ")[0].strip(),
+                "url": headlines.loc[article_index, "url"],
+                "duplicate_of": headlines.loc[representative_index, "id"],
+                "id": headlines.loc[article_index, "id"],
+                "published": headlines.loc[article_index, "date_published"],
+            })
+    logger.info("Collapsed %s near-duplicate headlines", len(duplicate_articles))
+    return headlines[clusters == clusters.index], duplicate_articles
+
+
+def _embed_headlines(openai_client, headlines):
+    """
+    Embeds the headlines once, for both the prefilter and the semantic verdict cache.
+
+    Returns:
+        dict: The embedding of each headline by index; empty if the headlines could not be embedded.
+    """
+    try:
+        with call_label("embeddings: headlines"):
+            return dict(zip(headlines.index, embed_texts(openai_client, headlines["text_column"].tolist())))
+    except Exception as e:
+        logger.warning("Could not embed headlines, skipping the prefilter and the semantic cache: %s", e)
+        return {}
+
+
+def _prefilter(config, openai_client, headlines, target_questions, positive_exemplars, headline_embeddings):
+    """
+    Drops headlines that are far from every relevant exemplar before paying for GPT calls.
+
+    Returns:
+        tuple: (kept headlines, prefiltered articles); every headline is kept if the prefilter fails.
+    """
+    try:
+        with call_label("embeddings: prefilter"):
+            return prefilter_headlines(
+                openai_client,
+                headlines,
+                target_questions,
+                positive_exemplars,
+                config.prefilter_min_positive_score,
+                config.prefilter_exclusion_margin,
+                headline_embeddings,
+            )
+    except Exception as e:
+        logger.warning("Prefilter failed, screening every headline with GPT: %s", e)
+        return headlines, []
+
+
+def _classifier_rejections(folder, headlines, threshold):
+    """
+    Returns the headlines the local classifier (trained on earlier GPT verdicts) is very sure are
+    irrelevant, as a dict of their index to the classifier's probability; all other headlines are
+    screened by GPT as usual. Without a trained classifier no headline is rejected.
+    """
+    try:
+        classifier = HeadlineClassifier.load(folder)
+    except Exception as e:
+        logger.warning("Could not load the local classifier for %s, skipping it: %s", folder, e)
+        return {}
+    if classifier is None:
+        logger.info("No trained local classifier for %s yet, skipping it", folder)
+        return {}
+    probabilities = classifier.predict_irrelevant(headlines["title"].str.split(" - ").str[0].str.strip())
+    rejected = {
+        article_index: probability
+        for article_index, probability in zip(headlines.index, probabilities)
+        if probability >= threshold
+    }
+    logger.info(
+        "Local classifier rejected %s of %s headlines (held-out report: %s)",
+        len(rejected), len(headlines), classifier.report,
+    )
+    return rejected
+
+
+def _semantic_cache_hits(config, folder, gpt_model, target_questions, headline_embeddings, lookup_indexes, metrics):
+    """
+    Looks up headlines worded almost like a headline screened in an earlier run with the same
+    model and questions, which reuse its verdict.
+
+    Returns:
+        tuple: (semantic_cache, hits) where hits maps the index of each matched headline to the
+        (irrelevant, triggered_by, similarity) of its match; (None, {}) if the cache is unavailable.
+    """
+    try:
+        semantic_cache = SemanticVerdictCache(
+            get_verdict_scope(gpt_model, target_questions), max_age_days=config.semantic_cache_max_age_days
+        )
+        matches = semantic_cache.lookup(
+            folder,
+            [headline_embeddings[index] for index in lookup_indexes],
+            config.semantic_cache_max_distance,
+        )
+        hits = {index: match for index, match in zip(lookup_indexes, matches) if match}
+        metrics.add_cache_counts("semantic_cache", len(hits), len(lookup_indexes))
+        logger.info("Semantic verdict cache answered %s of %s headlines", len(hits), len(lookup_indexes))
+        return semantic_cache, hits
+    except Exception as e:
+        logger.warning("Semantic verdict cache is unavailable: %s", e)
+        return None, {}
+
+
+def _prime_screening_batch(batch_backend, batch_options, gpt_model, target_questions, headlines):
+    """
+    Sends the screening request of every headline through the Batch API into the response cache.
+    """
+    submitted, failed = prime_response_cache(
+        batch_backend,
+        [
+            (
+                f"screen-{article_index}",
+                gpt_model,
+                create_gpt_messages(build_verdict_vector_query(target_questions, article_row["text_column"]), True),
+                get_verdict_vector_format(target_questions),
+            )
+            for article_index, article_row in headlines.iterrows()
+        ],
+        **batch_options,
+    )
+    logger.info("Screening batch: %s requests submitted, %s failed (failed ones are asked directly)", submitted, failed)
+
+
+def _prime_extraction_batch(batch_backend, batch_options, gpt_model, tech_list, articles):
+    """
+    Sends the extraction request of every relevant article through the Batch API into the response cache.
+    """
+    submitted, failed = prime_response_cache(
+        batch_backend,
+        [
+            (
+                f"extract-{article['index']}",
+                gpt_model,
+                build_project_details_messages(article["extraction_text"], tech_list),
+                get_project_details_format(),
+            )
+            for article in articles
+            if article.get("relevant") != "no" and "extraction_text" in article
+        ],
+        **batch_options,
+    )
+    logger.info("Extraction batch: %s requests submitted, %s failed (failed ones are asked directly)", submitted, failed)
+
+
+class ArticleStages:
+    """
+    The stages every article of a folder flows through: screen -> resolve -> fetch -> excerpt ->
+    extract -> validate. Each stage method takes an article dict and returns it updated; the stages
+    run in parallel on different articles (see utils.pipeline), so network waits overlap instead
+    of adding up.
+
+    Headlines the local classifier rejected or the semantic cache answered are screened without a
+    GPT call. Strategies that ask about many headlines per request have no per-article screener;
+    they screen the whole folder up front (screen_up_front) and the screen stage looks up their verdicts.
+    """
+
+    def __init__(
+        self,
+        config,
+        gpt_analyzer,
+        openai_client,
+        gpt_model,
+        shared,
+        screening_strategy,
+        extraction_mode,
+        target_questions,
+        tech_list,
+        classifier_rejected=None,
+        semantic_hits=None,
+    ):
+        self.config = config
+        self.gpt_analyzer = gpt_analyzer
+        self.openai_client = openai_client
+        self.gpt_model = gpt_model
+        self.shared = shared
+        self.screening_strategy = screening_strategy
+        self.extraction_mode = extraction_mode
+        self.target_questions = target_questions
+        self.tech_list = tech_list
+        self.classifier_rejected = classifier_rejected or {}
+        self.semantic_hits = semantic_hits or {}
+        self.extract_details = get_extraction_modes()[extraction_mode]
+        self.screening_options = {
+            "max_workers": config.max_concurrency,
+            "requests_per_minute": config.requests_per_minute,
+            "tokens_per_minute": config.tokens_per_minute,
+        }
+        if screening_strategy == "Batched":
+            self.screening_options["token_budget"] = config.batch_token_budget
+        # Options the per-article screener takes on top of the shared screening arguments
+        self.screener_options = {}
+        self.cascade_stats = None
+        if screening_strategy == "Cascade":
+            self.cascade_stats = CascadeStats()
+            self.screener_options = {
+                "confidence_threshold": config.cascade_confidence_threshold,
+                "stats": self.cascade_stats,
+            }
+        self.article_screener = get_article_screeners().get(screening_strategy)
+        # Questions are asked in order of hit rate per prompt token, learned from earlier runs, so that
+        # irrelevant headlines reach their first "yes" in fewer calls. The vector strategy asks all
+        # questions in one call, so order does not matter there.
+        self.scheduler = None
+        if config.adaptive_question_order and target_questions and screening_strategy != "One call per headline":
+            self.scheduler = QuestionScheduler(config.folder)
+        self.ordered_questions = self.scheduler.order(target_questions) if self.scheduler else target_questions
+        self.verdicts = {}
+        # Calls sent per label by screen_up_front, and the average number of headlines per Batched request
+        self.up_front_calls = Counter()
+        self.batch_sizes = {}
+
+    def settings_fingerprint(self):
+        """
+        Returns a hash of everything that decides what the stages produce, so that checkpoints of
+        a run with other settings (e.g. another screening strategy or other questions) are not reused.
+        """
+        return hash_key({
+            "screening_strategy": self.screening_strategy,
+            "extraction_mode": self.extraction_mode,
+            "gpt_model": self.gpt_model,
+            "target_questions": sorted(self.target_questions),
+            "tech_list": self.tech_list,
+            **{name: getattr(self.config, name) for name in CHECKPOINT_SETTINGS},
+        })
+
+    def screen_up_front(self, headlines):
+        """
+        Screens the headlines with a whole-folder strategy; the screen stage then looks up their verdicts.
+        """
+        lock = threading.Lock()
+
+        def count_call(label, *_):
+            with lock:
+                self.up_front_calls[label] += 1
+
+        with get_call_layer().observe(count_call):
+            relevance_df = get_screening_strategies()[self.screening_strategy](
+                self.gpt_analyzer,
+                headlines,
+                self.ordered_questions,
+                run_on_full_text=True,  # or False, as applicable
+                gpt_client=self.openai_client,
+                gpt_model=self.gpt_model,
+                rate_limiter=self.shared.rate_limiter,
+                **self.screening_options,
+            )
+        self.verdicts = {
+            row["index"]: (row["relevant"] == "no", row["triggered_by"])
+            for _, row in relevance_df.iterrows()
+        }
+        # Every headline is asked the questions up to the one that excluded it
+        asked = Counter()
+        for is_irrelevant, triggered_by in self.verdicts.values():
+            questions = self.ordered_questions
+            asked.update(questions[:questions.index(triggered_by) + 1] if is_irrelevant and triggered_by in questions else questions)
+        self.batch_sizes = {
+            question: asked[question] / self.up_front_calls[f"screen: {question}"]
+            for question in asked
+            if self.up_front_calls[f"screen: {question}"]
+        }
+
+    def _question_tokens(self, question, headline):
+        """
+        Returns the estimated prompt tokens that asking question about headline costs with the screening strategy.
+        """
+        if self.screening_strategy == "Batched":
+            tokens = estimate_batched_screening_tokens(question, headline, self.gpt_model, self.batch_sizes.get(question, 1))
+        else:
+            tokens = estimate_screening_tokens(question, headline, self.gpt_model)
+        if self.cascade_stats:
+            # The small model reads every prompt; the large model reads the escalated ones again
+            tokens *= 1 + self.cascade_stats.escalation_rates().get(question, {}).get("escalation_rate", 0)
+        return round(tokens)
+
+    def _record_question_stats(self, article, asked_questions, sent_labels):
+        if self.scheduler and not article.get("screened_by"):
+            triggered_by = article.get("triggered_by", "")
+            asked = asked_questions[:asked_questions.index(triggered_by) + 1] if triggered_by in asked_questions else asked_questions
+            # Answers from the response cache cost no call and would skew the learned order
+            asked = [question for question in asked if f"screen: {question}" in sent_labels]
+            self.scheduler.record(
+                asked,
+                triggered_by,
+                {question: self._question_tokens(question, article["text_column"]) for question in asked},
+            )
+
+    def screen(self, article):
+        if article["index"] in self.classifier_rejected:
+            article["relevant"] = "no"
+            article["triggered_by"] = f"Local classifier (p={self.classifier_rejected[article['index']]:.2f})"
+            article["screened_by"] = "classifier"
+            return article
+        if article["index"] in self.semantic_hits:
+            is_irrelevant, question, _ = self.semantic_hits[article["index"]]
+            article["relevant"] = "no" if is_irrelevant else "yes"
+            article["triggered_by"] = question
+            article["screened_by"] = "semantic cache"
+            return article
+        questions = self.ordered_questions
+        if self.article_screener:
+            if self.scheduler and article.get("first_question"):
+                questions = self.scheduler.order(self.target_questions, article["first_question"])
+            with sent_calls() as sent_labels:
+                is_irrelevant, question = self.article_screener(
+                    self.gpt_analyzer, article, questions, True, self.openai_client, self.gpt_model,
+                    self.shared.rate_limiter, **self.screener_options,
+                )
+        else:
+            is_irrelevant, question = self.verdicts[article["index"]]
+            sent_labels = self.up_front_calls
+        article["relevant"] = "no" if is_irrelevant else "yes"
+        article["triggered_by"] = question or ""
+        self._record_question_stats(article, questions, sent_labels)
+        return article
+
+    def resolve(self, article):
+        if "relevant" not in article:
+            # Screening failed; the article is reported with its errors and not processed further
+            return article
+        if article["relevant"] == "no" and self.config.irrelevant_url_mode != "Resolve all links":
+            # Irrelevant articles only appear in the "Irrelevant" sheet; their feed URL is good enough
+            article["url"], article["resolve_tier"] = article["feed_url"], "deferred"
+        else:
+            article["url"], article["resolve_tier"] = self.shared.resolve(article["feed_url"])
+        return article
+
+    def fetch(self, article):
+        if article.get("relevant") == "yes":
+            # Fetch full article text (or use text from the article if already available)
+            article["full_text"] = self.shared.fetch_text(article)
+        return article
+
+    def excerpt(self, article):
+        # Long articles are cut down to their most relevant passages before extraction; the switch
+        # allows comparing extraction quality with and without excerpts
+        if article.get("relevant") == "yes":
+            article["extraction_text"] = article.get("full_text", "")
+            if self.config.use_excerpts and article["extraction_text"]:
+                try:
+                    with call_label("embeddings: excerpts"):
+                        article["extraction_text"], article["excerpt_tokens_saved"] = select_relevant_excerpts(
+                            self.openai_client, article["extraction_text"], PROJECT_DETAIL_FIELDS,
+                            self.config.excerpt_token_budget, self.gpt_model,
+                        )
+                except Exception as e:
+                    logger.warning("Excerpt selection failed for %s, using the full text: %s", article["feed_url"], e)
+        return article
+
+    def extract(self, article):
+        if article.get("relevant") == "yes":
+            # Extract project details from the article text using the new GPT function.
+            article["details"] = self.extract_details(
+                self.openai_client, self.gpt_model, article.get("extraction_text", ""), self.tech_list
+            )
+            logger.debug("Extracted the details of %s", article["feed_url"])
+        return article
+
+    def validate(self, article):
+        details = article.get("details")
+        if details and article.get("full_text"):
+            core_extracted = {key: details.get(key, "") for key in ["project_name", "scale", "timeline", "technology"]}
+            article["check_results"], _ = get_check_results_flag(core_extracted, article["full_text"])
+        return article
+
+    def stages(self, checkpoint):
+        """
+        Returns the pipeline stages (see utils.pipeline.Stage), each checkpointed per article in
+        checkpoint (a utils.checkpoint.RunCheckpoint). Excerpts and details are only reused for the same text.
+        """
+        def text_fingerprint(article):
+            return hash_key(article.get("full_text", ""))
+
+        config = self.config
+        return [
+            Stage(
+                "screen",
+                checkpoint.checkpointed("screen", self.screen, ["relevant", "triggered_by", "screened_by"]),
+                self.screening_options["max_workers"],
+            ),
+            Stage(
+                "resolve",
+                checkpoint.checkpointed(
+                    "resolve", self.resolve, ["url", "resolve_tier"],
+                    failed_fxn=lambda article: article.get("resolve_tier") == "failed",
+                ),
+                config.resolve_workers,
+            ),
+            # Article text comes from the article cache, so only its hash is checkpointed
+            Stage("fetch", self.fetch, config.fetch_workers),
+            Stage(
+                "excerpt",
+                checkpoint.checkpointed("excerpt", self.excerpt, ["extraction_text", "excerpt_tokens_saved"], text_fingerprint),
+                config.extract_workers,
+            ),
+            Stage(
+                "extract",
+                checkpoint.checkpointed("extract", self.extract, ["details"], text_fingerprint),
+                config.extract_workers,
+            ),
+            Stage("validate", self.validate, 1),
+        ]
+
+    def log_stats(self, articles, metrics):
+        """
+        Logs what the stages did beyond their verdicts (restored checkpoints, learned question
+        order, cascade escalations, excerpt savings), reports them to metrics (a
+        utils.metrics.RunMetrics) and saves the question statistics.
+        """
+        resumed = [article for article in articles if article.get("resumed_stages")]
+        if resumed:
+            logger.info("Restored checkpointed stages of %s articles", len(resumed))
+        if self.scheduler:
+            scheduler_stats = self.scheduler.stats()
+            metrics.add_section("questions", self.config.folder, scheduler_stats)
+            for question, question_stats in scheduler_stats.items():
+                logger.info(
+                    "Asked %s times, %s hits (hit rate %.2f, %.0f tokens per call) for question: %s",
+                    question_stats["asked"], question_stats["hits"], question_stats["hit_rate"],
+                    question_stats["avg_tokens"] or 0, question,
+                )
+            try:
+                self.scheduler.save()
+            except Exception as e:
+                logger.warning("Could not save question statistics: %s", e)
+        if self.cascade_stats:
+            escalation_rates = self.cascade_stats.escalation_rates()
+            metrics.add_section("cascade_escalations", self.config.folder, escalation_rates)
+            for question, counts in escalation_rates.items():
+                logger.info(
+                    "Escalated %s of %s headlines (%.0f%%) for question: %s",
+                    counts["escalated"], counts["asked"], 100 * counts["escalation_rate"], question,
+                )
+        if self.config.use_excerpts:
+            excerpted = [article for article in articles if article.get("excerpt_tokens_saved")]
+            tokens_saved = sum(article["excerpt_tokens_saved"] for article in excerpted)
+            metrics.count("excerpted_articles", len(excerpted))
+            metrics.count("excerpt_tokens_saved", tokens_saved)
+            logger.info("Excerpt selection trimmed %s articles, saving %s article tokens", len(excerpted), tokens_saved)
+
+
+def _pipeline_articles(headlines, prefilter_first_question):
+    """
+    Returns the article dicts that enter the pipeline, one per headline.
+    """
+    return [
+        {
+            "index": article_index,
+            "id": article_row["id"],
+            "title": article_row["title"].split(" - ")[0].strip(),
+            "feed_url": article_row["url"],
+            "published": article_row["date_published"],
+            "text_column": article_row["text_column"],
+            # The exclusion question closest to the headline according to the prefilter, if any
+            "first_question": article_row.get("closest_question") if prefilter_first_question else None,
+        }
+        for article_index, article_row in headlines.iterrows()
+    ]
+
+
+def _record_verdicts(folder, articles, semantic_cache, headline_embeddings):
+    """
+    GPT verdicts become training data for the local classifier and entries of the semantic cache.
+    """
+    gpt_screened = [article for article in articles if "relevant" in article and not article.get("screened_by")]
+    try:
+        VerdictStore().record(folder, [
+            {
+                "id": article["id"],
+                "headline": article["title"],
+                "irrelevant": article["relevant"] == "no",
+                "triggered_by": article.get("triggered_by", ""),
+            }
+            for article in gpt_screened
+        ])
+    except Exception as e:
+        logger.warning("Could not record screening verdicts: %s", e)
+    if semantic_cache:
+        try:
+            semantic_cache.add(folder, [
+                {
+                    "headline": article["text_column"],
+                    "embedding": headline_embeddings[article["index"]],
+                    "irrelevant": article["relevant"] == "no",
+                    "triggered_by": article.get("triggered_by", ""),
+                }
+                for article in gpt_screened
+                if article["index"] in headline_embeddings
+            ])
+        except Exception as e:
+            logger.warning("Could not update the semantic verdict cache: %s", e)
+
+
+def _sort_articles(articles):
+    """
+    Sorts the processed articles into the rows of the workbook and the entries of the ledger.
+    Articles that hit an error in any stage, or were never screened, go to the error rows with
+    what went wrong, whatever their verdict; they get no ledger entry, so that incremental runs
+    do not skip them.
+
+    Returns:
+        tuple: (relevant_articles, irrelevant_articles, error_articles, ledger_entries)
+    """
+    relevant_articles = []
+    irrelevant_articles = []
+    error_articles = []
+    ledger_entries = []
+
+    for article in articles:
+        title = article["title"]
+        # Articles whose link could not be resolved keep their feed URL
+        url = article.get("url") or article["feed_url"]
+        details = article.get("details")
+        errors = article.get("errors") or ({} if "relevant" in article else {"screen": "not screened"})
+        if errors:
+            logger.warning("Article %s had errors: %s", article["feed_url"], errors)
+            error_articles.append({
+                "id": article["id"],
+                "title": title,
+                "url": url,
+                "relevant": article.get("relevant", ""),
+                "errors": "; ".join(f"{stage}: {error}" for stage, error in errors.items()),
+            })
+            continue
+        if article["relevant"] != "no":
+            if details:
+                # Merge the details into the article dictionary.
+                article_info = {
+                    "id": article["id"],
+                    "title": title,
+                    "url": url,
+                    "full_text": article.get("full_text", ""),
+                    "check_results": article.get("check_results", ""),
+                    **details
+                }
+                relevant_articles.append(article_info)
+            else:
+                article_info = {
+                    "id": article["id"],
+                    "title": title,
+                    "url": url
+                }
+                relevant_articles.append(article_info)
+        else:
+            irrelevant_articles.append({
+                "id": article["id"],
+                "title": title,
+                "url": url
+            })
+            if article.get("resolve_tier") == "deferred":
+                irrelevant_articles[-1]["resolve_tier"] = "deferred"
+        ledger_entries.append({
+            "id": article["id"],
+            "published": article["published"],
+            "bucket": "relevant" if article["relevant"] != "no" else "irrelevant",
+            "stages": {
+                "screen": article["relevant"],
+                "triggered_by": article.get("triggered_by", ""),
+                "resolved_url": url,
+                "resolve_tier": article.get("resolve_tier", ""),
+                "extracted": bool(details),
+            },
+            "article": relevant_articles[-1] if article["relevant"] != "no" else irrelevant_articles[-1],
+        })
+    return relevant_articles, irrelevant_articles, error_articles, ledger_entries
+
+
+def _update_ledger(
+    ledger, folder, ledger_entries, relevant_articles, irrelevant_articles, duplicate_articles, prefiltered_articles,
+    reemit_since=None,
+):
+    """
+    Records the articles of an incremental run in the ledger: ledger_entries of the screened
+    articles plus the duplicate and prefiltered articles. With reemit_since, results of earlier
+    runs since then are appended to the article lists, keeping the workbook as complete as a full
+    run over the same window.
+    """
+    ledger_entries.extend(
+        {
+            "id": article["id"],
+            "published": article["published"],
+            "bucket": "duplicate",
+            "stages": {"screen": "duplicate"},
+            "article": article,
+        }
+        for article in duplicate_articles
+    )
+    ledger_entries.extend(
+        {
+            "id": article["id"],
+            "published": article["published"],
+            "bucket": "prefiltered",
+            "stages": {"screen": "prefiltered", "closest_question": article["closest_question"]},
+            "article": article,
+        }
+        for article in prefiltered_articles
+    )
+    if reemit_since is not None:
+        prior = ledger.prior_results(
+            folder,
+            since=reemit_since,
+            exclude_ids={str(entry["id"]) for entry in ledger_entries},
+        )
+        logger.info("Re-emitting %s results from earlier runs", sum(len(articles) for articles in prior.values()))
+        relevant_articles.extend(prior["relevant"])
+        irrelevant_articles.extend(prior["irrelevant"])
+        duplicate_articles.extend(prior["duplicate"])
+        prefiltered_articles.extend(prior["prefiltered"])
+    ledger.record(folder, ledger_entries)
+
+
+def _process_folder(config, credentials, gpt_analyzer, progress, headlines, shared, write_workbook, metrics):
+    """
+    The body of run_folder, whose arguments it takes; metrics is a RunMetrics that every stage
+    reports to.
+    """
+    if gpt_analyzer is None:
+        gpt_analyzer = default_analyzer()
+    progress = progress or RunProgress()
+    progress.set_phase("Fetching headlines")
+    total_start_time = time.time()
+    get_call_layer().set_max_concurrency(config.max_concurrency)
+    call_stats = get_call_layer().stats()
+    ledger = ProcessedLedger() if config.incremental_run else None
+    if headlines is None:
+        with metrics.timer("fetch"):
+            headlines = fetch_headlines(config, credentials, ledger)
+        if headlines is None:
+            return None
+    progress.set_phase("Preparing screening")
+    openai_client, gpt_model, _ = new_openai_session(credentials.openai_api_key)
+    response_cache, article_cache = get_response_cache(), get_article_cache()
+    metrics.watch_cache("response_cache", response_cache)
+    metrics.watch_cache("article_cache", article_cache)
+    prepare_start_time = time.time()
+    
+    folder = config.folder
+    logger.info("Processing folder %s", folder)
+    if headlines.empty:
+        headlines = pd.DataFrame(columns=["title", "url", "content_html", "date_published", "tags", "id"])
+    if ledger:
+        processed_ids = ledger.processed_ids(folder)
+        headlines = headlines[~headlines["id"].astype(str).isin(processed_ids)].copy()
+        logger.info("Incremental run: %s new articles since the last run", len(headlines))
+    # Convert headlines into a DataFrame with necessary text column
+    headlines["text_column"] = headlines["title"] + " " + headlines.get("summary", "")
+    target_questions, positive_exemplars, tech_list = _folder_questions(folder)
+    duplicate_articles = []
+    screened_headlines = headlines
+    if config.collapse_duplicates:
+        screened_headlines, duplicate_articles = _collapse_duplicates(headlines, config.duplicate_threshold)
+    use_prefilter = config.use_prefilter and positive_exemplars
+    headline_embeddings = {}
+    if (use_prefilter or config.use_semantic_cache) and not screened_headlines.empty:
+        headline_embeddings = _embed_headlines(openai_client, screened_headlines)
+    prefiltered_articles = []
+    if use_prefilter and headline_embeddings:
+        screened_headlines, prefiltered_articles = _prefilter(
+            config, openai_client, screened_headlines, target_questions, positive_exemplars, headline_embeddings
+        )
+    classifier_rejected = {}
+    if config.use_classifier and not screened_headlines.empty:
+        classifier_rejected = _classifier_rejections(folder, screened_headlines, config.classifier_threshold)
+    semantic_cache, semantic_hits = None, {}
+    if config.use_semantic_cache and headline_embeddings:
+        semantic_cache, semantic_hits = _semantic_cache_hits(
+            config,
+            folder,
+            gpt_model,
+            target_questions,
+            headline_embeddings,
+            [index for index in screened_headlines.index if index not in classifier_rejected],
+            metrics,
+        )
+    # Headlines that still need a GPT verdict
+    gpt_headlines = screened_headlines.drop(index=list(classifier_rejected) + list(semantic_hits))
+    metrics.add_seconds("prefilter", time.time() - prepare_start_time)
+    metrics.count("headlines", len(headlines))
+    metrics.count("duplicates", len(duplicate_articles))
+    metrics.count("prefiltered", len(prefiltered_articles))
+    metrics.count("classifier_rejected", len(classifier_rejected))
+    screening_strategy = config.screening_strategy
+    extraction_mode = config.extraction_mode
+    # Batch mode sends all screening requests, then all extraction requests, through the Batch API
+    # and stores the answers in the response cache, where the regular stages find them. Only
+    # requests known in advance can be batched: one screening call per headline and one
+    # extraction call per article.
+    batch_mode = config.batch_mode
+    if batch_mode:
+        screening_strategy, extraction_mode = "One call per headline", "Single call"
+        batch_backend = get_batch_backends()[config.batch_backend](openai_client)
+        batch_options = {
+            "poll_seconds": config.batch_poll_seconds,
+            "timeout_seconds": config.batch_timeout_hours * 60 * 60,
+        }
+
+    with ExitStack() as stack:
+        if shared is None:
+            # Batched answers come from the cache, so they do not count against the per-minute limits
+            rate_limiter = None if batch_mode else RateLimiter(config.requests_per_minute, config.tokens_per_minute)
+            shared = SharedResources(stack.enter_context(ResolverService(config.browser_parallelism)), rate_limiter)
+        article_stages = ArticleStages(
+            config, gpt_analyzer, openai_client, gpt_model, shared, screening_strategy, extraction_mode,
+            target_questions, tech_list, classifier_rejected, semantic_hits,
+        )
+        if batch_mode and target_questions:
+            progress.set_phase("Waiting for the screening batch")
+            with metrics.timer("batch_wait"):
+                _prime_screening_batch(batch_backend, batch_options, gpt_model, target_questions, gpt_headlines)
+        if article_stages.article_screener is None:
+            # Strategies that ask about many headlines per request screen the whole folder up front
+            with metrics.timer("screen"):
+                article_stages.screen_up_front(gpt_headlines)
+
+        pipeline_articles = _pipeline_articles(screened_headlines, config.prefilter_first_question)
+        # Every stage's outcome is checkpointed per article; resuming an interrupted run restores them
+        # instead of running the stages again.
+        checkpoint = RunCheckpoint(folder, resume=config.resume_run, fingerprint=article_stages.settings_fingerprint())
+        stages = article_stages.stages(checkpoint)
+        progress.start(len(pipeline_articles), [stage.name for stage in stages])
+        progress.set_phase("Processing articles")
+        if batch_mode:
+            # Every article's text is needed before the extraction batch can be submitted
+            processed_articles, stage_seconds = run_pipeline(pipeline_articles, stages[:4], on_stage_done=progress.stage_done, abort_on=ABORT_ON)
+            progress.set_phase("Waiting for the extraction batch")
+            with metrics.timer("batch_wait"):
+                _prime_extraction_batch(batch_backend, batch_options, gpt_model, tech_list, processed_articles)
+            progress.set_phase("Processing articles")
+            processed_articles, extraction_seconds = run_pipeline(processed_articles, stages[4:], on_stage_done=progress.stage_done, abort_on=ABORT_ON)
+            stage_seconds.update(extraction_seconds)
+        else:
+            processed_articles, stage_seconds = run_pipeline(pipeline_articles, stages, on_stage_done=progress.stage_done, abort_on=ABORT_ON)
+    logger.info("Time spent per stage (seconds): %s", stage_seconds)
+    for stage_name, seconds in stage_seconds.items():
+        metrics.add_seconds(METRIC_STAGE_NAMES.get(stage_name, stage_name), seconds)
+    metrics.count("pipeline_articles", len(processed_articles))
+    article_stages.log_stats(processed_articles, metrics)
+    _record_verdicts(folder, processed_articles, semantic_cache, headline_embeddings)
+
+    # Process relevant results for output
+    relevant_articles, irrelevant_articles, error_articles, ledger_entries = _sort_articles(processed_articles)
+    if error_articles and len(error_articles) > MAX_ERROR_FRACTION * len(processed_articles):
+        # The checkpoints are kept, so a rerun with resume_run continues where this one stopped
+        raise RunFailedError(
+            f"{len(error_articles)} of {len(processed_articles)} articles of {folder} failed "
+            f"(e.g. {error_articles[0]['errors']}); no workbook was written."
+        )
+    if ledger:
+        _update_ledger(
+            ledger, folder, ledger_entries, relevant_articles, irrelevant_articles, duplicate_articles, prefiltered_articles,
+            # Earlier results keep the workbook as complete as a full run over the past week
+            reemit_since=total_start_time - REEMIT_WINDOW_SECONDS if config.reemit_prior_results else None,
+        )
+
+    logger.info("Total relevant articles: %s", len(relevant_articles))
+    logger.info("Total irrelevant articles: %s", len(irrelevant_articles))
+    logger.info("Articles with errors: %s", len(error_articles))
+    logger.info("GPT response cache: %s", response_cache.stats())
+    logger.info("Article cache: %s", article_cache.stats())
+
+    output_fname, output_location = None, None
+    if write_workbook:
+        # Define output file name and path
+        output_fname = get_output_fname(
+            folder,
+            filetype="xlsx"
+        )
+        logger.info("Saving Excel file to %s", output_fname)
+        progress.set_phase("Writing the workbook")
+
+        # Use the new Excel output function
+        # (it moves articles between lists, so it gets copies and can be called again for the same run)
+        output_location = output_results_excel(
+            list(relevant_articles), list(irrelevant_articles), output_fname, list(duplicate_articles), prefiltered_articles,
+            credentials.onedrive, config.output_dir, metrics=metrics, error_articles=error_articles,
+        )
+    if error_articles:
+        # Resuming the run retries the failed stages of these articles only
+        logger.info("Keeping the checkpoints of %s: %s articles had errors", folder, len(error_articles))
+    else:
+        checkpoint.finish()
+    if ledger and error_articles:
+        logger.warning(
+            "Not advancing the watermark of %s: %s articles had errors and are retried next run", folder, len(error_articles)
+        )
+    elif ledger:
+        ledger.set_watermark(folder, total_start_time)
+    if write_workbook and config.irrelevant_url_mode == "Resolve in background after output":
+        deferred_thread = threading.Thread(
+            target=resolve_deferred_urls,
+            args=(
+                relevant_articles, irrelevant_articles, duplicate_articles, output_fname,
+                ledger, folder, ledger_entries, prefiltered_articles, credentials.onedrive, config.output_dir,
+                error_articles,
+            ),
+            daemon=True,
+        )
+        with _deferred_threads_lock:
+            _deferred_threads.append(deferred_thread)
+        deferred_thread.start()
+
+    logger.info(
+        "Done processing headlines of %s in %.2f minutes: %s relevant articles",
+        folder, (time.time() - total_start_time) / 60, len(relevant_articles),
+    )
+    openai_calls = get_call_layer().stats_since(call_stats)
+    logger.info("OpenAI calls: %s", openai_calls)
+    return {
+        "output_fname": output_fname,
+        "output_location": output_location,
+        "output_locations": [output_location] if output_location else [],
+        "relevant_articles": relevant_articles,
+        "irrelevant_articles": irrelevant_articles,
+        "duplicate_articles": duplicate_articles,
+        "prefiltered_articles": prefiltered_articles,
+        "error_articles": error_articles,
+        "stage_seconds": stage_seconds,
+        "openai_calls": openai_calls,
+    }
+
+
+def group_articles_across_folders(headlines):
+    """
+    Groups the headlines of several folders by article: two headlines are the same article if
+    they have the same Inoreader id or the same link.
+
+    Args:
+        headlines: A dict mapping each folder to its headlines DataFrame.
+
+    Returns:
+        list: For each unique article, the set of folders it appears in.
+    """
+    # ("id", id) and ("url", url) keys of the same article share one set of folders
+    folder_sets = {}
+    for folder, df in headlines.items():
+        if df.empty:
+            continue
+        for article_id, url in zip(df["id"].astype(str), df["url"]):
+            folder_set = folder_sets.get(("id", article_id)) or folder_sets.get(("url", url)) or set()
+            folder_set.add(folder)
+            folder_sets[("id", article_id)] = folder_sets[("url", url)] = folder_set
+    return list({id(folder_set): folder_set for folder_set in folder_sets.values()}.values())
+
+
+def run_folders(folders, config, credentials, gpt_analyzer=None, progress=None, combined_workbook=False):
+    """
+    Processes several folders in one run. The folders' headlines are fetched concurrently, then
+    every folder is screened against its own questions in its own pipeline, all pipelines running
+    at the same time. Articles that appear in several folders (same Inoreader item or same link)
+    are resolved and downloaded once, and all pipelines share one browser pool and one OpenAI rate
+    limiter.
+
+    Args:
+        folders: The folder names.
+        config: A RunConfig with the settings of the run; its folder is ignored.
+        combined_workbook: If True, one workbook with a "folder" column is written instead of one per folder.
+
+    Returns:
+        dict: The run_folder result of each folder ("folder_results"), where the workbooks were
+        written ("output_locations"), the articles of every folder tagged with their "folder", and
+        the seconds spent per stage summed over folders, and the OpenAI calls of the whole run;
+        None if no folder could be read. One run report covers every folder ("metrics"); it is
+        written next to the combined workbook, or in the LeadIT-Combined folder
+        ("report_location").
+
+    Raises:
+        RunFailedError: If the run of any folder failed; the other folders' own workbooks are
+            still written, the combined workbook is not.
+    """
+    metrics = RunMetrics()
+    with _cache_settings(config), get_call_layer().observe(metrics.record_call):
+        result = _process_folders(folders, config, credentials, gpt_analyzer, progress, combined_workbook, metrics)
+        if result is None:
+            return None
+        result["metrics"] = metrics.report(
+            folders=list(result["folder_results"]),
+            relevant=len(result["relevant_articles"]),
+            openai_calls=result["openai_calls"],
+            reused_across_folders=result["reused_across_folders"],
+        )
+    result["report_location"] = None
+    try:
+        result["report_location"] = output_run_report(
+            result["metrics"],
+            result["output_fname"] or get_output_fname(COMBINED_FOLDER_NAME, filetype="xlsx"),
+            credentials.onedrive,
+            config.output_dir,
+        )
+    except Exception as e:
+        logger.warning("Could not write the run report: %s", e)
+    return result
+
+
+def _process_folders(folders, config, credentials, gpt_analyzer, progress, combined_workbook, metrics):
+    """
+    The body of run_folders, whose arguments it takes; metrics is the RunMetrics every folder reports to.
+    """
+    progress = progress or RunProgress()
+    progress.set_phase("Fetching headlines")
+    # The folders run concurrently, so their own openai_calls overlap; count the run as a whole
+    get_call_layer().set_max_concurrency(config.max_concurrency)
+    call_stats = get_call_layer().stats()
+    configs = {folder: replace(config, folder=folder) for folder in folders}
+    with metrics.timer("fetch"), ThreadPoolExecutor(max_workers=len(folders)) as executor:
+        fetched = executor.map(
+            lambda folder: fetch_headlines(
+                configs[folder], credentials, ProcessedLedger() if config.incremental_run else None
+            ),
+            folders,
+        )
+        headlines = {folder: df for folder, df in zip(folders, fetched) if df is not None}
+    if not headlines:
+        return None
+
+    unique_articles = group_articles_across_folders(headlines)
+    logger.info(
+        "%s unique articles across %s folders, %s of them in more than one folder",
+        len(unique_articles), len(headlines), sum(1 for folder_set in unique_articles if len(folder_set) > 1),
+    )
+
+    folder_results = {}
+    with ResolverService(config.browser_parallelism) as resolver:
+        shared = SharedResources(
+            resolver, None if config.batch_mode else RateLimiter(config.requests_per_minute, config.tokens_per_minute)
+        )
+        with ThreadPoolExecutor(max_workers=len(headlines)) as executor:
+            futures = {
+                folder: executor.submit(
+                    run_folder, configs[folder], credentials, gpt_analyzer, progress, df, shared, not combined_workbook, metrics
+                )
+                for folder, df in headlines.items()
+            }
+            failed_folders = {}
+            for folder, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.exception("Run of %s failed", folder)
+                    failed_folders[folder] = str(e)
+                    result = None
+                if result:
+                    folder_results[folder] = result
+    logger.info(
+        "Reused %s link resolutions and %s downloads across folders", shared.reused["resolve"], shared.reused["fetch"]
+    )
+    if failed_folders:
+        raise RunFailedError(
+            "; ".join(f"Run of {folder} failed: {error}" for folder, error in failed_folders.items())
+            + (f". Workbooks were written for {', '.join(folder_results)}." if folder_results and not combined_workbook else "")
+        )
+    if not folder_results:
+        return None
+
+    articles = {
+        key: [{**article, "folder": folder} for folder, result in folder_results.items() for article in result[key]]
+        for key in ARTICLE_LISTS
+    }
+    stage_seconds = {}
+    for result in folder_results.values():
+        for stage_name, seconds in result["stage_seconds"].items():
+            stage_seconds[stage_name] = stage_seconds.get(stage_name, 0.0) + seconds
+    output_locations = [result["output_location"] for result in folder_results.values() if result["output_location"]]
+    output_fname = None
+    if combined_workbook:
+        progress.set_phase("Writing the workbook")
+        output_fname = get_output_fname(COMBINED_FOLDER_NAME, filetype="xlsx")
+        logger.info("Saving combined Excel file to %s", output_fname)
+        output_location = output_results_excel(
+            list(articles["relevant_articles"]), list(articles["irrelevant_articles"]), output_fname,
+            list(articles["duplicate_articles"]), articles["prefiltered_articles"],
+            credentials.onedrive, config.output_dir, folder_column=True, metrics=metrics,
+            error_articles=articles["error_articles"],
+        )
+        if output_location:
+            output_locations.append(output_location)
+    return {
+        "folder_results": folder_results,
+        "output_fname": output_fname,
+        "output_locations": output_locations,
+        **articles,
+        "stage_seconds": stage_seconds,
+        "openai_calls": get_call_layer().stats_since(call_stats),
+        "reused_across_folders": dict(shared.reused),
+    }
@@ -0,0 +1,84 @@
+"""
+This module tracks how far a run of the pipeline has got, so that a client (e.g. the Streamlit
+app polling a background job) can show it while the run is in progress.
+
+Classes:
+- RunProgress: Thread-safe phase and per-stage article counts of one run, with an ETA.
+"""
+
+import threading
+import time
+
+
+class RunProgress:
+    """
+    The current phase of a run (e.g. "Fetching headlines") and how many articles each pipeline
+    stage is done with. Stage counts are updated from the pipeline's worker threads through
+    stage_done, which can be passed to utils.pipeline.run_pipeline as on_stage_done.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = "Queued"
+        self.total = None
+        self.stage_names = []
+        self.stage_counts = {}
+        self.pipeline_started_at = None
+
+    def set_phase(self, phase):
+        with self.lock:
+            self.phase = phase
+
+    def start(self, total, stage_names):
+        """
+        Starts counting, for total articles going through the stages named stage_names. The
+        pipelines of several folders of one run each add their articles to the total.
+        """
+        with self.lock:
+            self.total = (self.total or 0) + total
+            self.stage_names = list(stage_names)
+            if self.pipeline_started_at is None:
+                self.pipeline_started_at = time.time()
+
+    def stage_done(self, stage_name, item=None):
+        with self.lock:
+            self.stage_counts[stage_name] = self.stage_counts.get(stage_name, 0) + 1
+
+    def fraction_done(self):
+        """
+        Returns the share of (article, stage) steps done so far, between 0 and 1.
+        """
+        with self.lock:
+            if not self.total or not self.stage_names:
+                return 0.0
+            done = sum(min(self.stage_counts.get(stage_name, 0), self.total) for stage_name in self.stage_names)
+            return done / (self.total * len(self.stage_names))
+
+    def eta_seconds(self):
+        """
+        Returns the estimated seconds until every article is through every stage, extrapolated
+        from the pace of the pipeline so far, or None before the first step is done.
+        """
+        fraction = self.fraction_done()
+        if not fraction or self.pipeline_started_at is None:
+            return None
+        elapsed = time.time() - self.pipeline_started_at
+        return elapsed * (1 - fraction) / fraction
+
+    def snapshot(self):
+        """
+        Returns the phase, the number of articles and the articles screened, resolved, fetched
+        and extracted so far, the fraction done and the ETA in seconds, as a dict.
+        """
+        fraction, eta = self.fraction_done(), self.eta_seconds()
+        with self.lock:
+            return {
+                "phase": self.phase,
+                "total": self.total,
+                "screened": self.stage_counts.get("screen", 0),
+                "resolved": self.stage_counts.get("resolve", 0),
+                "fetched": self.stage_counts.get("fetch", 0),
+                "extracted": self.stage_counts.get("extract", 0),
+                "fraction_done": fraction,
+                "eta_seconds": eta,
+            }
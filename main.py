@@ -11,6 +11,7 @@ Modules:
 - read_pdf: Extracts text chunks from PDF documents.
 - relevant_excerpts: Generates embeddings and finds relevant text excerpts for each variable.
 - results: Formats and outputs the results.
+- leadit: Runs the headline pipeline; this script is its Streamlit client.
 
 Functions:
 - get_resource_path: Returns the resource path for a given relative path.
@@ -18,7 +19,10 @@ Functions:
 - print_milestone: Prints a milestone with the elapsed time and additional information.
 - fetch_gist_content: Fetches the content of a gist from GitHub.
 - log: Logs new content to a GitHub gist.
-- main: Main function to process PDFs and generate an output document.
+- build_run_config: Builds the configuration of a run from the Streamlit session state.
+- build_run: Builds the configuration and credentials of a run.
+- main: Runs the pipeline for the folder selected in the app.
+- submit_run: Queues the run as a background job.
 
 Usage:
 Run "python -m streamlit run .\main.py" to start the Streamlit application.
@@ -29,32 +33,27 @@ from interface import (
     display_output,
     get_user_inputs,
     load_header,
-    display_onedrive_login
+    display_onedrive_login,
+    display_job_progress,
     # display_onedrive_auth
 )
 from tabs.about import about_tab
 from tabs.faq import faq_tab
-from services.query_gpt import new_openai_session, query_gpt_for_relevance, query_gpt_for_relevance_iterative, query_gpt_for_project_details
-from site_text.questions import STEEL_NO, IRON_NO, STEEL_IRON_TECH, CEMENT_NO, CEMENT_TECH
-from utils.read_json import parse_json_feed
-from services.inoreader import build_df_for_folder, fetch_full_article_text
-from utils.relevant_excerpts import (
-    find_top_relevant_texts
-)
-from services.onedrive import upload_file_to_onedrive
-from utils.results import get_output_fname, output_results_excel  
-from services.inoreader import resolve_with_playwright
+from services.query_gpt import new_openai_session, query_gpt_for_relevance
+from utils.relevant_excerpts import find_top_relevant_texts
+from leadit import Credentials, RunConfig, read_onedrive_credentials, run_folder
+from leadit.jobs import get_job_runner
+from utils.cache import get_cache_path
 from tempfile import TemporaryDirectory
-import json
 import os
 import requests
 import streamlit as st
 import time
-import traceback
 import secrets
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+
 def get_resource_path(relative_path):
     """
     Returns the resource path for a given relative path.
@@ -160,6 +159,31 @@ def fetch_gist_content(gist_url, headers, log_fname):
         print("Failed to fetch gist content.")
         return None
 
+def build_run_config(gpt_analyzer):
+    """
+    Builds the configuration of a run from the folder and advanced settings in the session state.
+    """
+    json_feed = get_resource_path(gpt_analyzer.json[0]) if st.session_state["active_tab"] == "JSON File" else None
+    return RunConfig.from_mapping(st.session_state["target_folder"], st.session_state, json_feed=json_feed)
+
+
+def build_run(gpt_analyzer, openai_apikey):
+    """
+    Builds the configuration and credentials of a run from the session state and secrets.
+    The workbook is always also written locally, so that the app can offer it for download.
+    """
+    credentials = Credentials(
+        openai_api_key=openai_apikey,
+        inoreader_access_token=st.session_state.get("access_token"),
+        onedrive=read_onedrive_credentials(st.secrets),
+    )
+    if credentials.onedrive is None:
+        logger.warning("OneDrive secrets are missing, the workbook is only written locally")
+    config = build_run_config(gpt_analyzer)
+    config.output_dir = config.output_dir or get_cache_path("results")
+    return config, credentials
+
+
 def main(gpt_analyzer, openai_apikey):
     """
     Main function to process headlines and generate an output document.
@@ -171,107 +195,30 @@ def main(gpt_analyzer, openai_apikey):
     Returns:
         The total number of articles processed.
     """
+    config, credentials = build_run(gpt_analyzer, openai_apikey)
+    result = run_folder(config, credentials, gpt_analyzer)
+    return len(result["relevant_articles"]) if result else 0
 
-    total_start_time = time.time()
-    if st.session_state["active_tab"] == "JSON File":
-        json_path = get_resource_path(gpt_analyzer.json[0])
-        try:
-            headlines = parse_json_feed(json_path)
-            print(f"Parsed {len(headlines)} headlines from JSON.")
-        except Exception as e:
-            print(f"Failed to parse JSON: {e}")
-            return 0
-    else:
-        try:
-            headlines = build_df_for_folder(st.session_state["target_folder"])
-            json_path = "Inoreader"
-            print(headlines)
-            print(f"Parsed {len(headlines)} headlines from JSON.")
-        except Exception as e:
-            print(f"Failed to parse JSON: {e}")
-            return 0
-    openai_client, gpt_model, _ = new_openai_session(openai_apikey)
-    
-    # Convert headlines into a DataFrame with necessary text column
-    headlines["text_column"] = headlines["title"] + " " + headlines.get("summary", "")
-    folder = st.session_state["target_folder"]
-    print("Folder", folder)
-    if folder == "LeadIT-Steel":
-        target_questions = STEEL_NO
-    elif folder == "LeadIT-Iron":
-        target_questions = IRON_NO
-    elif folder == "LeadIT-Cement":
-        target_questions = CEMENT_NO
-    else:
-        target_questions = []  # or some default
-    # Assuming your DataFrame of articles is in `headlines` and you have run_on_full_text defined
-    relevance_df = query_gpt_for_relevance_iterative(
+
+def submit_run(gpt_analyzer, openai_apikey):
+    """
+    Queues the run as a background job and remembers its id in the session and the URL, so that
+    the app finds the job again after a rerun or a page refresh.
+
+    Returns:
+        The id of the job.
+    """
+    config, credentials = build_run(gpt_analyzer, openai_apikey)
+    job_id = get_job_runner().submit(
+        config,
+        credentials,
         gpt_analyzer,
-        headlines,
-        target_questions,
-        run_on_full_text=True,  # or False, as applicable
-        gpt_client=openai_client,
-        gpt_model=gpt_model
+        folders=st.session_state.get("target_folders"),
+        combined_workbook=st.session_state.get("combined_workbook", False),
     )
-    # Process relevant results for output
-    # After obtaining relevance_df from query_gpt_for_relevance_iterative:
-    relevant_articles = []
-    irrelevant_articles = []
-
-    for _, row in relevance_df.iterrows():
-        article_index = row["index"]
-        article_row = headlines.loc[article_index]
-        article_row["title"] = article_row["title"].split(" - ")[0].strip()
-        title = article_row["title"] 
-        article_row["url"] = resolve_with_playwright(article_row["url"])
-        url = article_row["url"]
-        if row["relevant"] != "no":
-            # Fetch full article text (or use text from the article if already available)
-            full_text = fetch_full_article_text(article_row)
-            if st.session_state["target_folder"] == "LeadIT-Cement":
-            # Extract project details from the article text using the new GPT function.
-                details = query_gpt_for_project_details(openai_client, gpt_model, full_text, CEMENT_TECH)
-            else:
-                details = query_gpt_for_project_details(openai_client, gpt_model, full_text, STEEL_IRON_TECH)  
-            print("done w/ details")
-            if details:
-                # Merge the details into the article dictionary.
-                article_info = {
-                    "title": title,
-                    "url": url,
-                    "full_text": full_text,
-                    **details
-                }
-                relevant_articles.append(article_info)
-            else:
-                article_info = {
-                    "title": title,
-                    "url": url
-                }
-                relevant_articles.append(article_info)
-        else:
-            irrelevant_articles.append({
-                "title": title,
-                "url": url
-            })
-
-    logger.info("Total relevant articles: %s", len(relevant_articles))
-    logger.info("Total irrelevant articles: %s", len(irrelevant_articles))
-
-    # Define output file name and path
-    folder = st.session_state["target_folder"]
-    output_fname = get_output_fname(
-        folder,
-        filetype="xlsx"
-    )
-    logger.info("Saving Excel file to %s", output_fname)
-
-    # Use the new Excel output function
-    output_results_excel(relevant_articles, irrelevant_articles, output_fname)
-    
-    # Create a container for output messages.
-    print_milestone("Done processing headlines", total_start_time, {"Number of articles": len(relevant_articles)})
-    return len(relevant_articles)
+    st.session_state["job_id"] = job_id
+    st.query_params["job"] = job_id
+    return job_id
 
 
 
@@ -298,25 +245,26 @@ if __name__ == "__main__":
 
                 if st.button("Run", disabled=st.session_state.get("run_disabled", False)):
                     gpt_analyzer = get_user_inputs()
-                    with st.spinner("Generating output document..."):
-                        try:
-                            apikey_id = st.session_state.get("apikey_id", "openai_apikey")
-                            openai_apikey = st.secrets[apikey_id]
-                            num_pages = main(gpt_analyzer, openai_apikey)
-                        except Exception as e:
-                            logger.exception("Error generating document")
-                            st.error(f"Could not generate document: {e}")
-                        else:
-                            st.success("Document generated!")
-
-                            zip_path = st.session_state.get("temp_zip_path")
-                            if zip_path and os.path.isfile(zip_path):
-                                try:
-                                    os.unlink(zip_path)
-                                except OSError:
-                                    logger.warning(
-                                        "Failed to delete temp zip: %s", zip_path, exc_info=True
-                                    )
+                    try:
+                        apikey_id = st.session_state.get("apikey_id", "openai_apikey")
+                        openai_apikey = st.secrets[apikey_id]
+                        submit_run(gpt_analyzer, openai_apikey)
+                    except Exception as e:
+                        logger.exception("Error submitting the run")
+                        st.error(f"Could not start the run: {e}")
+                    else:
+                        zip_path = st.session_state.get("temp_zip_path")
+                        if zip_path and os.path.isfile(zip_path):
+                            try:
+                                os.unlink(zip_path)
+                            except OSError:
+                                logger.warning(
+                                    "Failed to delete temp zip: %s", zip_path, exc_info=True
+                                )
+
+                job_id = st.session_state.get("job_id") or st.query_params.get("job")
+                if job_id:
+                    display_job_progress(get_job_runner(), job_id)
 
             with tab2:
                 about_tab()
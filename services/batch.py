@@ -0,0 +1,249 @@
+"""
+This module sends chat completion requests through the OpenAI Batch API, which costs half as much
+as the regular API and is not subject to per-minute rate limits, at the price of results arriving
+within hours instead of seconds.
+
+Requests are written to JSONL files in the Batch API format, submitted, polled until done, and
+their results are mapped back by custom_id into the GPT response cache. The regular code path
+(e.g. main.main) then finds every answer in the cache and produces its usual output.
+
+Classes:
+- OpenAIBatchBackend: Submits batches to the OpenAI Batch API.
+- LocalBatchBackend: File-based stand-in for the Batch API, for testing the flow offline.
+
+Functions:
+- build_batch_request: Builds one line of a batch input file.
+- write_batch_file: Writes batch requests to a JSONL file.
+- parse_batch_output: Maps the lines of a batch output file to response contents by custom_id.
+- run_batch: Submits requests, waits for the batches to complete and returns their results.
+- prime_response_cache: Runs the uncached requests as a batch and stores the results in the response cache.
+- get_batch_backends: Returns the available batch backends by name.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from services.openai_calls import call_label, get_call_layer
+from services.query_gpt import get_completion_cache_key, get_response_cache
+from utils.cache import get_cache_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Limit of the Batch API per input file; larger runs are split into several batches
+MAX_BATCH_REQUESTS = 50000
+FAILED_STATUSES = {"failed", "expired", "cancelled", "cancelling"}
+
+
+def build_batch_request(custom_id, gpt_model, msgs, response_format=None):
+    """
+    Builds one request of a batch input file, with the same parameters as create_chat_completion.
+    """
+    body = {"model": gpt_model, "temperature": 0, "messages": msgs}
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_batch_file(requests, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+def parse_batch_output(lines):
+    """
+    Returns a dictionary mapping the custom_id of each line of a batch output file to the content
+    of its first choice, or None if the request failed.
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        content = None
+        if response.get("status_code") == 200:
+            choices = response.get("body", {}).get("choices") or [{}]
+            content = choices[0].get("message", {}).get("content")
+        else:
+            logger.warning("Batch request %s failed: %s", entry.get("custom_id"), entry.get("error") or response)
+        results[entry["custom_id"]] = content
+    return results
+
+
+class OpenAIBatchBackend:
+    """
+    Submits batch input files to the OpenAI Batch API.
+    """
+
+    def __init__(self, gpt_client):
+        self.gpt_client = gpt_client
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.gpt_client.files.create(file=f, purpose="batch")
+        batch = self.gpt_client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        return self.gpt_client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.gpt_client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if file_id:
+                results.update(parse_batch_output(self.gpt_client.files.content(file_id).text.splitlines()))
+        return results
+
+
+class LocalBatchBackend:
+    """
+    Stand-in for the Batch API that works on files in a local directory.
+
+    Submitting copies the input file to <directory>/<batch_id>/input.jsonl. The batch is complete
+    once <directory>/<batch_id>/output.jsonl exists, in the format of Batch API output files.
+    With a gpt_client, the first poll answers every request with it (one regular call per request).
+    Without one, the output file must be written by someone else, e.g. a test.
+    """
+
+    def __init__(self, directory, gpt_client=None):
+        self.directory = directory
+        self.gpt_client = gpt_client
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id, fname):
+        return os.path.join(self.directory, batch_id, fname)
+
+    def submit(self, path):
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        shutil.copyfile(path, self._path(batch_id, "input.jsonl"))
+        return batch_id
+
+    def poll(self, batch_id):
+        if not os.path.exists(self._path(batch_id, "output.jsonl")):
+            if self.gpt_client is None:
+                return "in_progress"
+            self.process(batch_id)
+        return "completed"
+
+    def process(self, batch_id):
+        """
+        Answers every request of the batch with gpt_client and writes the output file.
+        """
+        output_lines = []
+        with open(self._path(batch_id, "input.jsonl"), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        for request_num, request in enumerate(requests):
+            entry = {"id": f"batch_req_{request_num}", "custom_id": request["custom_id"], "response": None, "error": None}
+            try:
+                with call_label(f"batch: {request['custom_id'].split('-')[0]}"):
+                    response = get_call_layer().call(
+                        self.gpt_client.chat.completions.with_raw_response.create, **request["body"]
+                    )
+                body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": response.choices[0].message.content}}]}
+                entry["response"] = {"status_code": 200, "request_id": f"local_{request_num}", "body": body}
+            except Exception as e:
+                entry["error"] = {"code": "local_error", "message": str(e)}
+            output_lines.append(json.dumps(entry, ensure_ascii=False))
+        # Written in one go so that a concurrent poll never sees a partial file
+        tmp_path = self._path(batch_id, "output.jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(output_lines) + "\n")
+        os.replace(tmp_path, self._path(batch_id, "output.jsonl"))
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, "output.jsonl"), encoding="utf-8") as f:
+            return parse_batch_output(f.readlines())
+
+
+def run_batch(backend, requests, poll_seconds=60, timeout_seconds=24 * 60 * 60):
+    """
+    Submits requests in batches of at most MAX_BATCH_REQUESTS and waits for all of them to complete.
+
+    Returns:
+        dict: Maps each custom_id to the content of its response, or None if the request failed.
+
+    Raises:
+        RuntimeError: If a batch fails, expires or is cancelled.
+        TimeoutError: If the batches do not complete within timeout_seconds.
+    """
+    batch_dir = get_cache_path("batches")
+    os.makedirs(batch_dir, exist_ok=True)
+    batch_ids = []
+    for start in range(0, len(requests), MAX_BATCH_REQUESTS):
+        path = os.path.join(batch_dir, f"requests_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{start}.jsonl")
+        write_batch_file(requests[start:start + MAX_BATCH_REQUESTS], path)
+        batch_ids.append(backend.submit(path))
+        logger.info("Submitted batch %s with %s requests", batch_ids[-1], len(requests[start:start + MAX_BATCH_REQUESTS]))
+
+    deadline = time.time() + timeout_seconds
+    results = {}
+    pending = list(batch_ids)
+    while pending:
+        for batch_id in list(pending):
+            status = backend.poll(batch_id)
+            if status == "completed":
+                results.update(backend.results(batch_id))
+                pending.remove(batch_id)
+            elif status in FAILED_STATUSES:
+                raise RuntimeError(f"Batch {batch_id} ended with status {status}")
+        if pending:
+            if time.time() > deadline:
+                raise TimeoutError(f"Batches {pending} did not complete within {timeout_seconds} seconds")
+            logger.info("Waiting for %s batches", len(pending))
+            time.sleep(poll_seconds)
+    return results
+
+
+def prime_response_cache(backend, entries, poll_seconds=60, timeout_seconds=24 * 60 * 60):
+    """
+    Runs the requests that are not in the response cache yet as batches, and stores their results
+    under the keys create_chat_completion looks up.
+
+    Args:
+        entries: A list of (custom_id, gpt_model, msgs, response_format) tuples.
+
+    Returns:
+        tuple: (submitted, failed) numbers of requests.
+    """
+    cache = get_response_cache()
+    keys, requests, seen = {}, [], set()
+    for custom_id, gpt_model, msgs, response_format in entries:
+        key = get_completion_cache_key(gpt_model, msgs, response_format)
+        if key in seen or cache.contains(key):
+            continue
+        seen.add(key)
+        keys[custom_id] = key
+        requests.append(build_batch_request(custom_id, gpt_model, msgs, response_format))
+    if not requests:
+        return 0, 0
+    results = run_batch(backend, requests, poll_seconds, timeout_seconds)
+    failed = 0
+    for custom_id, key in keys.items():
+        content = results.get(custom_id)
+        if content is None:
+            failed += 1
+        else:
+            cache.set(key, content)
+    logger.info("Batch answered %s of %s requests", len(requests) - failed, len(requests))
+    return len(requests), failed
+
+
+def get_batch_backends():
+    """
+    Returns a dictionary mapping batch backend names to functions that create the backend from an OpenAI client.
+    """
+    return {
+        "OpenAI Batch API": OpenAIBatchBackend,
+        "Local stand-in": lambda gpt_client: LocalBatchBackend(get_cache_path("local_batches"), gpt_client),
+    }
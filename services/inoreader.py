@@ -1,28 +1,95 @@
-import streamlit as st
 import requests
 import time
 import urllib.parse
 from utils.read_json import parse_inoreader_feed
+from utils.cache import SQLiteCache, hash_key
 from newspaper import Article
 import re
 import urllib.parse
 from playwright.async_api import async_playwright
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from requests.adapters import HTTPAdapter
 import logging
 import asyncio
 import os
 import subprocess
+import threading
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fetch_inoreader_articles(folder_name):
+# Hosts that redirect with JavaScript or show a consent page; links that end up there need a browser
+JS_INTERSTITIAL_HOSTS = {
+    "news.google.com",
+    "consent.google.com",
+    "consent.yahoo.com",
+    "guce.yahoo.com",
+    "www.msn.com",
+}
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+}
+# Meta refresh and canonical tags are in the <head>, so only the start of the page is read
+HTTP_MAX_BYTES = 128 * 1024
+META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+LINK_TAG_RE = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+ATTRIBUTE_RE = re.compile(r"""([a-zA-Z-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+
+# Cached article text is reused as is for a day, then revalidated with ETag/Last-Modified
+ARTICLE_TEXT_TTL_SECONDS = 24 * 60 * 60
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_article_cache = None
+_article_cache_lock = threading.Lock()
+
+
+def get_article_cache():
+    """
+    Returns the persistent cache of resolved URLs and article text, keyed by source URL.
+    Set `.enabled = False` on it to bypass the cache for a run.
+    """
+    global _article_cache
+    with _article_cache_lock:
+        if _article_cache is None:
+            _article_cache = SQLiteCache("articles.sqlite", max_entries=100000, max_mb=1000, max_age_days=60)
+        return _article_cache
+
+
+def get_resolution_cache_key(url):
+    # Version 2: earlier resolutions may hold about:blank or the previous article of a reused browser page
+    return hash_key({"resolve": url, "version": 2})
+
+
+def get_cached_resolution(url):
+    entry = get_article_cache().get(get_resolution_cache_key(url))
+    return entry["final_url"] if entry and is_resolved_url(entry["final_url"]) else None
+
+
+def cache_resolution(url, final_url, tier):
+    """
+    Caches the resolution of url, unless final_url is not a usable result (see is_resolved_url);
+    failed resolutions are retried by the next run.
     """
-    Fetch all articles from a given folder (label) that were published in the past week.
+    if not is_resolved_url(final_url):
+        logger.info("Not caching the %s resolution of %s: %s", tier, url, final_url)
+        return
+    get_article_cache().set(
+        get_resolution_cache_key(url),
+        {"final_url": final_url, "tier": tier, "resolved_at": time.time()},
+    )
+
+def fetch_inoreader_articles(folder_name, access_token, since=None):
+    """
+    Fetch all articles from a given folder (label) that were published in the past week,
+    or since the given Unix timestamp (e.g. the watermark of the last incremental run).
     This function uses pagination (via the continuation token) and query parameters:
       - n: max number of items per request (100)
       - r: order ("o" for oldest first so that we can use the ot parameter)
       - ot: start time (Unix timestamp) from which to return items
+    access_token is the OAuth access token of the Inoreader account.
     """
-    access_token = st.session_state["access_token"]
     if not access_token:
         return []
 
@@ -30,6 +97,7 @@ def fetch_inoreader_articles(folder_name):
     
     # Compute the Unix timestamp for one week ago.
     one_week_ago = int(time.time()) - 7 * 24 * 60 * 60
+    start_time = int(since) if since else one_week_ago
     
     articles = []
     n = 100
@@ -46,7 +114,7 @@ def fetch_inoreader_articles(folder_name):
         params = {
             "n": n,
             "r": "o",
-            "ot": one_week_ago,
+            "ot": start_time,
             "output": "json"  # explicitly request JSON, though this endpoint returns JSON by default.
         }
         if continuation:
@@ -70,8 +138,8 @@ def fetch_inoreader_articles(folder_name):
 
 
 
-def build_df_for_folder(folder_name):
-    response = fetch_inoreader_articles(folder_name)
+def build_df_for_folder(folder_name, access_token, since=None):
+    response = fetch_inoreader_articles(folder_name, access_token, since)
     df = parse_inoreader_feed(response)
     return(df)
 
@@ -91,6 +159,47 @@ async def ensure_playwright_browsers():
             logger.error("Error installing browsers via playwright install: %s", e)
             raise
 
+async def block_resource(route, request):
+    # Images, stylesheets and fonts are not needed to follow redirects
+    if request.resource_type in ["image", "stylesheet", "font"]:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def is_resolved_url(final_url, previous_url=None):
+    """
+    Returns True if final_url is a usable result of resolving a link: an http(s) URL (not
+    about:blank or a chrome-error:// page) other than previous_url, the page the browser was on
+    before navigating.
+    """
+    if not final_url or final_url == previous_url:
+        return False
+    return urllib.parse.urlparse(final_url).scheme in ("http", "https")
+
+
+async def navigate(page, url):
+    """
+    Navigates page to url and returns the URL the page ends up on, or None if the navigation
+    failed. Pages are reused across URLs, so the page is reset to about:blank first; a page that
+    errors or never leaves about:blank must not report the previous article's URL.
+    """
+    try:
+        if page.url != "about:blank":
+            await page.goto("about:blank")
+        logger.info("Navigating to URL: %s", url)
+        await page.goto(url, wait_until="networkidle", timeout=15000)
+        await page.wait_for_timeout(1000)
+        logger.info("Navigation complete. Current page URL: %s", page.url)
+    except Exception as e:
+        logger.error("Error during page.goto for %s: %s", url, e)
+        return None
+    if not is_resolved_url(page.url, "about:blank"):
+        logger.error("Navigation to %s ended on %s", url, page.url)
+        return None
+    return page.url
+
+
 async def resolve_with_playwright_async(url):
     logger.info("Starting resolve_with_playwright_async for URL: %s", url)
     # Ensure the required browsers are installed before launching.
@@ -101,22 +210,8 @@ async def resolve_with_playwright_async(url):
         browser = await p.chromium.launch(headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"])
         logger.info("Creating page")
         page = await browser.new_page()
-
-        async def block_resource(route, request):
-            if request.resource_type in ["image", "stylesheet", "font"]:
-                await route.abort()
-            else:
-                await route.continue_()
         await page.route("**/*", block_resource)
-
-        try:
-            logger.info("Navigating to URL: %s", url)
-            await page.goto(url, wait_until="networkidle", timeout=15000)
-            await page.wait_for_timeout(1000)
-            logger.info("Navigation complete. Current page URL: %s", page.url)
-        except Exception as e:
-            logger.error("Error during page.goto: %s", e)
-        final_url = page.url
+        final_url = await navigate(page, url)
         await browser.close()
         return final_url
 
@@ -124,16 +219,332 @@ def resolve_with_playwright(url):
     """
     Synchronously run the async resolve_with_playwright_async function.
     Uses WindowsProactorEventLoopPolicy on Windows if needed.
+    URLs resolved by earlier runs are answered from the article cache.
     """
+    cached_url = get_cached_resolution(url)
+    if cached_url:
+        return cached_url
     try:
         if os.name == 'nt':
             asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
         result = asyncio.run(resolve_with_playwright_async(url))
+        if not is_resolved_url(result):
+            return None
+        cache_resolution(url, result, "playwright")
         return result
     except Exception as e:
         logger.error("Error running async Playwright: %s", e)
         return None
 
+
+class PlaywrightResolver:
+    """
+    Resolves URLs with one long-lived Chromium instance and a pool of reusable pages,
+    each in its own browser context, so that the browser start-up cost is paid once per run
+    instead of once per URL.
+
+    Usage:
+        async with PlaywrightResolver(parallelism=4) as resolver:
+            final_url = await resolver.resolve(url)
+    """
+
+    def __init__(self, parallelism=4):
+        self.parallelism = max(1, parallelism)
+        self.playwright = None
+        self.browser = None
+        self.pages = None
+
+    async def __aenter__(self):
+        await ensure_playwright_browsers()
+        self.playwright = await async_playwright().start()
+        logger.info("Creating browser with %s pages", self.parallelism)
+        self.browser = await self.playwright.chromium.launch(
+            headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"]
+        )
+        self.pages = asyncio.Queue()
+        for _ in range(self.parallelism):
+            await self.pages.put(await self._new_page())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+
+    async def _new_page(self):
+        context = await self.browser.new_context()
+        page = await context.new_page()
+        await page.route("**/*", block_resource)
+        return page
+
+    async def resolve(self, url):
+        """
+        Resolves url on the next free page. Returns None if the page could not be used.
+        """
+        page = await self.pages.get()
+        try:
+            return await navigate(page, url)
+        except Exception as e:
+            logger.error("Error resolving %s: %s", url, e)
+            return None
+        finally:
+            if page.is_closed():
+                # Replace pages that crashed so the pool keeps its size
+                try:
+                    await page.context.close()
+                    page = await self._new_page()
+                except Exception as e:
+                    logger.error("Could not replace a closed page: %s", e)
+            await self.pages.put(page)
+
+    async def resolve_many(self, urls):
+        """
+        Resolves every distinct URL in urls concurrently, up to the pool size at a time.
+
+        Returns:
+            dict: Maps each URL to its resolved URL (None if it could not be resolved).
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        resolved = await asyncio.gather(*(self.resolve(url) for url in unique_urls))
+        return dict(zip(unique_urls, resolved))
+
+
+async def resolve_many_async(urls, parallelism=4):
+    async with PlaywrightResolver(parallelism) as resolver:
+        return await resolver.resolve_many(urls)
+
+
+def resolve_many(urls, parallelism=4):
+    """
+    Resolves a list of URLs with a single browser, parallelism pages at a time.
+    Intended to be called once per run rather than once per article.
+
+    Returns:
+        dict: Maps each URL to its resolved URL (None if it could not be resolved).
+    """
+    urls = [url for url in urls if url]
+    if not urls:
+        return {}
+    try:
+        if os.name == 'nt':
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        return asyncio.run(resolve_many_async(urls, parallelism))
+    except Exception as e:
+        logger.error("Error running async Playwright: %s", e)
+        return {url: None for url in urls}
+
+def get_http_session():
+    """
+    Returns a requests session with a connection pool shared by all resolver threads.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+            _http_session.headers.update(HTTP_HEADERS)
+        return _http_session
+
+
+def parse_tag_attributes(tag):
+    return {
+        name.lower(): next(value for value in values if value is not None)
+        for name, *values in ATTRIBUTE_RE.findall(tag)
+    }
+
+
+def find_html_redirect(html, base_url):
+    """
+    Looks for a meta refresh target, then a canonical link, in the HTML of a page.
+
+    Returns:
+        tuple: (kind, url) where kind is "refresh" or "canonical", or (None, None).
+    """
+    for tag in META_TAG_RE.findall(html):
+        attributes = parse_tag_attributes(tag)
+        if attributes.get("http-equiv", "").lower() == "refresh":
+            match = re.search(r"url\s*=\s*['\"]?([^'\">]+)", attributes.get("content", ""), re.IGNORECASE)
+            if match:
+                return "refresh", urllib.parse.urljoin(base_url, match.group(1).strip())
+    for tag in LINK_TAG_RE.findall(html):
+        attributes = parse_tag_attributes(tag)
+        if "canonical" in attributes.get("rel", "").lower().split() and attributes.get("href"):
+            return "canonical", urllib.parse.urljoin(base_url, attributes["href"].strip())
+    return None, None
+
+
+def resolve_with_http(url, max_refreshes=3):
+    """
+    Resolves url by following HTTP redirects, meta refresh tags and canonical links,
+    without a browser. Returns None when a browser is needed: the request failed or the
+    page is a known JavaScript interstitial.
+    """
+    session = get_http_session()
+    current_url = url
+    for _ in range(max_refreshes + 1):
+        try:
+            with session.get(current_url, allow_redirects=True, timeout=10, stream=True) as response:
+                if response.status_code >= 400:
+                    return None
+                final_url = response.url
+                html = ""
+                if "html" in response.headers.get("Content-Type", ""):
+                    html = response.raw.read(HTTP_MAX_BYTES, decode_content=True).decode(
+                        response.encoding or "utf-8", errors="replace"
+                    )
+        except Exception as e:
+            logger.info("HTTP resolution failed for %s: %s", current_url, e)
+            return None
+        if urllib.parse.urlparse(final_url).hostname in JS_INTERSTITIAL_HOSTS:
+            return None
+        kind, target = find_html_redirect(html, final_url)
+        if kind == "refresh":
+            current_url = target
+            continue
+        if kind == "canonical" and target.startswith("http"):
+            return target
+        return final_url
+    return None
+
+
+def resolve_urls(urls, parallelism=4, http_workers=16):
+    """
+    Resolves URLs in tiers: first with plain HTTP requests (redirects, meta refresh and
+    canonical links), then with the shared Playwright browser for the URLs that HTTP could not
+    resolve or that start on a known JavaScript interstitial host.
+
+    URLs resolved by earlier runs are answered from the article cache.
+
+    Returns:
+        tuple: (resolved, tiers) where resolved maps each URL to its resolved URL (None if it could
+        not be resolved) and tiers maps each URL to "cache", "http", "playwright" or "failed".
+    """
+    unique_urls = list(dict.fromkeys(url for url in urls if url))
+    resolved = {}
+    tiers = {}
+    for url in unique_urls:
+        cached_url = get_cached_resolution(url)
+        if cached_url:
+            resolved[url] = cached_url
+            tiers[url] = "cache"
+    http_candidates = [
+        url for url in unique_urls
+        if url not in resolved and urllib.parse.urlparse(url).hostname not in JS_INTERSTITIAL_HOSTS
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, http_workers)) as executor:
+        for url, final_url in zip(http_candidates, executor.map(resolve_with_http, http_candidates)):
+            if final_url:
+                resolved[url] = final_url
+                tiers[url] = "http"
+    browser_urls = [url for url in unique_urls if url not in resolved]
+    for url, final_url in resolve_many(browser_urls, parallelism).items():
+        resolved[url] = final_url if is_resolved_url(final_url) else None
+        tiers[url] = "playwright" if resolved[url] else "failed"
+    for url, tier in tiers.items():
+        # Failed resolutions are never cached, so the next run tries them again
+        if tier in ["http", "playwright"]:
+            cache_resolution(url, resolved[url], tier)
+    tier_counts = Counter(tiers.values())
+    logger.info(
+        "Resolved %s URLs: %s from cache, %s via HTTP, %s via Playwright, %s failed",
+        len(unique_urls), tier_counts["cache"], tier_counts["http"], tier_counts["playwright"], tier_counts["failed"],
+    )
+    return resolved, tiers
+
+
+class ResolverService:
+    """
+    Thread-safe, long-lived URL resolver for pipelines that resolve one article at a time.
+    Uses the same tiers as resolve_urls (cache, plain HTTP, then Playwright). The browser pool runs
+    on its own event loop thread and is only started when the first URL needs it.
+
+    Usage:
+        with ResolverService(parallelism=4) as resolver:
+            final_url, tier = resolver.resolve(url)
+    """
+
+    def __init__(self, parallelism=4):
+        self.parallelism = parallelism
+        self.lock = threading.Lock()
+        self.loop = None
+        self.loop_thread = None
+        self.browser_resolver = None
+        self.tier_counts = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start_browser(self):
+        """
+        Starts the browser pool on first use. Returns None if the browser could not be started;
+        the service then stops trying and reports URLs that need a browser as failed.
+        """
+        with self.lock:
+            if self.loop is None:
+                if os.name == 'nt':
+                    self.loop = asyncio.ProactorEventLoop()
+                else:
+                    self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self.loop_thread.start()
+                try:
+                    self.browser_resolver = asyncio.run_coroutine_threadsafe(
+                        PlaywrightResolver(self.parallelism).__aenter__(), self.loop
+                    ).result()
+                except Exception as e:
+                    logger.error("Error starting Playwright: %s", e)
+        return self.browser_resolver
+
+    def resolve(self, url):
+        """
+        Returns:
+            tuple: (final_url, tier) where tier is "cache", "http", "playwright" or "failed";
+            a URL that could not be resolved is returned as is with tier "failed".
+        """
+        final_url = get_cached_resolution(url)
+        tier = "cache"
+        if not final_url and urllib.parse.urlparse(url).hostname not in JS_INTERSTITIAL_HOSTS:
+            final_url = resolve_with_http(url)
+            tier = "http"
+        if not final_url:
+            browser_resolver = self._start_browser()
+            if browser_resolver:
+                final_url = asyncio.run_coroutine_threadsafe(browser_resolver.resolve(url), self.loop).result()
+                if not is_resolved_url(final_url):
+                    final_url = None
+            tier = "playwright" if final_url else "failed"
+        if tier in ["http", "playwright"]:
+            cache_resolution(url, final_url, tier)
+        with self.lock:
+            self.tier_counts[tier] += 1
+        if tier == "failed":
+            # The feed URL still leads to the article through Inoreader's redirect
+            return url, tier
+        return final_url, tier
+
+    def close(self):
+        if self.browser_resolver:
+            try:
+                asyncio.run_coroutine_threadsafe(
+                    self.browser_resolver.__aexit__(None, None, None), self.loop
+                ).result()
+            except Exception as e:
+                logger.error("Error closing browser: %s", e)
+            self.browser_resolver = None
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            self.loop = None
+        logger.info("URL resolution tiers: %s", dict(self.tier_counts))
+
+
 def fetch_full_article_text(row):
     real_url = row.get("url")
     #real_url = resolve_with_playwright(ino_url)
@@ -142,10 +553,44 @@ def fetch_full_article_text(row):
         real_url = row.get("url", "")
 
     print(f"Extracted final URL: {real_url}")
+    cache = get_article_cache()
+    cache_key = hash_key({"text": real_url})
+    entry = cache.get(cache_key)
+    if entry and time.time() - entry["fetched_at"] < ARTICLE_TEXT_TTL_SECONDS:
+        return entry["text"]
     try:
+        # Download the page ourselves so that a cached copy can be revalidated with a conditional request
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        html = None
+        response = None
+        try:
+            response = get_http_session().get(real_url, headers=headers, timeout=15)
+            if response.status_code == 304 and entry:
+                entry["fetched_at"] = time.time()
+                cache.set(cache_key, entry)
+                return entry["text"]
+            if response.status_code == 200:
+                html = response.text
+        except Exception as e:
+            logger.info("Could not download %s with requests, using newspaper instead: %s", real_url, e)
         article = Article(real_url)
-        article.download()
+        if html:
+            article.download(input_html=html)
+        else:
+            article.download()
         article.parse()
+        if article.text:
+            cache.set(cache_key, {
+                "text": article.text,
+                "status": response.status_code if response is not None else None,
+                "etag": response.headers.get("ETag") if html else None,
+                "last_modified": response.headers.get("Last-Modified") if html else None,
+                "fetched_at": time.time(),
+            })
         return article.text
     except Exception as e:
         print(f"Error fetching article from {real_url}: {e}")
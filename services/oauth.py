@@ -6,38 +6,38 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-CLIENT_ID = st.secrets["oauth_client_id"]
-CLIENT_SECRET = st.secrets["inoreader_key"]
-REDIRECT_URI = st.secrets["redirect_uri"]
-AUTHORIZATION_URL = st.secrets["authorization_url"]
-TOKEN_URL = st.secrets["token_url"]
 SCOPE = "read"
 
+# The app's OAuth settings are read from st.secrets when needed, so that importing this module
+# does not require them (e.g. for headless runs, which receive an access token instead).
+def get_oauth_setting(name):
+    return st.secrets[name]
+
 def get_authorization_url():
     # Use the already-stored oauth_state
     logger.info("Getting auth url")
     state = st.session_state.get("oauth_state")
     logger.info(state)
     params = {
-        "client_id": CLIENT_ID,
-        "redirect_uri": REDIRECT_URI,
+        "client_id": get_oauth_setting("oauth_client_id"),
+        "redirect_uri": get_oauth_setting("redirect_uri"),
         "response_type": "code",
         "scope": SCOPE,
         "state": state,
     }
-    return f"{AUTHORIZATION_URL}?{urllib.parse.urlencode(params)}"
+    return f"{get_oauth_setting('authorization_url')}?{urllib.parse.urlencode(params)}"
 
 def exchange_code_for_token(auth_code):
     logger.info("Exchanging code for token")
     data = {
         "code": auth_code,
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "redirect_uri": REDIRECT_URI,
+        "client_id": get_oauth_setting("oauth_client_id"),
+        "client_secret": get_oauth_setting("inoreader_key"),
+        "redirect_uri": get_oauth_setting("redirect_uri"),
         "grant_type": "authorization_code",
     }
     logger.info(data)
-    response = requests.post(TOKEN_URL, data=data)
+    response = requests.post(get_oauth_setting("token_url"), data=data)
     logger.info(response)
     if response.status_code == 200:
         return response.json()
@@ -0,0 +1,338 @@
+"""
+This module is the single path through which requests reach the OpenAI API. Every call
+- waits for a slot of an AIMD concurrency limit that shrinks when OpenAI throttles and grows back
+  while calls succeed, and pauses while the x-ratelimit-* headers say a limit is exhausted;
+- is retried on rate limits, timeouts, connection errors and 5xx errors, with jittered
+  exponential backoff (honouring Retry-After); an exhausted quota is not retried;
+- fails fast through a circuit breaker once calls have failed many times in a row, instead of
+  every article of a run waiting through its own retries against an unavailable API. Rate
+  limits are throttling rather than unavailability and do not count as failures.
+
+Counts of calls, retries, time spent backing off before retries and time throttled by OpenAI's
+rate limits are kept for the process; a run reports the difference between stats() at its start
+and at its end (see stats_since). Observers (e.g. a utils.metrics.RunMetrics) are told the label,
+model, latency and token usage of every successful call; the label is set with call_label by the
+code making the call, e.g. the screening question.
+
+Classes:
+- OpenAIUnavailableError: Raised when a call fails after its retries or the circuit is open.
+- CircuitBreaker: Opens after consecutive failures and lets a trial call through after a cooldown.
+- OpenAICallLayer: Sends calls with adaptive concurrency, retries and the circuit breaker.
+
+Functions:
+- parse_reset_seconds: Parses the duration of an x-ratelimit-reset-* header.
+- call_label: Labels the OpenAI calls made by the current thread inside a with block.
+- sent_calls: Collects the labels of the OpenAI calls the current thread sends inside a with block.
+- get_call_layer: Returns the call layer shared by every request of the process.
+"""
+
+from contextlib import contextmanager
+import logging
+import random
+import re
+import threading
+import time
+
+import openai
+
+from utils.rate_limit import AdaptiveConcurrency
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Below this share of the minute's requests or tokens left, concurrency is reduced before a 429 happens
+LOW_HEADROOM = 0.05
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+_call_layer = None
+_call_layer_lock = threading.Lock()
+_labels = threading.local()
+
+
+class OpenAIUnavailableError(RuntimeError):
+    """
+    A call to the OpenAI API failed after all its retries, or was not sent because the circuit is open.
+    """
+
+
+def parse_reset_seconds(value):
+    """
+    Parses the duration of an x-ratelimit-reset-* header, e.g. "1s", "6m0s" or "120ms", into seconds.
+    """
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value or ""))
+
+
+@contextmanager
+def call_label(label):
+    """
+    Labels the OpenAI calls made by the current thread inside the with block (e.g. with the
+    screening question they ask), so that run metrics can break calls down by label. Inner
+    labels replace outer ones until their block ends.
+    """
+    previous = getattr(_labels, "label", None)
+    _labels.label = label
+    try:
+        yield
+    finally:
+        _labels.label = previous
+
+
+@contextmanager
+def sent_calls():
+    """
+    Collects the labels of the OpenAI calls the current thread sends successfully inside the with
+    block into the list it yields, e.g. to tell answers that cost a call from cached ones.
+    """
+    previous = getattr(_labels, "sent", None)
+    _labels.sent = sent = []
+    try:
+        yield sent
+    finally:
+        _labels.sent = previous
+
+
+def is_quota_exhausted(error):
+    """
+    Returns True if error is the 429 OpenAI answers with once the account's quota is used up,
+    which no amount of waiting fixes.
+    """
+    return isinstance(error, openai.RateLimitError) and getattr(error, "code", None) == "insufficient_quota"
+
+
+def is_retryable(error):
+    if is_quota_exhausted(error):
+        return False
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    )
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed calls. After failure_threshold of them the circuit opens and calls
+    are refused for cooldown_seconds; then calls are let through again, and the next failure
+    opens the circuit right away unless a call has succeeded in between.
+    """
+
+    def __init__(self, failure_threshold=10, cooldown_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown_seconds
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold and (
+                self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown_seconds
+            ):
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning(
+                    "OpenAI calls failed %s times in a row, pausing them for %s seconds",
+                    self.consecutive_failures, self.cooldown_seconds,
+                )
+
+
+class OpenAICallLayer:
+    """
+    Sends OpenAI API calls with adaptive concurrency, retries and a circuit breaker, and counts
+    calls, retries, throttled responses and the seconds spent waiting because of throttling.
+    """
+
+    def __init__(self, max_retries=6, base_delay=1.0, max_delay=60.0, concurrency=None, breaker=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.observers = []
+        self.counts = {
+            "calls": 0,
+            "retries": 0,
+            "throttled": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+            "backoff_seconds": 0.0,
+            "concurrency_wait_seconds": 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    @contextmanager
+    def observe(self, observer):
+        """
+        Calls observer(label, model, seconds, usage) after every successful call made inside the
+        with block, from any thread.
+        """
+        with self.lock:
+            self.observers.append(observer)
+        try:
+            yield observer
+        finally:
+            with self.lock:
+                self.observers.remove(observer)
+
+    def _notify(self, model, seconds, response):
+        with self.lock:
+            observers = list(self.observers)
+        label = getattr(_labels, "label", None) or "other"
+        sent = getattr(_labels, "sent", None)
+        if sent is not None:
+            sent.append(label)
+        for observer in observers:
+            try:
+                observer(label, model, seconds, getattr(response, "usage", None))
+            except Exception as e:
+                logger.warning("OpenAI call observer failed: %s", e)
+
+    def _wait_for_pause(self):
+        with self.lock:
+            wait = self.paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+            self._count("throttled_seconds", wait)
+
+    def _pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _read_rate_limit_headers(self, headers):
+        """
+        Returns True if the headers show that a limit is nearly exhausted; pauses new calls until
+        the limit resets if it is exhausted.
+        """
+        low = False
+        for kind in ["requests", "tokens"]:
+            try:
+                limit = float(headers.get(f"x-ratelimit-limit-{kind}") or 0)
+                remaining = float(headers.get(f"x-ratelimit-remaining-{kind}") or limit)
+            except ValueError:
+                continue
+            if limit and remaining / limit < LOW_HEADROOM:
+                low = True
+                if remaining <= 0:
+                    self._pause(parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}")))
+        return low
+
+    def _backoff_seconds(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = response.headers.get("retry-after-ms")
+                retry_after = float(retry_after) / 1000 if retry_after else float(response.headers.get("retry-after") or 0)
+                delay = max(delay, min(self.max_delay, retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def set_max_concurrency(self, maximum):
+        """
+        Caps the number of calls in flight at maximum (e.g. a run's max_concurrency); see
+        utils.rate_limit.AdaptiveConcurrency.set_maximum.
+        """
+        self.concurrency.set_maximum(maximum)
+
+    def call(self, create_fxn, **params):
+        """
+        Calls create_fxn(**params), a with_raw_response.create method of an OpenAI client (e.g.
+        client.chat.completions.with_raw_response.create), and returns the parsed response.
+
+        Raises:
+            OpenAIUnavailableError: If the call still fails after max_retries retries, the circuit
+                is open or the account's quota is exhausted.
+            openai.APIStatusError: For errors that retrying cannot fix (e.g. 400 Bad Request).
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise OpenAIUnavailableError("OpenAI calls are paused after repeated failures")
+            self._wait_for_pause()
+            self._count("concurrency_wait_seconds", self.concurrency.acquire())
+            self._count("calls")
+            throttled = False
+            start = time.monotonic()
+            try:
+                raw_response = create_fxn(**params)
+                throttled = self._read_rate_limit_headers(raw_response.headers)
+                response = raw_response.parse()
+            except Exception as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                if throttled:
+                    self._count("throttled")
+                if is_quota_exhausted(e):
+                    self._count("failures")
+                    raise OpenAIUnavailableError(f"The OpenAI quota is exhausted: {e}") from e
+                if not is_retryable(e):
+                    # The API answered; it is the request that is wrong
+                    self.breaker.record_success()
+                    raise
+                if not throttled:
+                    # Rate limits are absorbed by backoff and the concurrency limit; only errors
+                    # that suggest the API is down open the circuit
+                    self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise OpenAIUnavailableError(f"OpenAI call failed after {self.max_retries} retries: {e}") from e
+                delay = self._backoff_seconds(attempt, e)
+                logger.info("OpenAI call failed (%s), retrying in %.1f seconds", e.__class__.__name__, delay)
+                self._count("retries")
+                self._count("backoff_seconds", delay)
+                if throttled:
+                    self._count("throttled_seconds", delay)
+            else:
+                self.breaker.record_success()
+                self._notify(params.get("model"), time.monotonic() - start, response)
+                return response
+            finally:
+                self.concurrency.release(throttled)
+            time.sleep(delay)
+
+    def stats(self):
+        """
+        Returns the counts of the process so far, the current concurrency limit and the number
+        of times the circuit opened.
+        """
+        with self.lock:
+            counts = dict(self.counts)
+        return {**counts, "concurrency_limit": round(self.concurrency.limit, 1), "circuit_trips": self.breaker.trips}
+
+    def stats_since(self, earlier_stats):
+        """
+        Returns the counts since earlier_stats (an earlier result of stats()), e.g. those of one run.
+        """
+        stats = self.stats()
+        return {
+            key: round(value - earlier_stats.get(key, 0), 2) if key != "concurrency_limit" else value
+            for key, value in stats.items()
+        }
+
+
+def get_call_layer():
+    """
+    Returns the call layer shared by every OpenAI request of the process, so that concurrency
+    adapts to the account's limits across runs and threads.
+    """
+    global _call_layer
+    with _call_layer_lock:
+        if _call_layer is None:
+            _call_layer = OpenAICallLayer()
+        return _call_layer
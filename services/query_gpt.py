@@ -1,15 +1,40 @@
 from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
 import os
 import pandas as pd
 import string
 import json
+import math
+import tiktoken
+import threading
 from site_text.questions import PROJECT_STATUS
+from utils.cache import SQLiteCache, hash_key
+from utils.rate_limit import RateLimiter
+from services.openai_calls import OpenAIUnavailableError, call_label, get_call_layer
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the persistent cache of GPT responses, shared by every query in the process.
+    Set `.enabled = False` on it to bypass the cache for a run.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SQLiteCache("gpt_responses.sqlite", max_entries=200000, max_mb=500, max_age_days=90)
+        return _response_cache
+
+
 def new_openai_session(openai_apikey):
     os.environ["OPENAI_API_KEY"] = openai_apikey
-    client = OpenAI()
+    # Retries are handled by services.openai_calls, which also adapts concurrency to throttling
+    client = OpenAI(max_retries=0)
     gpt_model = "gpt-4o" 
     max_num_chars = 10
     return client, gpt_model, max_num_chars
@@ -30,18 +55,91 @@ def create_gpt_messages(query, run_on_full_text):
     ]
 
 
-def chat_gpt_query(gpt_client, gpt_model, resp_fmt, msgs):
-    response = gpt_client.chat.completions.create(
-        model=gpt_model,
-        temperature=0,
-        response_format={"type": resp_fmt},
-        messages=msgs,
+def count_message_tokens(msgs, gpt_model):
+    """
+    Estimates the number of prompt tokens of a list of chat messages with tiktoken.
+    Used to charge the tokens-per-minute bucket before a request is sent.
+    """
+    try:
+        enc = tiktoken.encoding_for_model(gpt_model)
+    except KeyError:
+        enc = tiktoken.get_encoding("o200k_base")
+    # Every message carries a few tokens of overhead for its role and delimiters
+    return sum(len(enc.encode(msg["content"])) + 4 for msg in msgs) + 3
+
+
+def get_completion_cache_key(gpt_model, msgs, response_format=None):
+    """
+    Returns the response cache key of a chat completion request.
+    """
+    return hash_key({"model": gpt_model, "response_format": response_format, "messages": msgs})
+
+
+def create_chat_completion(gpt_client, gpt_model, msgs, response_format=None):
+    """
+    Sends a temperature 0 chat completion request and returns the content of the first choice.
+    Responses are cached on disk, keyed on (model, response_format, messages), so that re-running
+    a folder does not pay again for identical prompts.
+    """
+    cache = get_response_cache()
+    cache_key = get_completion_cache_key(gpt_model, msgs, response_format)
+    content = cache.get(cache_key)
+    if content is not None:
+        return content
+    params = {"model": gpt_model, "temperature": 0, "messages": msgs}
+    if response_format:
+        params["response_format"] = response_format
+    response = get_call_layer().call(gpt_client.chat.completions.with_raw_response.create, **params)
+    content = response.choices[0].message.content
+    if content is not None:
+        cache.set(cache_key, content)
+    return content
+
+
+def create_yes_no_completion(gpt_client, gpt_model, msgs):
+    """
+    Asks for a one-token yes/no answer with logprobs.
+    Responses are cached on disk like those of create_chat_completion.
+
+    Returns:
+        tuple: (answer, confidence) where answer is "yes" or "no" and confidence is the probability
+        the model put on the tokens that spell the answer.
+    """
+    cache = get_response_cache()
+    cache_key = hash_key({"model": gpt_model, "logprobs": True, "messages": msgs})
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached["answer"], cached["confidence"]
+    response = get_call_layer().call(
+        gpt_client.chat.completions.with_raw_response.create,
+        model=gpt_model, temperature=0, messages=msgs, max_tokens=1, logprobs=True, top_logprobs=5,
     )
-    return response.choices[0].message.content
+    probabilities = {"yes": 0.0, "no": 0.0}
+    choice = response.choices[0]
+    if choice.logprobs and choice.logprobs.content:
+        for candidate in choice.logprobs.content[0].top_logprobs:
+            token = candidate.token.strip().lower()
+            if token in probabilities:
+                probabilities[token] += math.exp(candidate.logprob)
+        answer = "yes" if probabilities["yes"] > probabilities["no"] else "no"
+    else:
+        answer = clean_yes_no(choice.message.content or "")
+    confidence = probabilities[answer]
+    cache.set(cache_key, {"answer": answer, "confidence": confidence})
+    return answer, confidence
+
+
+def chat_gpt_query(gpt_client, gpt_model, resp_fmt, msgs):
+    # resp_fmt is either a format type ("text", "json_object") or a full response_format, e.g. a JSON schema
+    response_format = resp_fmt if isinstance(resp_fmt, dict) else {"type": resp_fmt}
+    return create_chat_completion(gpt_client, gpt_model, msgs, response_format)
 
 
-def fetch_variable_info(gpt_client, gpt_model, query, resp_fmt, run_on_full_text):
+def fetch_variable_info(gpt_client, gpt_model, query, resp_fmt, run_on_full_text, rate_limiter=None):
     msgs = create_gpt_messages(query, run_on_full_text)
+    if rate_limiter:
+        # Yes/no answers are only a few tokens long, but leave room for the JSON wrapper
+        rate_limiter.acquire(count_message_tokens(msgs, gpt_model) + 10)
     return chat_gpt_query(gpt_client, gpt_model, resp_fmt, msgs)
     """msgs.append({"role": "assistant", "content": init_response})
     follow_up_prompt = "<instructions>Based on the previous instructions, ensure that your response has included all correct answers and/or text excerpts. If your previous resposne is correct, return the same response. If there is more to add to your previous response, return the same format with the complete, correct response.</instructions>"
@@ -76,6 +174,52 @@ def query_gpt_for_relevance(
 
     return pd.DataFrame(results)
 
+def clean_yes_no(response):
+    """
+    Standardizes a yes/no GPT response. Unexpected responses default to "no".
+    """
+    response_cleaned = response.strip().lower().translate(str.maketrans('', '', string.punctuation))
+    if response_cleaned not in ["yes", "no"]:
+        response_cleaned = "no"
+    return response_cleaned
+
+
+def build_screening_query(question, headline):
+    """
+    Builds the single-headline yes/no prompt for one exclusion question.
+    """
+    return (
+        f'Forget all previous instructions. Answer this question to the best of your ability: {question}. '
+        f'Please respond with only "yes" or "no". Here is the headline: {headline}'
+    )
+
+
+def estimate_screening_tokens(question, headline, gpt_model, run_on_full_text=True):
+    """
+    Returns the prompt tokens of the single-headline screening request for question.
+    """
+    return count_message_tokens(create_gpt_messages(build_screening_query(question, headline), run_on_full_text), gpt_model)
+
+
+def screen_article(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model, rate_limiter=None):
+    """
+    Asks each question in target_questions about one article until one returns "yes".
+
+    Returns:
+        tuple: (is_irrelevant, question) where question is the one that triggered the exclusion, or None.
+    """
+    for question in target_questions:
+        query = build_screening_query(question, row["text_column"])
+        resp_fmt = gpt_analyzer.resp_format_type()
+        with call_label(f"screen: {question}"):
+            response = fetch_variable_info(gpt_client, gpt_model, query, resp_fmt, run_on_full_text, rate_limiter)
+        logger.info("Response: %s", response)
+        if clean_yes_no(response) == "yes":
+            print("Skipping article due to query: ", query)
+            return True, question
+    return False, None
+
+
 def query_gpt_for_relevance_iterative(gpt_analyzer, df, target_questions, run_on_full_text, gpt_client, gpt_model):
     """
     Iterates through target_questions for each article in df.
@@ -88,22 +232,7 @@ def query_gpt_for_relevance_iterative(gpt_analyzer, df, target_questions, run_on
     """
     results = []
     for index, row in df.iterrows():
-        is_irrelevant = False
-        for question in target_questions:
-            query = (
-                f'Forget all previous instructions. Answer this question to the best of your ability: {question}. '
-                f'Please respond with only "yes" or "no". Here is the headline: {row["text_column"]}'
-            )
-            resp_fmt = gpt_analyzer.resp_format_type()
-            response = fetch_variable_info(gpt_client, gpt_model, query, resp_fmt, run_on_full_text)
-            logger.info("Response: %s", response)
-            response_cleaned = response.strip().lower().translate(str.maketrans('', '', string.punctuation))
-            if response_cleaned not in ["yes", "no"]:
-                response_cleaned = "no"
-            if response_cleaned == "yes":
-                is_irrelevant = True
-                print("Skipping article due to query: ", query)
-                break
+        is_irrelevant, _ = screen_article(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model)
         results.append({
             "index": index,
             "title": row.get("title", "Unknown Title"),
@@ -111,8 +240,472 @@ def query_gpt_for_relevance_iterative(gpt_analyzer, df, target_questions, run_on
         })
     return pd.DataFrame(results)
 
-import json
-from site_text.questions import PROJECT_STATUS
+
+def query_gpt_for_relevance_concurrent(
+    gpt_analyzer,
+    df,
+    target_questions,
+    run_on_full_text,
+    gpt_client,
+    gpt_model,
+    max_workers=8,
+    requests_per_minute=500,
+    tokens_per_minute=30000,
+    rate_limiter=None,
+):
+    """
+    Same screening as query_gpt_for_relevance_iterative (questions are asked in order and
+    each article stops at its first "yes"), but up to max_workers articles are screened at once.
+    All workers share one token bucket so the run stays within the account's
+    requests-per-minute and tokens-per-minute limits: rate_limiter if given (e.g. the limiter
+    shared by every folder of a run), else a new RateLimiter for these limits.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per article (in the order of df) including the
+        article index, title, a "relevant" flag and the question that triggered the exclusion.
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    return screen_rows_concurrently(
+        df,
+        lambda row: screen_article(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model, rate_limiter),
+        max_workers,
+    )
+
+
+def screen_rows_concurrently(df, screen_fxn, max_workers):
+    """
+    Runs screen_fxn(row) -> (is_irrelevant, question) on a thread pool for every article in df.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per article (in the order of df) including the
+        article index, title, a "relevant" flag and the question that triggered the exclusion.
+    """
+    rows = list(df.iterrows())
+    logger.info("Screening %s articles with %s workers", len(rows), max_workers)
+
+    def screen_row(index_row):
+        index, row = index_row
+        is_irrelevant, question = screen_fxn(row)
+        return {
+            "index": index,
+            "title": row.get("title", "Unknown Title"),
+            "relevant": "no" if is_irrelevant else "yes",
+            "triggered_by": question or "",
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # executor.map preserves the order of df and re-raises the first worker exception
+        results = list(executor.map(screen_row, rows))
+    return pd.DataFrame(results, columns=["index", "title", "relevant", "triggered_by"])
+
+
+def build_verdict_vector_query(target_questions, headline):
+    """
+    Builds one prompt that asks every exclusion question about a single headline.
+    Questions are labelled q1..qN, matching the keys of get_verdict_vector_format.
+    """
+    numbered = "\n".join(f"q{i}: {question}" for i, question in enumerate(target_questions, start=1))
+    return (
+        "Forget all previous instructions. Answer each of the following questions about the headline "
+        "to the best of your ability, independently of each other. Answer true for yes and false for no.\n\n"
+        f"Questions:\n{numbered}\n\nHere is the headline: {headline}"
+    )
+
+
+def get_verdict_vector_format(target_questions):
+    """
+    Returns a strict JSON schema response format with one boolean per question (q1..qN).
+    """
+    keys = [f"q{i}" for i in range(1, len(target_questions) + 1)]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "exclusion_verdicts",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "boolean"} for key in keys},
+                "required": keys,
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def screen_article_vector(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model, rate_limiter=None):
+    """
+    Asks all questions in target_questions about one article in a single structured-output call.
+    The first question (in list order) answered with true is reported as the trigger, as in screen_article.
+    Falls back to screen_article if the response does not match the schema.
+
+    Returns:
+        tuple: (is_irrelevant, question) where question is the first one that triggered the exclusion, or None.
+    """
+    if not target_questions:
+        return False, None
+    headline = row["text_column"]
+    msgs = create_gpt_messages(build_verdict_vector_query(target_questions, headline), run_on_full_text)
+    if rate_limiter:
+        rate_limiter.acquire(count_message_tokens(msgs, gpt_model) + 8 * len(target_questions))
+    try:
+        with call_label("screen: all questions"):
+            response = chat_gpt_query(gpt_client, gpt_model, get_verdict_vector_format(target_questions), msgs)
+        answers = json.loads(response)
+        verdicts = [answers[f"q{i}"] for i in range(1, len(target_questions) + 1)]
+        if not all(isinstance(verdict, bool) for verdict in verdicts):
+            raise ValueError("verdicts are not booleans")
+    except OpenAIUnavailableError:
+        raise
+    except Exception as e:
+        logger.info("Verdict vector failed (%s), asking questions one at a time", e)
+        return screen_article(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model, rate_limiter)
+    logger.info("Verdicts: %s", verdicts)
+    for question, verdict in zip(target_questions, verdicts):
+        if verdict:
+            print("Skipping article due to query: ", build_screening_query(question, headline))
+            return True, question
+    return False, None
+
+
+def query_gpt_for_relevance_vector(
+    gpt_analyzer,
+    df,
+    target_questions,
+    run_on_full_text,
+    gpt_client,
+    gpt_model,
+    max_workers=8,
+    requests_per_minute=500,
+    tokens_per_minute=30000,
+    rate_limiter=None,
+):
+    """
+    Screens each article with a single call that answers every exclusion question at once
+    (see screen_article_vector), running up to max_workers articles in parallel under one rate
+    limiter, as in query_gpt_for_relevance_concurrent.
+    Relevant articles cost one call instead of one call per question.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per article (in the order of df) including the
+        article index, title, a "relevant" flag and the question that triggered the exclusion.
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    return screen_rows_concurrently(
+        df,
+        lambda row: screen_article_vector(gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model, rate_limiter),
+        max_workers,
+    )
+
+
+def build_batch_screening_query(question, headlines):
+    """
+    Builds one prompt that asks the same exclusion question about several headlines.
+    Headlines are numbered from 0 within the batch; GPT answers with a JSON array keyed by that number.
+    """
+    numbered = "\n".join(f"{i}. {headline}" for i, headline in enumerate(headlines))
+    return (
+        f'Forget all previous instructions. Answer this question to the best of your ability for each headline below: {question}. '
+        'Answer every headline independently with only "yes" or "no". '
+        'Return a JSON object of the form {"verdicts": [{"index": 0, "answer": "yes"}, ...]} '
+        'with exactly one entry per headline, using the headline numbers as index.\n\n'
+        f"Headlines:\n{numbered}"
+    )
+
+
+def pack_headline_batches(items, question, run_on_full_text, gpt_model, token_budget, max_batch_size):
+    """
+    Splits (index, headline) items into batches whose prompt stays within token_budget tokens.
+
+    Returns:
+        list: A list of batches, each a list of (index, headline) tuples.
+    """
+    try:
+        enc = tiktoken.encoding_for_model(gpt_model)
+    except KeyError:
+        enc = tiktoken.get_encoding("o200k_base")
+    base_tokens = count_message_tokens(create_gpt_messages(build_batch_screening_query(question, []), run_on_full_text), gpt_model)
+    batches = []
+    current_batch = []
+    current_tokens = base_tokens
+    for index, headline in items:
+        # Line number, separator and newline add a handful of tokens per headline
+        tokens = len(enc.encode(headline)) + 4
+        if current_batch and (current_tokens + tokens > token_budget or len(current_batch) >= max_batch_size):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = base_tokens
+        current_batch.append((index, headline))
+        current_tokens += tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def estimate_batched_screening_tokens(question, headline, gpt_model, batch_size, run_on_full_text=True):
+    """
+    Returns the prompt tokens of a Batched screening request for question that fall to one
+    headline: its own line plus its share of the instructions sent once per batch of batch_size.
+    """
+    base_tokens = count_message_tokens(create_gpt_messages(build_batch_screening_query(question, []), run_on_full_text), gpt_model)
+    tokens = count_message_tokens(create_gpt_messages(build_batch_screening_query(question, [headline]), run_on_full_text), gpt_model)
+    return tokens - base_tokens + base_tokens / max(1, batch_size)
+
+
+def parse_batch_verdicts(response, batch_size):
+    """
+    Parses the JSON verdicts returned for a batch.
+
+    Returns:
+        dict: Maps the position of each headline in the batch to "yes" or "no".
+        Headlines without a well-formed verdict are left out, so the caller can fall back on them.
+    """
+    try:
+        verdicts = json.loads(response)["verdicts"]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.info("Could not parse batch verdicts: %s", e)
+        return {}
+    parsed = {}
+    if not isinstance(verdicts, list):
+        return parsed
+    for verdict in verdicts:
+        try:
+            position = int(verdict["index"])
+            answer = str(verdict["answer"]).strip().lower()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= position < batch_size and answer in ["yes", "no"]:
+            parsed[position] = answer
+    return parsed
+
+
+def screen_batch(batch, question, run_on_full_text, gpt_analyzer, gpt_client, gpt_model, rate_limiter=None):
+    """
+    Asks one exclusion question about a batch of (index, headline) items in a single request.
+    Headlines whose verdict is missing or malformed are re-asked one at a time.
+
+    Returns:
+        dict: Maps each article index in the batch to "yes" or "no".
+    """
+    query = build_batch_screening_query(question, [headline for _, headline in batch])
+    msgs = create_gpt_messages(query, run_on_full_text)
+    if rate_limiter:
+        rate_limiter.acquire(count_message_tokens(msgs, gpt_model) + 12 * len(batch))
+    try:
+        with call_label(f"screen: {question}"):
+            response = chat_gpt_query(gpt_client, gpt_model, "json_object", msgs)
+        verdicts = parse_batch_verdicts(response, len(batch))
+    except OpenAIUnavailableError:
+        raise
+    except Exception as e:
+        logger.info("Batch screening request failed: %s", e)
+        verdicts = {}
+    if len(verdicts) < len(batch):
+        logger.info("Falling back to single-headline screening for %s of %s headlines", len(batch) - len(verdicts), len(batch))
+    results = {}
+    for position, (index, headline) in enumerate(batch):
+        if position in verdicts:
+            results[index] = verdicts[position]
+        else:
+            single_query = build_screening_query(question, headline)
+            resp_fmt = gpt_analyzer.resp_format_type()
+            with call_label(f"screen: {question}"):
+                response = fetch_variable_info(gpt_client, gpt_model, single_query, resp_fmt, run_on_full_text, rate_limiter)
+            results[index] = clean_yes_no(response)
+    return results
+
+
+def query_gpt_for_relevance_batched(
+    gpt_analyzer,
+    df,
+    target_questions,
+    run_on_full_text,
+    gpt_client,
+    gpt_model,
+    max_workers=8,
+    requests_per_minute=500,
+    tokens_per_minute=30000,
+    token_budget=2000,
+    max_batch_size=40,
+    rate_limiter=None,
+):
+    """
+    Screens headlines several at a time: each request asks one question about a batch of headlines,
+    sized with tiktoken so the prompt stays within token_budget.
+    Questions are asked in order and only headlines that have not yet received a "yes" are sent
+    with the next question, which keeps the early-exit semantics of query_gpt_for_relevance_iterative.
+    Requests are rate limited as in query_gpt_for_relevance_concurrent.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per article (in the order of df) including the
+        article index, title, a "relevant" flag and the question that triggered the exclusion.
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    pending = [(index, row["text_column"]) for index, row in df.iterrows()]
+    irrelevant = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for question in target_questions:
+            if not pending:
+                break
+            batches = pack_headline_batches(pending, question, run_on_full_text, gpt_model, token_budget, max_batch_size)
+            logger.info("Screening %s headlines in %s batches for question: %s", len(pending), len(batches), question)
+            batch_results = executor.map(
+                lambda batch: screen_batch(batch, question, run_on_full_text, gpt_analyzer, gpt_client, gpt_model, rate_limiter),
+                batches,
+            )
+            answers = {}
+            for batch_answers in batch_results:
+                answers.update(batch_answers)
+            for index, headline in pending:
+                if answers.get(index) == "yes":
+                    irrelevant[index] = question
+                    print("Skipping article due to query: ", build_screening_query(question, headline))
+            pending = [(index, headline) for index, headline in pending if index not in irrelevant]
+
+    results = [
+        {
+            "index": index,
+            "title": row.get("title", "Unknown Title"),
+            "relevant": "no" if index in irrelevant else "yes",
+            "triggered_by": irrelevant.get(index, ""),
+        }
+        for index, row in df.iterrows()
+    ]
+    return pd.DataFrame(results, columns=["index", "title", "relevant", "triggered_by"])
+
+
+CASCADE_SMALL_MODEL = "gpt-4o-mini"
+
+
+class CascadeStats:
+    """
+    Counts, per screening question, how many headlines the small model answered and how many
+    were escalated to the large model because the small model was not confident enough.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, question, escalated):
+        with self.lock:
+            counts = self.counts.setdefault(question, {"asked": 0, "escalated": 0})
+            counts["asked"] += 1
+            counts["escalated"] += int(escalated)
+
+    def escalation_rates(self):
+        """
+        Returns a dictionary mapping each question to its asked/escalated counts and escalation rate.
+        """
+        with self.lock:
+            return {
+                question: {**counts, "escalation_rate": counts["escalated"] / counts["asked"]}
+                for question, counts in self.counts.items()
+            }
+
+
+def screen_article_cascade(
+    gpt_analyzer,
+    row,
+    target_questions,
+    run_on_full_text,
+    gpt_client,
+    gpt_model,
+    rate_limiter=None,
+    confidence_threshold=0.9,
+    small_model=CASCADE_SMALL_MODEL,
+    stats=None,
+):
+    """
+    Same screening as screen_article, but each question is first answered by small_model with a
+    single token. Answers whose probability is below confidence_threshold are asked again to
+    gpt_model with the regular prompt, whose answer is then final.
+
+    Returns:
+        tuple: (is_irrelevant, question) where question is the one that triggered the exclusion, or None.
+    """
+    for question in target_questions:
+        query = build_screening_query(question, row["text_column"])
+        msgs = create_gpt_messages(query, run_on_full_text)
+        if rate_limiter:
+            rate_limiter.acquire(count_message_tokens(msgs, small_model) + 1)
+        with call_label(f"screen: {question}"):
+            answer, confidence = create_yes_no_completion(gpt_client, small_model, msgs)
+            escalated = confidence < confidence_threshold
+            if escalated:
+                logger.info("Escalating (confidence %.2f) to %s: %s", confidence, gpt_model, query)
+                resp_fmt = gpt_analyzer.resp_format_type()
+                answer = clean_yes_no(
+                    fetch_variable_info(gpt_client, gpt_model, query, resp_fmt, run_on_full_text, rate_limiter)
+                )
+        if stats:
+            stats.record(question, escalated)
+        if answer == "yes":
+            print("Skipping article due to query: ", query)
+            return True, question
+    return False, None
+
+
+def query_gpt_for_relevance_cascade(
+    gpt_analyzer,
+    df,
+    target_questions,
+    run_on_full_text,
+    gpt_client,
+    gpt_model,
+    max_workers=8,
+    requests_per_minute=500,
+    tokens_per_minute=30000,
+    confidence_threshold=0.9,
+    small_model=CASCADE_SMALL_MODEL,
+    stats=None,
+    rate_limiter=None,
+):
+    """
+    Screens articles concurrently with screen_article_cascade and logs the escalation rate per question.
+    Requests are rate limited as in query_gpt_for_relevance_concurrent.
+
+    Returns:
+        pd.DataFrame: A DataFrame with one row per article (in the order of df) including the
+        article index, title, a "relevant" flag and the question that triggered the exclusion.
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    stats = stats or CascadeStats()
+    results = screen_rows_concurrently(
+        df,
+        lambda row: screen_article_cascade(
+            gpt_analyzer, row, target_questions, run_on_full_text, gpt_client, gpt_model,
+            rate_limiter, confidence_threshold, small_model, stats,
+        ),
+        max_workers,
+    )
+    logger.info("Cascade escalation rates: %s", stats.escalation_rates())
+    return results
+
+
+def get_screening_strategies():
+    """
+    Returns a dictionary mapping screening strategy names to their screening functions.
+    """
+    return {
+        "Concurrent": query_gpt_for_relevance_concurrent,
+        "Batched": query_gpt_for_relevance_batched,
+        "One call per headline": query_gpt_for_relevance_vector,
+        "Cascade": query_gpt_for_relevance_cascade,
+    }
+
+
+def get_article_screeners():
+    """
+    Returns a dictionary mapping screening strategy names to functions that screen one article
+    at a time, for callers that schedule articles themselves (e.g. the staged pipeline in main.main).
+    Strategies that ask about many articles per request, such as "Batched", have no entry.
+    """
+    return {
+        "Concurrent": screen_article,
+        "One call per headline": screen_article_vector,
+        "Cascade": screen_article_cascade,
+    }
+
 
 def query_gpt_for_project_details(gpt_client, gpt_model, article_text, steel_tech_list):
     """
@@ -157,17 +750,15 @@ def query_gpt_for_project_details(gpt_client, gpt_model, article_text, steel_tec
     ]
     
     try:
-        response_core = gpt_client.chat.completions.create(
-            model=gpt_model,
-            temperature=0,
-            messages=msgs_core,
-        )
-        output_core = response_core.choices[0].message.content.strip()
+        with call_label("extract: core details"):
+            output_core = create_chat_completion(gpt_client, gpt_model, msgs_core).strip()
         if output_core.startswith("```json"):
             output_core = output_core[len("```json"):].strip()
         if output_core.endswith("```"):
             output_core = output_core[:-3].strip()
         core_details = json.loads(output_core)
+    except OpenAIUnavailableError:
+        raise
     except Exception as e:
         logger.info(f"Error extracting core project details: {e}")
         core_details = {}
@@ -200,17 +791,15 @@ def query_gpt_for_project_details(gpt_client, gpt_model, article_text, steel_tec
         ]
         
         try:
-            response_additional = gpt_client.chat.completions.create(
-                model=gpt_model,
-                temperature=0,
-                messages=msgs_additional,
-            )
-            output_additional = response_additional.choices[0].message.content.strip()
+            with call_label("extract: additional details"):
+                output_additional = create_chat_completion(gpt_client, gpt_model, msgs_additional).strip()
             if output_additional.startswith("```json"):
                 output_additional = output_additional[len("```json"):].strip()
             if output_additional.endswith("```"):
                 output_additional = output_additional[:-3].strip()
             additional_details = json.loads(output_additional)
+        except OpenAIUnavailableError:
+            raise
         except Exception as e:
             logger.info(f"Error extracting additional project details: {e}")
             additional_details = {}
@@ -230,3 +819,155 @@ def query_gpt_for_project_details(gpt_client, gpt_model, article_text, steel_tec
     
     combined_details = {**core_details, **additional_details}
     return combined_details
+
+
+CORE_DETAIL_KEYS = ['scale', 'project_name', 'timeline', 'technology']
+ADDITIONAL_DETAIL_KEYS = ['company', 'projects mentioned', 'partners', 'continent', 'country', 'project_status']
+PROJECT_SCALES = ['pilot', 'demonstration', 'full scale']
+
+
+def get_project_details_format():
+    """
+    Returns a strict JSON schema response format with every core and additional detail
+    plus the "irrelevant" flag. Scale and project status may be empty when not available.
+    """
+    properties = {key: {"type": "string"} for key in CORE_DETAIL_KEYS + ADDITIONAL_DETAIL_KEYS}
+    properties["scale"] = {"type": "string", "enum": PROJECT_SCALES + [""]}
+    properties["project_status"] = {"type": "string", "enum": PROJECT_STATUS + [""]}
+    properties["irrelevant"] = {"type": "boolean"}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "project_details",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def validate_project_details(details):
+    """
+    Checks parsed project details against the schema of get_project_details_format.
+
+    Returns:
+        list: A description of every problem found; empty if the details are valid.
+    """
+    if not isinstance(details, dict):
+        return ["the response is not a JSON object"]
+    errors = []
+    for key in CORE_DETAIL_KEYS + ADDITIONAL_DETAIL_KEYS:
+        if not isinstance(details.get(key), str):
+            errors.append(f"'{key}' must be a string")
+    if not isinstance(details.get("irrelevant"), bool):
+        errors.append("'irrelevant' must be true or false")
+    if isinstance(details.get("scale"), str) and details["scale"] not in PROJECT_SCALES + [""]:
+        errors.append(f"'scale' must be one of {PROJECT_SCALES} or empty")
+    if isinstance(details.get("project_status"), str) and details["project_status"] not in PROJECT_STATUS + [""]:
+        errors.append(f"'project_status' must be one of {PROJECT_STATUS} or empty")
+    extra_keys = set(details) - set(CORE_DETAIL_KEYS + ADDITIONAL_DETAIL_KEYS + ["irrelevant"])
+    if extra_keys:
+        errors.append(f"unexpected keys: {sorted(extra_keys)}")
+    return errors
+
+
+def build_project_details_messages(article_text, steel_tech_list):
+    """
+    Builds the messages of the single-call project details request.
+    """
+    tech_list_str = ", ".join(steel_tech_list)
+    prompt = (
+        "You are an information extraction assistant. Given the article text below, extract the following details if available. You may need to infer them:\n"
+        f"- scale: one of {', '.join(repr(scale) for scale in PROJECT_SCALES)}\n"
+        "- project_name: the name of the project mentioned\n"
+        "- timeline: the year when it will be operative. If not explicitly stated, skip.\n"
+        f"- technology: one of the following: {tech_list_str}\n"
+        "- company: the name of the company leading the project\n"
+        "- projects mentioned: how many projects are mentioned in this article? (Multiple or one main one)\n"
+        "- partners: the names of partner companies or organizations\n"
+        "- continent: the continent where the project is located\n"
+        "- country: the country where the project is located\n"
+        f"- project_status: the current status of the project, one of the following: {', '.join(PROJECT_STATUS)}\n\n"
+        "IMPORTANT: If the article text is not related to cement production at all or it is about a FINISHED product, return empty values for all these fields "
+        "and set \"irrelevant\" to true. Otherwise set \"irrelevant\" to false.\n\n"
+        "If a detail is not available, leave its value as an empty string.\n\n"
+        "Article text:\n\"\"\"\n" + article_text + "\n\"\"\""
+    )
+    return [
+        {"role": "system", "content": "You are an assistant that extracts project details from text."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def query_gpt_for_project_details_single_pass(gpt_client, gpt_model, article_text, steel_tech_list):
+    """
+    Extracts the same project details as query_gpt_for_project_details, but in a single call:
+    the article text is sent once and the response must follow the strict JSON schema of
+    get_project_details_format. If the response does not parse or fails validation, one repair
+    request quotes the problems back to GPT; fields that are still invalid are left empty.
+
+    Returns a dictionary with the same keys as query_gpt_for_project_details
+    ("irrelevant" is only included when true).
+    """
+    logger.info("Inside single-pass detail module")
+    msgs = build_project_details_messages(article_text, steel_tech_list)
+    response_format = get_project_details_format()
+
+    details, errors, output = {}, ["no response"], ""
+    try:
+        with call_label("extract: single call"):
+            output = create_chat_completion(gpt_client, gpt_model, msgs, response_format) or ""
+        details = json.loads(output)
+        errors = validate_project_details(details)
+    except OpenAIUnavailableError:
+        raise
+    except Exception as e:
+        logger.info(f"Error extracting project details: {e}")
+        errors = [f"the response is not valid JSON ({e})"]
+
+    if errors:
+        # Targeted repair: only the problems are sent back, the article is not re-read from scratch
+        logger.info("Repairing project details: %s", errors)
+        repair_msgs = msgs + [
+            {"role": "assistant", "content": output},
+            {"role": "user", "content": "Your response does not match the required format: " + "; ".join(errors) + ". Return the corrected JSON object only."},
+        ]
+        try:
+            with call_label("extract: repair"):
+                details = json.loads(create_chat_completion(gpt_client, gpt_model, repair_msgs, response_format) or "")
+        except OpenAIUnavailableError:
+            raise
+        except Exception as e:
+            logger.info(f"Error repairing project details: {e}")
+        if not isinstance(details, dict):
+            details = {}
+
+    combined_details = {}
+    for key in CORE_DETAIL_KEYS + ADDITIONAL_DETAIL_KEYS:
+        value = details.get(key, "")
+        combined_details[key] = value if isinstance(value, str) else ""
+    if combined_details["scale"] not in PROJECT_SCALES:
+        combined_details["scale"] = ""
+    if combined_details["project_status"] not in PROJECT_STATUS:
+        combined_details["project_status"] = ""
+    # Match the two-round extraction: additional details only count when a core detail was found
+    if not any(combined_details[key] for key in CORE_DETAIL_KEYS):
+        for key in ADDITIONAL_DETAIL_KEYS:
+            combined_details[key] = ""
+    if details.get("irrelevant") is True:
+        combined_details["irrelevant"] = True
+    return combined_details
+
+
+def get_extraction_modes():
+    """
+    Returns a dictionary mapping project detail extraction modes to their extraction functions.
+    """
+    return {
+        "Two calls": query_gpt_for_project_details,
+        "Single call": query_gpt_for_project_details_single_pass,
+    }
@@ -92,6 +92,20 @@ IRON_NO = [
 ]
 
 
+CEMENT_YES = [
+    "Is the headline talking about cement production?",
+    "Is the headline mentioning the name of a cement producer?",
+    "Is the headline mentioning the name of a technology provider for the cement industry?",
+    "Is the headline mentioning an existing green cement project?",
+    "Does the headline insinuate that a pilot, demonstration or full scale project for green cement production will be built?",
+    "Is the headline mentioning carbon capture, utilization or storage at a cement plant?",
+    "Is the headline mentioning calcined clay or alternative binders for cement?",
+    "Is the headline announcing a company innovation or new approaches to cement production?",
+    "Is the headline mentioning a memorandum of understanding (OR MoU) or partnership for green cement production?",
+    "Is the headline mentioning supply agreement for low-carbon (OR green) cement?",
+    "Is the headline mentioning investment, final investment decisions or grants for green cement?",
+]
+
 CEMENT_NO = [
     "Is this headline about an announcement for a conference or forum, or related event?",
     "Is this headline about sports, movies, fashion (like watches), food, or pop culture?",
@@ -118,4 +132,14 @@ STEEL_IRON_TECH = ["H-DRI (hydrogen direct reduced iron or sponge iron)", "CCS f
 "NG-DRI to H-DRI + EAF", "EAF using imported NG-DRI", "NG-DRI to H-DRI + ESF", "NG-DRI", "Biogenic syngas DRI", "NG-DRI + EAF",
 "Electrochemical process", "NG-DRI + CCS", "H2 injection to BF", "Green hydrogen", "SOEC (solid oxide electrolysis cell)", "biochar use", "CCS (carbon capture storage)", "briquetted iron"]
 CEMENT_TECH = ["CCS (carbon capture storage)", "CCUS (carbon capture and utilization storage)", "Meca clay", "Kiln for calcined clay"]
-PROJECT_STATUS = ["Announced", "Cancelled", "Construction", "Operating", "Finalized (research & testing)", "Paused/postponed"]
\ No newline at end of file
+PROJECT_STATUS = ["Announced", "Cancelled", "Construction", "Operating", "Finalized (research & testing)", "Paused/postponed"]
+PROJECT_DETAIL_FIELDS = {
+    "scale": "Scale of the project: pilot, demonstration, or full scale",
+    "project_name": "Name of the industrial decarbonization project",
+    "timeline": "Year when the project or plant will be operational",
+    "technology": "Technology used by the project, e.g. hydrogen direct reduced iron, electric arc furnace, carbon capture",
+    "company": "Company leading the project",
+    "partners": "Partner companies or organizations of the project",
+    "location": "Country, region and continent where the plant or project is located",
+    "project_status": "Status of the project: announced, cancelled, under construction, operating, finalized, paused or postponed",
+}
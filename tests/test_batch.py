@@ -0,0 +1,133 @@
+"""
+Tests of the Batch API flow with the local stand-in backend: the results of a batch must land in
+the response cache under the keys that create_chat_completion looks up.
+
+Run with: python -m unittest discover tests
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import unittest
+
+# The caches live in the cache directory, which is read when utils.cache is first imported
+os.environ["LEADIT_CACHE_DIR"] = tempfile.mkdtemp(prefix="leadit_test_cache_")
+
+from services.batch import LocalBatchBackend, prime_response_cache
+from services.query_gpt import create_chat_completion, get_completion_cache_key, get_response_cache
+
+GPT_MODEL = "gpt-4o-mini"
+RESPONSE_FORMAT = {"type": "text"}
+
+
+def unreachable_create(**params):
+    raise AssertionError("create_chat_completion called the API instead of reading the cache")
+
+
+# An OpenAI client whose every call fails, to prove that answers come from the response cache
+UNREACHABLE_CLIENT = SimpleNamespace(
+    chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=unreachable_create)))
+)
+
+
+def output_line(custom_id, content=None, error=None):
+    """
+    Returns one line of a Batch API output file, answered with content or failed with error.
+    """
+    entry = {"id": f"batch_req_{custom_id}", "custom_id": custom_id, "response": None, "error": None}
+    if error:
+        entry["error"] = {"code": "server_error", "message": error}
+    else:
+        body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+        entry["response"] = {"status_code": 200, "request_id": f"req_{custom_id}", "body": body}
+    return json.dumps(entry)
+
+
+class LocalBatchBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.batch_dir = tempfile.mkdtemp(prefix="leadit_test_batches_")
+        # Without a client, the backend waits for someone else to write the output file
+        self.backend = LocalBatchBackend(self.batch_dir)
+        get_response_cache().enabled = True
+
+    def prime(self, entries, answer):
+        """
+        Runs prime_response_cache on entries and writes the output file of the batch it submits,
+        with answer(request) returning the output line of each request.
+        """
+        result = {}
+        thread = threading.Thread(
+            target=lambda: result.update(counts=prime_response_cache(self.backend, entries, poll_seconds=0.05, timeout_seconds=30))
+        )
+        thread.start()
+        deadline = time.time() + 30
+        while not os.listdir(self.batch_dir):
+            self.assertLess(time.time(), deadline, "no batch was submitted")
+            time.sleep(0.01)
+        batch_id = os.listdir(self.batch_dir)[0]
+        input_path = os.path.join(self.batch_dir, batch_id, "input.jsonl")
+        while not os.path.exists(input_path):
+            time.sleep(0.01)
+        with open(input_path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with open(os.path.join(self.batch_dir, batch_id, "output.jsonl"), "w", encoding="utf-8") as f:
+            f.write("\n".join(answer(request) for request in requests) + "\n")
+        thread.join(30)
+        self.assertFalse(thread.is_alive(), "prime_response_cache did not finish")
+        return requests, result["counts"]
+
+    def test_results_are_cached_under_the_keys_create_chat_completion_reads(self):
+        messages = {
+            "screen-1": [{"role": "user", "content": "Is headline one about a sports event?"}],
+            "screen-2": [{"role": "user", "content": "Is headline two about a sports event?"}],
+        }
+        entries = [(custom_id, GPT_MODEL, msgs, RESPONSE_FORMAT) for custom_id, msgs in messages.items()]
+
+        requests, counts = self.prime(entries, lambda request: output_line(request["custom_id"], f"answer to {request['custom_id']}"))
+
+        self.assertEqual(counts, (2, 0))
+        self.assertEqual({request["custom_id"] for request in requests}, set(messages))
+        for custom_id, msgs in messages.items():
+            self.assertEqual(
+                get_response_cache().get(get_completion_cache_key(GPT_MODEL, msgs, RESPONSE_FORMAT)), f"answer to {custom_id}"
+            )
+            self.assertEqual(
+                create_chat_completion(UNREACHABLE_CLIENT, GPT_MODEL, msgs, RESPONSE_FORMAT), f"answer to {custom_id}"
+            )
+
+    def test_failed_requests_are_counted_and_not_cached(self):
+        answered = [{"role": "user", "content": "Extract the project details of article one."}]
+        failing = [{"role": "user", "content": "Extract the project details of article two."}]
+        entries = [("extract-1", GPT_MODEL, answered, RESPONSE_FORMAT), ("extract-2", GPT_MODEL, failing, RESPONSE_FORMAT)]
+
+        def answer(request):
+            if request["custom_id"] == "extract-2":
+                return output_line("extract-2", error="The server had an error processing the request")
+            return output_line(request["custom_id"], "{}")
+
+        _, counts = self.prime(entries, answer)
+
+        self.assertEqual(counts, (2, 1))
+        self.assertEqual(get_response_cache().get(get_completion_cache_key(GPT_MODEL, answered, RESPONSE_FORMAT)), "{}")
+        self.assertIsNone(get_response_cache().get(get_completion_cache_key(GPT_MODEL, failing, RESPONSE_FORMAT)))
+
+    def test_priming_leaves_the_hit_and_miss_counters_alone(self):
+        cached = [{"role": "user", "content": "Is headline three about a sports event?"}]
+        new = [{"role": "user", "content": "Is headline four about a sports event?"}]
+        get_response_cache().set(get_completion_cache_key(GPT_MODEL, cached, RESPONSE_FORMAT), "no")
+        entries = [("screen-3", GPT_MODEL, cached, RESPONSE_FORMAT), ("screen-4", GPT_MODEL, new, RESPONSE_FORMAT)]
+        stats_before = get_response_cache().stats()
+
+        requests, counts = self.prime(entries, lambda request: output_line(request["custom_id"], "yes"))
+
+        self.assertEqual(counts, (1, 0))
+        self.assertEqual([request["custom_id"] for request in requests], ["screen-4"])
+        stats = get_response_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (stats_before["hits"], stats_before["misses"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests of per-article stage checkpoints: an interrupted run must resume with the stages it already
+completed, but only when it is resumed with the same settings.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+import uuid
+
+# The caches live in the cache directory, which is read when utils.cache is first imported
+os.environ["LEADIT_CACHE_DIR"] = tempfile.mkdtemp(prefix="leadit_test_cache_")
+
+from utils.checkpoint import RunCheckpoint
+
+FOLDER = "LeadIT-Steel"
+
+
+def article(item_id="id1", feed_url="https://www.inoreader.com/article/1"):
+    return {"id": item_id, "feed_url": feed_url, "title": "H2 Green Steel to build plant in Boden"}
+
+
+class RunCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.fname = f"checkpoints_{uuid.uuid4().hex}.sqlite"
+        self.calls = []
+
+    def checkpoint(self, fingerprint="settings-a", resume=True):
+        return RunCheckpoint(FOLDER, resume=resume, fname=self.fname, fingerprint=fingerprint)
+
+    def screen(self, item):
+        self.calls.append(item["id"])
+        item["relevant"] = "yes"
+        return item
+
+    def run_screen(self, checkpoint, item):
+        return checkpoint.checkpointed("screen", self.screen, ["relevant"])(item)
+
+    def test_resumed_run_restores_completed_stages(self):
+        self.run_screen(self.checkpoint(), article())
+
+        resumed = self.run_screen(self.checkpoint(), article())
+
+        self.assertEqual(self.calls, ["id1"])
+        self.assertEqual(resumed["relevant"], "yes")
+        self.assertEqual(resumed["resumed_stages"], ["screen"])
+
+    def test_fingerprint_mismatch_starts_a_new_run(self):
+        first = self.checkpoint()
+        self.run_screen(first, article())
+
+        second = self.checkpoint(fingerprint="settings-b")
+        self.run_screen(second, article())
+
+        self.assertNotEqual(second.run_id, first.run_id)
+        self.assertEqual(self.calls, ["id1", "id1"])
+        # The mismatched run was discarded rather than kept for later
+        self.assertNotEqual(self.checkpoint().run_id, first.run_id)
+
+    def test_finished_and_unresumed_runs_are_not_resumed(self):
+        finished = self.checkpoint()
+        self.run_screen(finished, article())
+        finished.finish()
+        self.assertNotEqual(self.checkpoint().run_id, finished.run_id)
+
+        unfinished = self.checkpoint()
+        self.assertNotEqual(self.checkpoint(resume=False).run_id, unfinished.run_id)
+
+    def test_articles_sharing_an_id_are_checkpointed_apart(self):
+        checkpoint = self.checkpoint()
+        self.run_screen(checkpoint, article("Unknown", "https://www.inoreader.com/article/1"))
+
+        self.run_screen(self.checkpoint(), article("Unknown", "https://www.inoreader.com/article/2"))
+
+        self.assertEqual(self.calls, ["Unknown", "Unknown"])
+
+    def test_changed_input_fingerprint_runs_the_stage_again(self):
+        def run_extract(checkpoint, text):
+            stage = checkpoint.checkpointed("extract", self.screen, ["relevant"], lambda item: item["full_text"])
+            return stage({**article(), "full_text": text})
+
+        run_extract(self.checkpoint(), "first version")
+        run_extract(self.checkpoint(), "first version")
+        run_extract(self.checkpoint(), "second version")
+
+        self.assertEqual(self.calls, ["id1", "id1"])
+
+    def test_failed_and_empty_stage_results_are_not_checkpointed(self):
+        def resolve(item):
+            self.calls.append(item["id"])
+            item["url"], item["resolve_tier"] = item["feed_url"], "failed"
+            return item
+
+        def skip(item):
+            self.calls.append(item["id"])
+            return item
+
+        for _ in range(2):
+            checkpoint = self.checkpoint()
+            checkpoint.checkpointed(
+                "resolve", resolve, ["url", "resolve_tier"], failed_fxn=lambda item: item["resolve_tier"] == "failed"
+            )(article())
+            checkpoint.checkpointed("fetch", skip, ["full_text"])(article())
+
+        self.assertEqual(self.calls, ["id1"] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests of near-duplicate headline clustering: syndicated copies of a headline must collapse onto
+its first occurrence, and different stories must stay apart.
+
+Run with: python -m unittest discover tests
+"""
+
+import unittest
+
+import pandas as pd
+
+from utils.dedupe import find_duplicate_clusters, normalize_headline
+
+
+class NormalizeHeadlineTest(unittest.TestCase):
+    def test_drops_publisher_suffix_punctuation_and_case(self):
+        self.assertEqual(
+            normalize_headline("H2 Green Steel to build plant in Boden!  - Reuters"),
+            "h2 green steel to build plant in boden",
+        )
+
+
+class FindDuplicateClustersTest(unittest.TestCase):
+    def test_syndicated_copies_map_to_their_first_occurrence(self):
+        titles = pd.Series(
+            {
+                "a": "H2 Green Steel to build plant in Boden - Reuters",
+                "b": "Sports star buys watch - ESPN",
+                "c": "H2 Green Steel to build plant in Boden - Financial Times",
+                "d": "H2 Green Steel To Build Plant In Boden",
+            }
+        )
+
+        representatives = find_duplicate_clusters(titles)
+
+        self.assertEqual(representatives.to_dict(), {"a": "a", "b": "b", "c": "a", "d": "a"})
+
+    def test_different_stories_stay_apart(self):
+        titles = pd.Series(
+            [
+                "ArcelorMittal signs MoU for hydrogen DRI plant in Spain",
+                "ArcelorMittal cancels hydrogen DRI plant in Germany",
+                "Steel conference announced for next spring",
+            ]
+        )
+
+        representatives = find_duplicate_clusters(titles)
+
+        self.assertEqual(list(representatives), [0, 1, 2])
+
+    def test_threshold_decides_how_close_duplicates_must_be(self):
+        titles = pd.Series(["Thyssenkrupp orders electrolyser for Duisburg", "Thyssenkrupp orders new electrolyser for Duisburg"])
+
+        self.assertEqual(list(find_duplicate_clusters(titles, threshold=90)), [0, 0])
+        self.assertEqual(list(find_duplicate_clusters(titles, threshold=100)), [0, 1])
+
+    def test_empty_headlines_are_their_own_representatives(self):
+        titles = pd.Series(["", "", "Steel conference announced"])
+
+        self.assertEqual(list(find_duplicate_clusters(titles)), [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests of the processed-item ledger behind incremental runs: watermarks per folder, the ids to
+skip, and the re-emitted results of earlier runs.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import time
+import unittest
+import uuid
+
+# The caches live in the cache directory, which is read when utils.cache is first imported
+os.environ["LEADIT_CACHE_DIR"] = tempfile.mkdtemp(prefix="leadit_test_cache_")
+
+from utils.ledger import ProcessedLedger
+
+FOLDER = "LeadIT-Steel"
+
+
+def entry(item_id, bucket, published, **article):
+    return {"id": item_id, "bucket": bucket, "published": published, "article": {"id": item_id, **article}}
+
+
+class ProcessedLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.ledger = ProcessedLedger(fname=f"processed_items_{uuid.uuid4().hex}.sqlite")
+
+    def test_watermark_is_kept_per_folder_and_replaced_by_later_runs(self):
+        self.assertIsNone(self.ledger.get_watermark(FOLDER))
+
+        self.ledger.set_watermark(FOLDER, 1700000000.0)
+        self.ledger.set_watermark(FOLDER, 1700086400.0)
+
+        self.assertEqual(self.ledger.get_watermark(FOLDER), 1700086400.0)
+        self.assertIsNone(self.ledger.get_watermark("LeadIT-Iron"))
+
+    def test_processed_ids_are_kept_per_folder(self):
+        self.ledger.record(FOLDER, [entry(1, "relevant", 1700000000), entry("id2", "irrelevant", 1700000000)])
+
+        self.assertEqual(self.ledger.processed_ids(FOLDER), {"1", "id2"})
+        self.assertEqual(self.ledger.processed_ids("LeadIT-Iron"), set())
+
+    def test_prior_results_are_those_published_since(self):
+        self.ledger.record(FOLDER, [
+            entry("old", "relevant", 1600000000, title="Old plant"),
+            entry("new", "relevant", 1700000000, title="New plant"),
+            entry("rejected", "irrelevant", 1700000000, title="Sports"),
+            entry("excluded", "relevant", 1700000000, title="Reprocessed in this run"),
+            # Without a publication date the time it was recorded counts
+            entry("undated", "prefiltered", "not a date", title="Undated"),
+        ])
+
+        results = self.ledger.prior_results(FOLDER, since=1650000000, exclude_ids=["excluded"])
+
+        self.assertEqual([article["title"] for article in results["relevant"]], ["New plant"])
+        self.assertEqual([article["title"] for article in results["irrelevant"]], ["Sports"])
+        self.assertEqual([article["title"] for article in results["prefiltered"]], ["Undated"])
+        self.assertEqual(self.ledger.prior_results(FOLDER, since=time.time() + 60)["prefiltered"], [])
+
+    def test_duplicates_carry_a_representative_that_is_not_reemitted(self):
+        self.ledger.record(FOLDER, [
+            entry("rep", "relevant", 1600000000, title="H2 Green Steel to build plant in Boden", company="H2 Green Steel"),
+            entry("dup", "duplicate", 1700000000, title="H2 Green Steel to build plant in Boden", duplicate_of="rep"),
+        ])
+
+        results = self.ledger.prior_results(FOLDER, since=1650000000)
+
+        (duplicate,) = results["duplicate"]
+        self.assertEqual(duplicate["representative"]["bucket"], "relevant")
+        self.assertEqual(duplicate["representative"]["article"]["company"], "H2 Green Steel")
+        self.assertNotIn("representative", self.ledger.prior_results(FOLDER, since=0)["duplicate"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
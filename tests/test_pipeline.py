@@ -0,0 +1,116 @@
+"""
+Tests of the staged pipeline: items must come out in input order after every stage, an error
+in one item must not affect the others, and an error every item would hit aborts the run.
+
+Run with: python -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+
+from utils.pipeline import Stage, run_pipeline
+
+
+def add_stage_name(name, delay=None):
+    def fxn(item):
+        if delay:
+            time.sleep(delay(item))
+        item.setdefault("stages", []).append(name)
+        return item
+    return fxn
+
+
+class RunPipelineTest(unittest.TestCase):
+    def test_items_pass_every_stage_and_keep_their_order(self):
+        stages = [
+            # Later items finish the first stage sooner, so they overtake earlier ones
+            Stage("screen", add_stage_name("screen", lambda item: 0.01 * (5 - item["i"] % 5)), workers=4),
+            Stage("fetch", add_stage_name("fetch"), workers=2),
+        ]
+
+        items, stage_seconds = run_pipeline([{"i": i} for i in range(20)], stages, queue_size=2)
+
+        self.assertEqual([item["i"] for item in items], list(range(20)))
+        self.assertTrue(all(item["stages"] == ["screen", "fetch"] for item in items))
+        self.assertEqual(set(stage_seconds), {"screen", "fetch"})
+
+    def test_an_error_is_recorded_on_its_item_only(self):
+        def screen(item):
+            if item["i"] == 2:
+                raise ValueError("malformed headline")
+            return add_stage_name("screen")(item)
+
+        items, _ = run_pipeline(
+            [{"i": i} for i in range(5)], [Stage("screen", screen, workers=2), Stage("fetch", add_stage_name("fetch"))]
+        )
+
+        self.assertEqual(items[2]["errors"], {"screen": "malformed headline"})
+        self.assertEqual(items[2]["stages"], ["fetch"])
+        self.assertTrue(all("errors" not in item and item["stages"] == ["screen", "fetch"] for item in items if item["i"] != 2))
+
+    def test_callbacks_see_every_item_and_stage(self):
+        lock = threading.Lock()
+        done_items, done_stages = [], []
+
+        def on_stage_done(name, item):
+            with lock:
+                done_stages.append((name, item["i"]))
+
+        run_pipeline(
+            [{"i": i} for i in range(3)],
+            [Stage("screen", add_stage_name("screen"), workers=2), Stage("fetch", add_stage_name("fetch"))],
+            on_item_done=lambda item: done_items.append(item["i"]),
+            on_stage_done=on_stage_done,
+        )
+
+        self.assertEqual(sorted(done_items), [0, 1, 2])
+        self.assertEqual(sorted(done_stages), sorted((name, i) for name in ["screen", "fetch"] for i in range(3)))
+
+    def test_no_items(self):
+        self.assertEqual(run_pipeline([], [Stage("screen", add_stage_name("screen"))]), ([], {"screen": 0.0}))
+
+
+class OutageError(RuntimeError):
+    pass
+
+
+class RunPipelineAbortTest(unittest.TestCase):
+    def test_abort_on_error_stops_feeding_and_is_raised(self):
+        screened = []
+        lock = threading.Lock()
+
+        def screen(item):
+            with lock:
+                screened.append(item["i"])
+            if item["i"] == 3:
+                raise OutageError("API unavailable")
+            return item
+
+        fetched = []
+
+        with self.assertRaises(OutageError):
+            run_pipeline(
+                ({"i": i} for i in range(1000)),
+                [Stage("screen", screen), Stage("fetch", lambda item: fetched.append(item["i"]) or item)],
+                queue_size=2,
+                abort_on=(OutageError,),
+            )
+
+        # Items still in the pipeline after the error pass through without running their stages
+        self.assertEqual(screened, [0, 1, 2, 3])
+        self.assertLessEqual(set(fetched), {0, 1, 2})
+
+    def test_other_errors_do_not_abort(self):
+        def screen(item):
+            if item["i"] == 1:
+                raise ValueError("malformed headline")
+            return item
+
+        items, _ = run_pipeline([{"i": i} for i in range(3)], [Stage("screen", screen)], abort_on=(OutageError,))
+
+        self.assertEqual([item.get("errors") for item in items], [None, {"screen": "malformed headline"}, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
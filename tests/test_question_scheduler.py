@@ -0,0 +1,71 @@
+"""
+Tests of the question scheduler: exclusion questions must be ordered by hit rate per prompt
+token, learned from recorded outcomes and kept across runs.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+import uuid
+
+# The caches live in the cache directory, which is read when utils.cache is first imported
+os.environ["LEADIT_CACHE_DIR"] = tempfile.mkdtemp(prefix="leadit_test_cache_")
+
+from utils.question_scheduler import QuestionScheduler
+
+QUESTIONS = ["Is it about sports?", "Is it about a conference?", "Is it about stock markets?"]
+
+
+class QuestionSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.fname = f"question_stats_{uuid.uuid4().hex}.sqlite"
+        self.scheduler = QuestionScheduler("LeadIT-Steel", fname=self.fname)
+
+    def record(self, asked, triggered_by, tokens=100, times=1):
+        for _ in range(times):
+            self.scheduler.record(asked, triggered_by, {question: tokens for question in asked})
+
+    def test_unseen_questions_keep_their_order(self):
+        self.assertEqual(self.scheduler.order(QUESTIONS), QUESTIONS)
+
+    def test_questions_with_more_hits_come_first(self):
+        self.record(QUESTIONS, QUESTIONS[2], times=8)
+        self.record(QUESTIONS, "", times=2)
+
+        self.assertEqual(self.scheduler.order(QUESTIONS)[0], QUESTIONS[2])
+
+    def test_cheaper_questions_win_at_equal_hit_rates(self):
+        for question, tokens in zip(QUESTIONS, [300, 100, 200]):
+            self.record([question], "", tokens=tokens, times=4)
+
+        self.assertEqual(self.scheduler.order(QUESTIONS), [QUESTIONS[1], QUESTIONS[2], QUESTIONS[0]])
+
+    def test_questions_after_the_first_hit_are_not_counted_as_asked(self):
+        self.record(QUESTIONS, QUESTIONS[0])
+
+        stats = self.scheduler.stats()
+
+        self.assertEqual(set(stats), {QUESTIONS[0]})
+        self.assertEqual((stats[QUESTIONS[0]]["asked"], stats[QUESTIONS[0]]["hits"]), (1, 1))
+
+    def test_first_question_overrides_the_learned_order(self):
+        self.record(QUESTIONS, QUESTIONS[2], times=5)
+
+        self.assertEqual(self.scheduler.order(QUESTIONS, first_question=QUESTIONS[1])[0], QUESTIONS[1])
+
+    def test_saved_statistics_are_used_by_later_runs(self):
+        self.record(QUESTIONS, QUESTIONS[2], times=5)
+        self.scheduler.save()
+
+        later_run = QuestionScheduler("LeadIT-Steel", fname=self.fname)
+        other_folder = QuestionScheduler("LeadIT-Iron", fname=self.fname)
+
+        self.assertEqual(later_run.order(QUESTIONS)[0], QUESTIONS[2])
+        self.assertEqual(later_run.stats(), {})
+        self.assertEqual(other_folder.order(QUESTIONS), QUESTIONS)
+
+
+if __name__ == "__main__":
+    unittest.main()
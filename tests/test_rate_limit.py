@@ -0,0 +1,121 @@
+"""
+Tests of the token buckets that keep concurrent GPT calls within the account's per-minute limits,
+and of the adaptive limit on calls in flight. The clock is simulated, so the tests do not sleep.
+
+Run with: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from utils.rate_limit import AdaptiveConcurrency, RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic and time.sleep: sleeping advances the clock instantly.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple("utils.rate_limit.time", monotonic=self.clock.monotonic, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_starts_full(self):
+        bucket = TokenBucket(60)
+
+        self.assertEqual(bucket.acquire(60), 0.0)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_refills_at_the_per_minute_rate(self):
+        bucket = TokenBucket(60)
+        bucket.acquire(60)
+
+        self.clock.now += 10
+        self.assertEqual(bucket.acquire(10), 0.0)
+
+        # Empty again: 30 tokens at one per second take 30 seconds
+        self.assertAlmostEqual(bucket.acquire(30), 30.0)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 30.0)
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(60, capacity=20)
+        bucket.acquire(20)
+
+        self.clock.now += 600
+        bucket.acquire(20)
+
+        self.assertAlmostEqual(bucket.acquire(5), 5.0)
+
+    def test_requests_larger_than_capacity_pass_once_full(self):
+        bucket = TokenBucket(60, capacity=10)
+        bucket.acquire(5)
+
+        self.assertAlmostEqual(bucket.acquire(50), 5.0)
+        self.assertLess(bucket.available, 0)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple("utils.rate_limit.time", monotonic=self.clock.monotonic, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_waits_for_the_scarcer_of_requests_and_tokens(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6000)
+        limiter.acquire(6000)
+
+        # Requests are plentiful, but 100 tokens refill at 100 per second
+        self.assertAlmostEqual(limiter.acquire(100), 1.0)
+
+    def test_disabled_limits_never_wait(self):
+        limiter = RateLimiter()
+
+        self.assertEqual(limiter.acquire(10 ** 9), 0.0)
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+    def test_limit_starts_at_the_maximum_until_throttled(self):
+        concurrency = AdaptiveConcurrency(initial=8)
+
+        concurrency.set_maximum(32)
+
+        self.assertEqual(concurrency.limit, 32)
+
+    def test_learned_limit_is_kept_but_capped(self):
+        concurrency = AdaptiveConcurrency(initial=8)
+        concurrency.acquire()
+        concurrency.release(throttled=True)
+
+        concurrency.set_maximum(32)
+        self.assertEqual(concurrency.limit, 4)
+        concurrency.set_maximum(2)
+        self.assertEqual(concurrency.limit, 2)
+
+    def test_throttling_halves_and_success_grows_the_limit(self):
+        concurrency = AdaptiveConcurrency(initial=4, maximum=5)
+        for throttled in [True, False, False]:
+            concurrency.acquire()
+            concurrency.release(throttled)
+
+        self.assertAlmostEqual(concurrency.limit, 2 + 1 / 2 + 1 / 2.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+"""
+This module provides a small persistent key-value cache backed by SQLite.
+It is used to avoid paying twice for work whose result does not change between runs
+(e.g. GPT responses at temperature 0).
+
+Classes:
+- SQLiteCache: A content-addressed cache with age, entry-count and size based eviction,
+  hit/miss counters and a bypass switch.
+
+Functions:
+- get_cache_path: Returns the path of a cache file inside the cache directory.
+- hash_key: Builds a stable SHA-256 key from any JSON-serializable value.
+"""
+
+from contextlib import closing
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Caches live outside the repository so that they survive redeploys of the app
+CACHE_DIR = os.environ.get("LEADIT_CACHE_DIR", os.path.expanduser("~/.cache/leadit"))
+
+
+def get_cache_path(fname):
+    """
+    Returns the path of fname inside the cache directory, creating the directory if needed.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, fname)
+
+
+def hash_key(value):
+    """
+    Returns a SHA-256 hex digest of a JSON-serializable value.
+    Dictionaries are serialized with sorted keys so that equal values give equal keys.
+    """
+    serialized = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Persistent cache mapping string keys to JSON-serializable values.
+    Entries older than max_age_days are dropped; when the cache holds more than max_entries
+    entries or max_mb megabytes, the least recently used entries are dropped first.
+    Cache errors are logged and treated as misses so that they never interrupt a run.
+    """
+
+    def __init__(self, fname, max_entries=100000, max_mb=500, max_age_days=30, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self.writes_since_eviction = 0
+        try:
+            self.path = get_cache_path(fname)
+            with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self.evict()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Cache %s is unavailable, continuing without it: %s", fname, e)
+            self.path = None
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is missing, expired or the cache is bypassed.
+        """
+        if not self.enabled or not self.path:
+            return None
+        try:
+            with self._connect() as conn, conn:
+                row = conn.execute(
+                    "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                now = time.time()
+                if row is None or now - row[1] > self.max_age_seconds:
+                    self._count("misses")
+                    return None
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("Cache read failed: %s", e)
+            self._count("misses")
+            return None
+
+    def contains(self, key):
+        """
+        Returns True if an unexpired value is cached for key, without counting a hit or miss or
+        refreshing the entry. False if the cache is bypassed.
+        """
+        if not self.enabled or not self.path:
+            return False
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache read failed: %s", e)
+            return False
+        return row is not None and time.time() - row[0] <= self.max_age_seconds
+
+    def set(self, key, value):
+        """
+        Stores value under key. Does nothing if the cache is bypassed.
+        """
+        if not self.enabled or not self.path:
+            return
+        serialized = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        try:
+            with self._connect() as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, serialized, len(serialized.encode("utf-8")), now, now),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Cache write failed: %s", e)
+            return
+        self._count("writes")
+        with self.lock:
+            self.writes_since_eviction += 1
+            run_eviction = self.writes_since_eviction >= 100
+            if run_eviction:
+                self.writes_since_eviction = 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then least recently used entries until the
+        entry-count and size limits are met.
+        """
+        if not self.path:
+            return
+        try:
+            with self._connect() as conn, conn:
+                evicted = conn.execute(
+                    "DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                ).rowcount
+                num_entries, total_bytes = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+                ).fetchone()
+                if num_entries > self.max_entries or total_bytes > self.max_bytes:
+                    excess_entries = max(0, num_entries - self.max_entries)
+                    excess_bytes = max(0, total_bytes - self.max_bytes)
+                    freed_bytes = 0
+                    stale_keys = []
+                    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+                        if len(stale_keys) >= excess_entries and freed_bytes >= excess_bytes:
+                            break
+                        stale_keys.append((key,))
+                        freed_bytes += size
+                    conn.executemany("DELETE FROM entries WHERE key = ?", stale_keys)
+                    evicted += len(stale_keys)
+        except sqlite3.Error as e:
+            logger.warning("Cache eviction failed: %s", e)
+            return
+        if evicted:
+            self._count("evictions", evicted)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        if not self.path:
+            return
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM entries")
+
+    def stats(self):
+        """
+        Returns the hit/miss/write/eviction counters and the hit rate since the process started.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
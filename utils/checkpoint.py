@@ -0,0 +1,148 @@
+"""
+This module checkpoints the outcome of every pipeline stage of every article while a run is in
+progress, so that a run interrupted by an exception, a browser refresh or a Streamlit rerun can
+be resumed without paying again for the work already done.
+
+Classes:
+- RunCheckpoint: SQLite-backed per-article stage checkpoints of one run of a folder.
+"""
+
+from contextlib import closing
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+from utils.cache import get_cache_path, hash_key
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """
+    Stores, for one run of a folder, the values each stage produced for each article.
+    Every checkpoint is written in its own transaction as soon as the stage finishes.
+
+    With resume=True, the last unfinished run of the folder is continued and its checkpoints are
+    available through get(), provided it was started with the same fingerprint (e.g. a hash of the
+    settings that decide the stages' outcomes); otherwise a new run is started and unfinished runs
+    of the folder are discarded. finish() marks the run as complete and drops its checkpoints.
+    """
+
+    def __init__(self, folder, resume=True, fname="checkpoints.sqlite", fingerprint=None):
+        self.folder = folder
+        self.path = get_cache_path(fname)
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id TEXT PRIMARY KEY, folder TEXT NOT NULL, started_at REAL NOT NULL, finished_at REAL, "
+                "fingerprint TEXT)"
+            )
+            if "fingerprint" not in {column[1] for column in conn.execute("PRAGMA table_info(runs)")}:
+                # Checkpoint files written before runs had a fingerprint
+                conn.execute("ALTER TABLE runs ADD COLUMN fingerprint TEXT")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "run_id TEXT NOT NULL, item_id TEXT NOT NULL, stage TEXT NOT NULL, value TEXT NOT NULL, "
+                "saved_at REAL NOT NULL, PRIMARY KEY (run_id, item_id, stage))"
+            )
+            row = conn.execute(
+                "SELECT run_id, fingerprint FROM runs WHERE folder = ? AND finished_at IS NULL "
+                "ORDER BY started_at DESC LIMIT 1",
+                (folder,),
+            ).fetchone()
+            if resume and row and row[1] != fingerprint:
+                logger.info("Not resuming run %s of %s, which was started with different settings", row[0], folder)
+            if resume and row and row[1] == fingerprint:
+                self.run_id = row[0]
+            else:
+                self._discard_unfinished(conn)
+                self.run_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO runs (run_id, folder, started_at, fingerprint) VALUES (?, ?, ?, ?)",
+                    (self.run_id, folder, time.time(), fingerprint),
+                )
+            rows = conn.execute(
+                "SELECT item_id, stage, value FROM checkpoints WHERE run_id = ?", (self.run_id,)
+            ).fetchall()
+        self.completed = {}
+        for item_id, stage, value in rows:
+            self.completed.setdefault(item_id, {})[stage] = json.loads(value)
+        if self.completed:
+            logger.info("Resuming run %s of %s with %s checkpointed articles", self.run_id, folder, len(self.completed))
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _discard_unfinished(self, conn):
+        conn.execute(
+            "DELETE FROM checkpoints WHERE run_id IN (SELECT run_id FROM runs WHERE folder = ? AND finished_at IS NULL)",
+            (self.folder,),
+        )
+        conn.execute("DELETE FROM runs WHERE folder = ? AND finished_at IS NULL", (self.folder,))
+
+    @staticmethod
+    def item_key(article):
+        """
+        Returns the key of an article's checkpoints: its id together with a hash of its feed URL
+        (or title), since feeds without item ids give every item the same placeholder id.
+        """
+        return f"{article['id']}|{hash_key(article.get('feed_url') or article.get('title', ''))[:16]}"
+
+    def get(self, item_id, stage):
+        """
+        Returns the checkpointed values of stage for an article, or None.
+        """
+        return self.completed.get(str(item_id), {}).get(stage)
+
+    def save(self, item_id, stage, value):
+        """
+        Checkpoints the values (a JSON-serializable dict) a stage produced for an article.
+        """
+        with self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (run_id, item_id, stage, value, saved_at) VALUES (?, ?, ?, ?, ?)",
+                (self.run_id, str(item_id), stage, json.dumps(value, ensure_ascii=False, default=str), time.time()),
+            )
+
+    def checkpointed(self, stage_name, fxn, keys, fingerprint_fxn=None, failed_fxn=None):
+        """
+        Wraps a pipeline stage function (see utils.pipeline.Stage) so that articles with a
+        checkpoint for the stage get its values back instead of running the stage again, and the
+        values of other articles are checkpointed once the stage succeeds. Articles are keyed by
+        item_key. A stage that raised, set none of keys or failed by failed_fxn is not
+        checkpointed, so a resumed run tries it again.
+
+        Args:
+            keys: The article keys the stage sets.
+            fingerprint_fxn: Optional function of the article whose value must equal the one
+                checkpointed with the stage for the checkpoint to be used, e.g. a hash of the
+                article text the stage worked on.
+            failed_fxn: Optional function of the article that returns True if the stage failed
+                without raising, e.g. a link resolution that fell back to the feed URL.
+        """
+        def run_stage(article):
+            saved = self.get(self.item_key(article), stage_name)
+            fingerprint = fingerprint_fxn(article) if fingerprint_fxn else None
+            if saved is not None and saved.get("fingerprint") == fingerprint:
+                article.update({key: saved[key] for key in keys if key in saved})
+                article.setdefault("resumed_stages", []).append(stage_name)
+                return article
+            article = fxn(article)
+            values = {key: article[key] for key in keys if key in article}
+            if not values or (failed_fxn and failed_fxn(article)):
+                return article
+            self.save(self.item_key(article), stage_name, {**values, "fingerprint": fingerprint})
+            return article
+        return run_stage
+
+    def finish(self):
+        """
+        Marks the run as complete; its checkpoints are no longer needed.
+        """
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (self.run_id,))
+            conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
@@ -0,0 +1,203 @@
+"""
+This module learns from the screening verdicts of earlier runs. Every headline screened by GPT is
+stored with its verdict, and a TF-IDF + logistic regression model is trained per folder from them.
+Headlines the model is very sure are irrelevant are rejected without a GPT call; all others are
+still screened by GPT.
+
+Classes:
+- VerdictStore: SQLite store of GPT screening verdicts, per folder.
+- HeadlineClassifier: Per-folder TF-IDF + logistic regression model with a held-out accuracy report.
+
+Functions:
+- retrain_classifiers: Retrains and saves the model of each folder and returns their reports.
+
+Usage:
+Run "python -m utils.classifier retrain [--folder LeadIT-Steel]" to retrain the models.
+"""
+
+import argparse
+from contextlib import closing
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+
+from utils.cache import get_cache_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FOLDERS = ["LeadIT-Steel", "LeadIT-Iron", "LeadIT-Cement"]
+# Below this many verdicts, or this many of either kind, a folder's model is not trained
+MIN_TRAINING_EXAMPLES = 200
+MIN_EXAMPLES_PER_CLASS = 10
+
+
+class VerdictStore:
+    """
+    Keeps the latest GPT screening verdict of every headline, per folder.
+    """
+
+    def __init__(self, fname="verdicts.sqlite"):
+        self.path = get_cache_path(fname)
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "folder TEXT NOT NULL, item_id TEXT NOT NULL, headline TEXT NOT NULL, "
+                "irrelevant INTEGER NOT NULL, triggered_by TEXT NOT NULL, recorded_at REAL NOT NULL, "
+                "PRIMARY KEY (folder, item_id))"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def record(self, folder, examples):
+        """
+        Stores screening verdicts in one transaction.
+
+        Args:
+            examples: An iterable of dicts with keys "id", "headline", "irrelevant" (bool) and "triggered_by".
+        """
+        now = time.time()
+        rows = [
+            (folder, str(example["id"]), example["headline"], int(example["irrelevant"]), example.get("triggered_by") or "", now)
+            for example in examples
+        ]
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (folder, item_id, headline, irrelevant, triggered_by, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        logger.info("Recorded %s screening verdicts for %s", len(rows), folder)
+
+    def load(self, folder):
+        """
+        Returns the verdicts of folder as a DataFrame with columns headline, irrelevant and triggered_by.
+        """
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT headline, irrelevant, triggered_by FROM verdicts WHERE folder = ?", conn, params=(folder,)
+            )
+
+
+class HeadlineClassifier:
+    """
+    Predicts the probability that a headline is irrelevant for a folder.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, strip_accents="unicode"),
+            LogisticRegression(class_weight="balanced", max_iter=1000),
+        )
+        self.report = {}
+
+    @staticmethod
+    def get_model_path(folder):
+        return get_cache_path(f"classifier_{folder}.pkl")
+
+    def train(self, verdicts, threshold=0.97, test_size=0.2):
+        """
+        Measures accuracy on a held-out split of verdicts, then refits the model on all of them.
+
+        Args:
+            verdicts: A DataFrame with "headline" and "irrelevant" columns (see VerdictStore.load).
+            threshold: Probability of irrelevance above which a headline would be auto-rejected.
+
+        Returns:
+            dict: The held-out report: number of examples, accuracy, and the share of held-out
+            headlines auto-rejected at threshold with the precision of those rejections.
+        """
+        headlines, labels = verdicts["headline"].tolist(), verdicts["irrelevant"].astype(int).to_numpy()
+        train_headlines, test_headlines, train_labels, test_labels = train_test_split(
+            headlines, labels, test_size=test_size, random_state=42, stratify=labels
+        )
+        self.model.fit(train_headlines, train_labels)
+        test_probs = self.model.predict_proba(test_headlines)[:, 1]
+        rejected = test_probs >= threshold
+        self.report = {
+            "folder": self.folder,
+            "trained_at": time.time(),
+            "examples": len(headlines),
+            "irrelevant_share": float(labels.mean()),
+            "held_out": len(test_headlines),
+            "held_out_accuracy": float(((test_probs >= 0.5) == test_labels).mean()),
+            "threshold": threshold,
+            "auto_reject_rate": float(rejected.mean()),
+            "auto_reject_precision": float(test_labels[rejected].mean()) if rejected.any() else None,
+        }
+        self.model.fit(headlines, labels)
+        return self.report
+
+    def predict_irrelevant(self, headlines):
+        """
+        Returns the probability that each headline is irrelevant, as a NumPy array.
+        """
+        if len(headlines) == 0:
+            return np.array([])
+        return self.model.predict_proba(list(headlines))[:, 1]
+
+    def save(self):
+        with open(self.get_model_path(self.folder), "wb") as f:
+            pickle.dump({"model": self.model, "report": self.report}, f)
+
+    @classmethod
+    def load(cls, folder):
+        """
+        Returns the saved classifier of folder, or None if it has not been trained yet.
+        """
+        path = cls.get_model_path(folder)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        classifier = cls(folder)
+        classifier.model, classifier.report = saved["model"], saved["report"]
+        return classifier
+
+
+def retrain_classifiers(folders=FOLDERS, threshold=0.97, store=None):
+    """
+    Retrains the classifier of each folder from the stored verdicts and saves it with its report.
+    Folders with too few verdicts of either kind are skipped.
+
+    Returns:
+        dict: Maps each folder to its held-out report, or to the reason it was skipped.
+    """
+    store = store or VerdictStore()
+    reports = {}
+    for folder in folders:
+        verdicts = store.load(folder)
+        class_counts = verdicts["irrelevant"].value_counts()
+        if len(verdicts) < MIN_TRAINING_EXAMPLES or len(class_counts) < 2 or class_counts.min() < MIN_EXAMPLES_PER_CLASS:
+            reports[folder] = {
+                "skipped": f"{len(verdicts)} verdicts; at least {MIN_TRAINING_EXAMPLES} with "
+                f"{MIN_EXAMPLES_PER_CLASS} of each kind are needed"
+            }
+            continue
+        classifier = HeadlineClassifier(folder)
+        reports[folder] = classifier.train(verdicts, threshold)
+        classifier.save()
+        logger.info("Retrained classifier for %s: %s", folder, reports[folder])
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the local headline classifiers from past GPT verdicts.")
+    parser.add_argument("command", choices=["retrain"])
+    parser.add_argument("--folder", action="append", help="Folder to retrain (default: all folders)")
+    parser.add_argument("--threshold", type=float, default=0.97, help="Auto-reject threshold for the report")
+    args = parser.parse_args()
+    print(json.dumps(retrain_classifiers(args.folder or FOLDERS, args.threshold), indent=2))
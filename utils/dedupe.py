@@ -0,0 +1,94 @@
+"""
+This module groups near-identical headlines (e.g. the same press release syndicated by several
+publishers) so that only one representative per group is screened and extracted.
+
+Candidate pairs are found with MinHash locality-sensitive hashing on character shingles, which
+avoids comparing every pair of headlines; candidates are then confirmed with rapidfuzz.
+
+Functions:
+- normalize_headline: Normalizes a headline before comparison.
+- find_duplicate_clusters: Maps every headline to the representative of its cluster.
+"""
+
+import re
+import string
+import zlib
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+
+# 32 bands of 4 rows: pairs with a shingle Jaccard similarity above ~0.4 are very likely compared
+NUM_BANDS = 32
+ROWS_PER_BAND = 4
+SHINGLE_SIZE = 5
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(seed=42)
+_HASH_A = _rng.integers(1, _PRIME, size=NUM_BANDS * ROWS_PER_BAND, dtype=np.int64)
+_HASH_B = _rng.integers(0, _PRIME, size=NUM_BANDS * ROWS_PER_BAND, dtype=np.int64)
+
+
+def normalize_headline(title):
+    """
+    Drops the " - Publisher" suffix, punctuation, case and extra whitespace from a headline.
+    """
+    title = str(title).split(" - ")[0]
+    title = title.lower().translate(str.maketrans("", "", string.punctuation))
+    return re.sub(r"\s+", " ", title).strip()
+
+
+def _minhash_signature(text):
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles], dtype=np.int64)
+    # (a * h + b) mod p for every hash function at once; values stay below 2^62
+    return ((np.outer(hashes, _HASH_A) + _HASH_B) % _PRIME).min(axis=0)
+
+
+def find_duplicate_clusters(titles, threshold=90):
+    """
+    Clusters near-identical headlines.
+
+    Args:
+        titles: A pandas Series of headlines.
+        threshold: Minimum rapidfuzz token_sort_ratio (0-100) for two headlines to be duplicates.
+
+    Returns:
+        pd.Series: For every headline (same index as titles), the index of the representative of
+        its cluster, i.e. its first occurrence. Representatives map to themselves.
+    """
+    labels = list(titles.index)
+    normalized = [normalize_headline(title) for title in titles]
+    parent = list(range(len(labels)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            # Keep the earliest headline as the root so it becomes the representative
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    buckets = {}
+    for i, text in enumerate(normalized):
+        if not text:
+            continue
+        signature = _minhash_signature(text)
+        for band in range(NUM_BANDS):
+            band_key = (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            buckets.setdefault(band_key, []).append(i)
+
+    compared = set()
+    for members in buckets.values():
+        for pos, i in enumerate(members):
+            for j in members[pos + 1:]:
+                if (i, j) in compared or find(i) == find(j):
+                    continue
+                compared.add((i, j))
+                if fuzz.token_sort_ratio(normalized[i], normalized[j]) >= threshold:
+                    union(i, j)
+
+    return pd.Series([labels[find(i)] for i in range(len(labels))], index=titles.index)
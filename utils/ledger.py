@@ -0,0 +1,161 @@
+"""
+This module keeps a persistent ledger of the Inoreader items processed by previous runs.
+It lets a run fetch only the items that arrived since the last successful run (its watermark),
+skip items that were already processed, and re-emit earlier results into the new workbook.
+
+Classes:
+- ProcessedLedger: SQLite-backed ledger of processed items and per-folder watermarks.
+"""
+
+from contextlib import closing
+import json
+import logging
+import sqlite3
+import time
+
+from utils.cache import get_cache_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ProcessedLedger:
+    """
+    Records, per folder and Inoreader item id, the outcome of each stage of a run
+    (screening verdict, resolved URL, extraction) and the article as written to the workbook.
+    """
+
+    def __init__(self, fname="processed_items.sqlite"):
+        self.path = get_cache_path(fname)
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "folder TEXT NOT NULL, item_id TEXT NOT NULL, bucket TEXT NOT NULL, "
+                "stages TEXT NOT NULL, article TEXT NOT NULL, published REAL, recorded_at REAL NOT NULL, "
+                "PRIMARY KEY (folder, item_id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks (folder TEXT PRIMARY KEY, last_run_started REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def get_watermark(self, folder):
+        """
+        Returns the start time (Unix timestamp) of the last successful run for folder, or None.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT last_run_started FROM watermarks WHERE folder = ?", (folder,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, folder, run_started):
+        """
+        Marks the run that started at run_started as the last successful run for folder.
+        """
+        with self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO watermarks (folder, last_run_started) VALUES (?, ?)",
+                (folder, run_started),
+            )
+
+    def processed_ids(self, folder):
+        """
+        Returns the set of item ids already processed for folder.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT item_id FROM items WHERE folder = ?", (folder,)).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, folder, entries):
+        """
+        Stores the outcome of processed items in one transaction.
+
+        Args:
+            folder: The Inoreader folder the items belong to.
+            entries: An iterable of dicts with keys "id", "bucket" ("relevant", "irrelevant",
+                "duplicate" or "prefiltered"), "stages" (dict of stage outcomes), "article" (the article dict written
+                to the workbook) and optionally "published" (Unix timestamp).
+        """
+        now = time.time()
+        rows = []
+        for entry in entries:
+            published = entry.get("published")
+            try:
+                published = float(published)
+            except (TypeError, ValueError):
+                published = None
+            rows.append((
+                folder,
+                str(entry["id"]),
+                entry["bucket"],
+                json.dumps(entry.get("stages", {}), ensure_ascii=False),
+                json.dumps(entry["article"], ensure_ascii=False, default=str),
+                published,
+                now,
+            ))
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO items (folder, item_id, bucket, stages, article, published, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        logger.info("Recorded %s processed items for %s", len(rows), folder)
+
+    def prior_results(self, folder, since, exclude_ids=()):
+        """
+        Returns the results of items processed by earlier runs that were published
+        (or, if the publication date is unknown, recorded) after since.
+
+        Returns:
+            dict: Maps each bucket ("relevant", "irrelevant", "duplicate", "prefiltered") to a list of
+            article dicts. Duplicates whose representative is not among them carry its outcome as
+            "representative" (see get_results).
+        """
+        results = {"relevant": [], "irrelevant": [], "duplicate": [], "prefiltered": []}
+        exclude_ids = set(exclude_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT item_id, bucket, article FROM items "
+                "WHERE folder = ? AND COALESCE(published, recorded_at) >= ?",
+                (folder, since),
+            ).fetchall()
+        emitted_ids = set(exclude_ids)
+        for item_id, bucket, article in rows:
+            if item_id in exclude_ids:
+                continue
+            results.setdefault(bucket, []).append(json.loads(article))
+            emitted_ids.add(item_id)
+        # A near-duplicate's representative may have been published before since; attach its
+        # outcome so the workbook can still show it (see utils.results.output_results_excel)
+        missing_ids = {
+            str(article.get("duplicate_of")) for article in results["duplicate"]
+            if str(article.get("duplicate_of")) not in emitted_ids
+        }
+        if missing_ids:
+            representatives = self.get_results(folder, missing_ids)
+            for article in results["duplicate"]:
+                representative = representatives.get(str(article.get("duplicate_of")))
+                if representative:
+                    article["representative"] = representative
+        return results
+
+    def get_results(self, folder, item_ids):
+        """
+        Returns the outcome of the given items of a folder, whenever they were processed.
+
+        Returns:
+            dict: Maps the id of each item found to a dict with its "bucket" and "article".
+        """
+        item_ids = [str(item_id) for item_id in item_ids]
+        if not item_ids:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT item_id, bucket, article FROM items WHERE folder = ? AND item_id IN ({', '.join('?' * len(item_ids))})",
+                (folder, *item_ids),
+            ).fetchall()
+        return {item_id: {"bucket": bucket, "article": json.loads(article)} for item_id, bucket, article in rows}
@@ -0,0 +1,204 @@
+"""
+This module collects the metrics of one run of the pipeline: how long each stage took, the
+OpenAI calls made (per model and per label, e.g. per screening question) with their token usage,
+latency and estimated cost, and the hit rates of the caches. The run writes them as a JSON report
+next to its workbook and the Streamlit app shows a summary.
+
+Classes:
+- RunMetrics: Thread-safe stage timers, OpenAI call records and cache counters of one run.
+
+Functions:
+- percentile: Returns a percentile of a list of numbers.
+- estimate_cost: Estimates the price in USD of the tokens of one model.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+# USD per million tokens: (input, cached input, output). An estimate for the report only; check
+# https://openai.com/api/pricing when prices change. Models not listed are reported without a cost.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+}
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which fraction (between 0 and 1) of values lie, interpolating
+    between neighbouring values; None for an empty list.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    """
+    Returns the estimated price in USD of the tokens of one model, or None if its price is unknown.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    ) / 1_000_000
+
+
+class RunMetrics:
+    """
+    The metrics of one run. Stage timers and counters are updated from the pipeline's worker
+    threads; record_call is registered as an observer of the OpenAI call layer for the duration
+    of the run (see services.openai_calls.OpenAICallLayer.observe), so it sees every call made
+    in the process meanwhile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.stage_seconds = {}
+        # (label, model) -> {"latencies": [...], "prompt_tokens": n, "cached_tokens": n, "completion_tokens": n}
+        self.calls = {}
+        self.cache_stats_at_start = {}
+        self.caches = {}
+        self.cache_counts = {}
+        self.counts = {}
+        # section -> key -> JSON-serializable values, e.g. "questions" -> folder -> statistics per question
+        self.sections = {}
+
+    def add_seconds(self, stage_name, seconds):
+        with self.lock:
+            self.stage_seconds[stage_name] = self.stage_seconds.get(stage_name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage_name):
+        """
+        Adds the time spent in the with block to stage_name.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_seconds(stage_name, time.time() - start)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def add_section(self, section, key, values):
+        """
+        Reports values (JSON-serializable) under report[section][key], e.g. the statistics per
+        screening question of one folder under report["questions"][folder].
+        """
+        with self.lock:
+            self.sections.setdefault(section, {})[key] = values
+
+    def record_call(self, label, model, seconds, usage):
+        """
+        Records one successful OpenAI call that took seconds, with the usage field of its response.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        with self.lock:
+            call = self.calls.setdefault(
+                (label, model), {"latencies": [], "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+            )
+            call["latencies"].append(seconds)
+            call["prompt_tokens"] += prompt_tokens
+            call["cached_tokens"] += cached_tokens
+            call["completion_tokens"] += completion_tokens
+
+    def watch_cache(self, name, cache):
+        """
+        Reports the hits and misses of cache (a utils.cache.SQLiteCache) from now until the
+        report, under name. Watching the same name again keeps the first starting point.
+        """
+        with self.lock:
+            if name not in self.caches:
+                self.caches[name] = cache
+                self.cache_stats_at_start[name] = cache.stats()
+
+    def add_cache_counts(self, name, hits, lookups):
+        """
+        Adds hits and lookups of a cache that keeps no counters itself (e.g. the semantic verdict cache).
+        """
+        with self.lock:
+            counts = self.cache_counts.setdefault(name, {"hits": 0, "lookups": 0})
+            counts["hits"] += hits
+            counts["lookups"] += lookups
+
+    def _cache_report(self):
+        report = {}
+        for name, cache in self.caches.items():
+            stats, start = cache.stats(), self.cache_stats_at_start[name]
+            hits, misses = stats["hits"] - start["hits"], stats["misses"] - start["misses"]
+            report[name] = {"hits": hits, "lookups": hits + misses}
+        for name, counts in self.cache_counts.items():
+            report[name] = dict(counts)
+        for counts in report.values():
+            counts["hit_rate"] = round(counts["hits"] / counts["lookups"], 3) if counts["lookups"] else None
+        return report
+
+    def report(self, **extras):
+        """
+        Returns the metrics as a JSON-serializable dict: wall-clock seconds per stage, the OpenAI
+        calls per label with latency percentiles, the tokens and estimated cost per model, totals,
+        cache hit rates, counters, the sections added with add_section and extras (e.g. the folder
+        and the OpenAI call layer's retries).
+        """
+        with self.lock:
+            sections = {section: dict(values) for section, values in self.sections.items()}
+            calls = {key: dict(call, latencies=list(call["latencies"])) for key, call in self.calls.items()}
+            stage_seconds = {name: round(seconds, 2) for name, seconds in self.stage_seconds.items()}
+            counts = dict(self.counts)
+            caches = self._cache_report()
+        labels, models = {}, {}
+        for (label, model), call in calls.items():
+            by_label = labels.setdefault(label, {"latencies": [], "prompt_tokens": 0, "completion_tokens": 0})
+            by_label["latencies"].extend(call["latencies"])
+            by_label["prompt_tokens"] += call["prompt_tokens"]
+            by_label["completion_tokens"] += call["completion_tokens"]
+            tokens = models.setdefault(model, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+            tokens["calls"] += len(call["latencies"])
+            for key in ["prompt_tokens", "cached_tokens", "completion_tokens"]:
+                tokens[key] += call[key]
+        for model, tokens in models.items():
+            cost = estimate_cost(model, tokens["prompt_tokens"], tokens["cached_tokens"], tokens["completion_tokens"])
+            tokens["cost_usd"] = round(cost, 4) if cost is not None else None
+        costs = [tokens["cost_usd"] for tokens in models.values() if tokens["cost_usd"] is not None]
+        return {
+            **extras,
+            "started_at": self.started_at,
+            "total_seconds": round(time.time() - self.started_at, 2),
+            "stage_seconds": stage_seconds,
+            "totals": {
+                "calls": sum(tokens["calls"] for tokens in models.values()),
+                "prompt_tokens": sum(tokens["prompt_tokens"] for tokens in models.values()),
+                "completion_tokens": sum(tokens["completion_tokens"] for tokens in models.values()),
+                "cost_usd": round(sum(costs), 4),
+            },
+            "models": models,
+            "calls": {
+                label: {
+                    "calls": len(call["latencies"]),
+                    "prompt_tokens": call["prompt_tokens"],
+                    "completion_tokens": call["completion_tokens"],
+                    "latency_p50": round(percentile(call["latencies"], 0.5), 3),
+                    "latency_p90": round(percentile(call["latencies"], 0.9), 3),
+                    "latency_p99": round(percentile(call["latencies"], 0.99), 3),
+                }
+                for label, call in sorted(labels.items(), key=lambda item: -len(item[1]["latencies"]))
+            },
+            "caches": caches,
+            "counts": counts,
+            **sections,
+        }
@@ -0,0 +1,140 @@
+"""
+This module runs items through a sequence of stages connected by bounded queues.
+Every stage has its own pool of worker threads, so network-bound stages (e.g. resolving a URL
+for one article while downloading another) overlap, and a full queue blocks the stage feeding
+it (backpressure) instead of piling up work in memory.
+
+Classes:
+- Stage: A named step of the pipeline with its function and worker count.
+
+Functions:
+- run_pipeline: Runs items through the stages and returns them in their original order.
+"""
+
+from dataclasses import dataclass
+import logging
+import queue
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    A step of the pipeline. fxn takes an item (a dict) and returns the updated item.
+    """
+
+    name: str
+    fxn: object
+    workers: int = 1
+
+
+def run_pipeline(items, stages, queue_size=16, on_item_done=None, on_stage_done=None, abort_on=()):
+    """
+    Runs every item through every stage, in order.
+
+    An exception in a stage is logged and recorded in the item's "errors" dict under the stage
+    name; the item then continues through the remaining stages unchanged, so a single bad
+    article never stalls or aborts the run. An exception of a type in abort_on instead aborts the
+    run: no further items are fed, the items already in the pipeline pass through the remaining
+    stages without running them, and the exception is raised once the workers have stopped.
+
+    Args:
+        items: An iterable of dicts.
+        stages: A list of Stage objects.
+        queue_size: Capacity of the queue in front of each stage.
+        on_item_done: Optional callback called with each item as it leaves the last stage.
+        on_stage_done: Optional callback called with the stage name and the item each time a
+            stage is done with an item (also if it failed), from the stage's worker thread.
+        abort_on: Exception types that abort the run, e.g. an unavailable API every later item
+            would fail on as well.
+
+    Returns:
+        tuple: (items, stage_seconds) where items are the processed items in input order and
+        stage_seconds maps each stage name to the total time its workers spent on items.
+
+    Raises:
+        Exception: The first exception of a type in abort_on raised by a stage.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    stage_seconds = {stage.name: 0.0 for stage in stages}
+    lock = threading.Lock()
+    remaining_workers = [max(1, stage.workers) for stage in stages]
+    aborted = threading.Event()
+    abort_errors = []
+
+    def worker(stage_num):
+        stage = stages[stage_num]
+        in_queue, out_queue = queues[stage_num], queues[stage_num + 1]
+        while True:
+            entry = in_queue.get()
+            if entry is _DONE:
+                with lock:
+                    remaining_workers[stage_num] -= 1
+                    last_worker = remaining_workers[stage_num] == 0
+                if last_worker:
+                    # Let the next stage know that no more items are coming
+                    next_workers = max(1, stages[stage_num + 1].workers) if stage_num + 1 < len(stages) else 1
+                    for _ in range(next_workers):
+                        out_queue.put(_DONE)
+                return
+            position, item = entry
+            if aborted.is_set():
+                out_queue.put((position, item))
+                continue
+            start = time.time()
+            try:
+                item = stage.fxn(item)
+            except Exception as e:
+                logger.exception("Stage %s failed for item %s", stage.name, position)
+                item.setdefault("errors", {})[stage.name] = str(e)
+                if isinstance(e, tuple(abort_on)):
+                    with lock:
+                        abort_errors.append(e)
+                    aborted.set()
+            with lock:
+                stage_seconds[stage.name] += time.time() - start
+            if on_stage_done:
+                on_stage_done(stage.name, item)
+            out_queue.put((position, item))
+
+    threads = [
+        threading.Thread(target=worker, args=(stage_num,), daemon=True)
+        for stage_num, stage in enumerate(stages)
+        for _ in range(max(1, stage.workers))
+    ]
+    for thread in threads:
+        thread.start()
+
+    def feed():
+        for position, item in enumerate(items):
+            if aborted.is_set():
+                break
+            queues[0].put((position, item))
+        for _ in range(max(1, stages[0].workers) if stages else 1):
+            queues[0].put(_DONE)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    results = {}
+    while True:
+        entry = queues[-1].get()
+        if entry is _DONE:
+            break
+        position, item = entry
+        results[position] = item
+        if on_item_done:
+            on_item_done(item)
+    feeder.join()
+    for thread in threads:
+        thread.join()
+    if abort_errors:
+        logger.error("Pipeline aborted after %s items: %s", len(results), abort_errors[0])
+        raise abort_errors[0]
+    return [results[position] for position in sorted(results)], stage_seconds
@@ -0,0 +1,114 @@
+"""
+This module drops headlines that are clearly outside the relevant region before they reach GPT.
+Headlines, exclusion questions and positive exemplars are embedded in batched calls, and every
+headline is scored against every reference text with one matrix product of normalized embeddings.
+
+Functions:
+- score_headlines: Scores headlines against the exclusion questions and the positive exemplars.
+- prefilter_headlines: Splits headlines into those to screen with GPT and those dropped by the prefilter.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.relevant_excerpts import embed_fields, embed_texts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def score_headlines(openai_client, headlines, exclusion_questions, positive_exemplars, headline_embeddings=None):
+    """
+    Computes the cosine similarity of each headline to its closest exclusion question and to its
+    closest positive exemplar.
+
+    Args:
+        headlines: A list of headline texts.
+        exclusion_questions: The exclusion questions of the folder (e.g. STEEL_NO).
+        positive_exemplars: Texts describing relevant headlines (e.g. STEEL_YES).
+        headline_embeddings: Optional embeddings of headlines, if the caller already has them.
+
+    Returns:
+        pd.DataFrame: One row per headline with columns "positive_score", "exclusion_score" and
+        "closest_question".
+    """
+    references = list(exclusion_questions) + list(positive_exemplars)
+    # Reference texts are the same on every run, so they are embedded once per process
+    reference_embeddings = embed_fields(openai_client, {text: text for text in references})
+    reference_matrix = _normalize_rows(np.array([reference_embeddings[text] for text in references]))
+    if headline_embeddings is None:
+        headline_embeddings = embed_texts(openai_client, list(headlines))
+    headline_matrix = _normalize_rows(np.array(headline_embeddings))
+    similarities = headline_matrix @ reference_matrix.T
+
+    exclusion_scores = similarities[:, :len(exclusion_questions)]
+    positive_scores = similarities[:, len(exclusion_questions):]
+    closest = exclusion_scores.argmax(axis=1) if len(exclusion_questions) else np.zeros(len(headlines), dtype=int)
+    return pd.DataFrame({
+        "positive_score": positive_scores.max(axis=1) if len(positive_exemplars) else np.ones(len(headlines)),
+        "exclusion_score": exclusion_scores.max(axis=1) if len(exclusion_questions) else np.zeros(len(headlines)),
+        "closest_question": [exclusion_questions[i] if len(exclusion_questions) else "" for i in closest],
+    })
+
+
+def prefilter_headlines(
+    openai_client,
+    headlines_df,
+    exclusion_questions,
+    positive_exemplars,
+    min_positive_score=0.15,
+    exclusion_margin=0.2,
+    headline_embeddings=None,
+):
+    """
+    Drops headlines that are far from every positive exemplar, or much closer to an exclusion
+    question than to any positive exemplar.
+
+    Args:
+        headlines_df: A DataFrame of headlines with "text_column", "title", "url", "id" and
+            "date_published" columns.
+        min_positive_score: Headlines whose best positive similarity is below this are dropped.
+        exclusion_margin: Headlines whose best exclusion similarity exceeds their best positive
+            similarity by more than this are dropped.
+        headline_embeddings: Optional dict mapping each index of headlines_df to its embedding.
+
+    Returns:
+        tuple: (kept_df, dropped_articles) where kept_df holds the rows to screen with GPT, with the
+        closest exclusion question of each in a "closest_question" column, and dropped_articles is
+        a list of dicts (title, url, id, published, scores and the closest exclusion question) for
+        the workbook.
+    """
+    if headlines_df.empty:
+        return headlines_df, []
+    scores = score_headlines(
+        openai_client,
+        headlines_df["text_column"].tolist(),
+        exclusion_questions,
+        positive_exemplars,
+        [headline_embeddings[index] for index in headlines_df.index] if headline_embeddings else None,
+    )
+    scores.index = headlines_df.index
+    dropped = (scores["positive_score"] < min_positive_score) | (
+        scores["exclusion_score"] - scores["positive_score"] > exclusion_margin
+    )
+    dropped_articles = [
+        {
+            "title": headlines_df.loc[index, "title"].split(" - ")[0].strip(),
+            "url": headlines_df.loc[index, "url"],
+            "id": headlines_df.loc[index, "id"],
+            "published": headlines_df.loc[index, "date_published"],
+            "positive_score": round(float(scores.loc[index, "positive_score"]), 3),
+            "exclusion_score": round(float(scores.loc[index, "exclusion_score"]), 3),
+            "closest_question": scores.loc[index, "closest_question"],
+        }
+        for index in headlines_df.index[dropped]
+    ]
+    logger.info("Prefilter dropped %s of %s headlines", len(dropped_articles), len(headlines_df))
+    return headlines_df.assign(closest_question=scores["closest_question"])[~dropped], dropped_articles
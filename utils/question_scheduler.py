@@ -0,0 +1,150 @@
+"""
+This module orders a folder's exclusion questions so that screening reaches its first "yes" in
+as few GPT calls (and prompt tokens) as possible.
+
+Screening stops at the first question answered "yes", so the expected cost of an order is lowest
+when questions are asked by decreasing hit rate per unit of cost (p / c). Hit rates and costs
+are learned from earlier runs and persisted per folder.
+
+Classes:
+- QuestionScheduler: Persistent per-folder question statistics and the resulting question order.
+"""
+
+from contextlib import closing
+import logging
+import sqlite3
+import threading
+import time
+
+from utils.cache import get_cache_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QuestionScheduler:
+    """
+    Tracks how often each exclusion question of a folder is asked, how often it is answered "yes"
+    and how many prompt tokens it costs. Counts of the current run are kept in memory and added to
+    the persisted totals by save().
+    """
+
+    def __init__(self, folder, fname="question_stats.sqlite"):
+        self.folder = folder
+        self.path = get_cache_path(fname)
+        self.lock = threading.Lock()
+        self.run_counts = {}
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS question_stats ("
+                "folder TEXT NOT NULL, question TEXT NOT NULL, asked INTEGER NOT NULL, "
+                "hits INTEGER NOT NULL, tokens INTEGER NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (folder, question))"
+            )
+            rows = conn.execute(
+                "SELECT question, asked, hits, tokens FROM question_stats WHERE folder = ?", (folder,)
+            ).fetchall()
+        self.totals = {question: {"asked": asked, "hits": hits, "tokens": tokens} for question, asked, hits, tokens in rows}
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _counts(self, question):
+        totals = self.totals.get(question, {"asked": 0, "hits": 0, "tokens": 0})
+        run = self.run_counts.get(question, {"asked": 0, "hits": 0, "tokens": 0})
+        return {key: totals[key] + run[key] for key in totals}
+
+    def hit_rate(self, question):
+        """
+        Returns the estimated probability that question is answered "yes", with a uniform prior
+        so that questions never asked yet are neither favoured nor ignored.
+        """
+        with self.lock:
+            counts = self._counts(question)
+        return (counts["hits"] + 1) / (counts["asked"] + 2)
+
+    def cost(self, question):
+        """
+        Returns the average prompt tokens of question, or None if it has never been asked.
+        """
+        with self.lock:
+            counts = self._counts(question)
+        return counts["tokens"] / counts["asked"] if counts["asked"] else None
+
+    def order(self, questions, first_question=None):
+        """
+        Returns questions sorted by decreasing hit rate per prompt token. Questions without a known
+        cost are charged the average cost of the others; ties keep the original order.
+
+        Args:
+            first_question: Optional question to ask first regardless of its statistics, e.g. the
+                exclusion question closest to the headline according to the prefilter.
+        """
+        costs = {question: self.cost(question) for question in questions}
+        known_costs = [cost for cost in costs.values() if cost]
+        default_cost = sum(known_costs) / len(known_costs) if known_costs else 1.0
+        ordered = sorted(questions, key=lambda question: -self.hit_rate(question) / (costs[question] or default_cost))
+        if first_question in ordered:
+            ordered.remove(first_question)
+            ordered.insert(0, first_question)
+        return ordered
+
+    def record(self, asked_questions, triggered_by, tokens_per_question):
+        """
+        Records the outcome of screening one headline.
+
+        Args:
+            asked_questions: The questions in the order they were asked.
+            triggered_by: The question answered "yes" (screening stopped there), or "" if none.
+            tokens_per_question: A dict mapping each asked question to its prompt tokens.
+        """
+        if triggered_by in asked_questions:
+            asked_questions = asked_questions[:asked_questions.index(triggered_by) + 1]
+        with self.lock:
+            for question in asked_questions:
+                counts = self.run_counts.setdefault(question, {"asked": 0, "hits": 0, "tokens": 0})
+                counts["asked"] += 1
+                counts["hits"] += int(question == triggered_by)
+                counts["tokens"] += tokens_per_question.get(question, 0)
+
+    def stats(self):
+        """
+        Returns, for each question asked in this run, the calls, hits and prompt tokens of the run
+        and the persisted hit rate and average cost that its order is based on.
+        """
+        with self.lock:
+            run_counts = {question: dict(counts) for question, counts in self.run_counts.items()}
+        return {
+            question: {
+                "asked": counts["asked"],
+                "hits": counts["hits"],
+                "tokens": counts["tokens"],
+                "hit_rate": self.hit_rate(question),
+                "avg_tokens": self.cost(question),
+            }
+            for question, counts in run_counts.items()
+        }
+
+    def save(self):
+        """
+        Adds the counts of this run to the persisted totals.
+        """
+        with self.lock:
+            run_counts, self.run_counts = self.run_counts, {}
+            for question, counts in run_counts.items():
+                totals = self.totals.setdefault(question, {"asked": 0, "hits": 0, "tokens": 0})
+                for key in totals:
+                    totals[key] += counts[key]
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT INTO question_stats (folder, question, asked, hits, tokens, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (folder, question) DO UPDATE SET asked = asked + excluded.asked, "
+                "hits = hits + excluded.hits, tokens = tokens + excluded.tokens, updated_at = excluded.updated_at",
+                [
+                    (self.folder, question, counts["asked"], counts["hits"], counts["tokens"], now)
+                    for question, counts in run_counts.items()
+                ],
+            )
+        logger.info("Saved statistics of %s questions for %s", len(run_counts), self.folder)
@@ -0,0 +1,135 @@
+"""
+This module provides thread-safe token buckets used to keep concurrent GPT calls
+within the OpenAI requests-per-minute and tokens-per-minute limits of the account.
+
+Classes:
+- TokenBucket: A single bucket refilled continuously at a per-minute rate.
+- RateLimiter: Combines a request bucket and a token bucket for one model.
+- AdaptiveConcurrency: Limits calls in flight, adapting the limit AIMD-style to throttling.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `rate_per_minute`.
+    Callers block in `acquire` until enough capacity is available.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Initializes the bucket full, so that the first calls of a run are not delayed.
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.available = min(self.capacity, self.available + elapsed * self.rate_per_second)
+        self.last_refill = now
+
+    def acquire(self, amount=1):
+        """
+        Blocks until `amount` can be taken from the bucket and takes it.
+        Requests larger than the bucket capacity are let through once the bucket is full,
+        otherwise they would wait forever.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount or self.available >= self.capacity:
+                    self.available -= amount
+                    return waited
+                missing = min(amount, self.capacity) - self.available
+                wait = missing / self.rate_per_second
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """
+    Rate limiter for one model: every call takes one request and its estimated tokens.
+    A limit of None (or 0) disables the corresponding bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, num_tokens=0):
+        """
+        Blocks until one request and `num_tokens` tokens are available.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        waited = 0.0
+        if self.request_bucket:
+            waited += self.request_bucket.acquire(1)
+        if self.token_bucket and num_tokens:
+            waited += self.token_bucket.acquire(num_tokens)
+        return waited
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of calls in flight. The limit grows by one per limit successful calls
+    (additive increase) and halves whenever a call is throttled (multiplicative decrease), so
+    that concurrency settles just below what the account allows, like TCP congestion control.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.throttles = 0
+        self.condition = threading.Condition()
+
+    def set_maximum(self, maximum):
+        """
+        Sets the highest limit. Until a call has been throttled the limit starts at maximum, so a
+        run's configured concurrency is used right away; after that the limit learned so far is
+        kept, capped at maximum.
+        """
+        with self.condition:
+            self.maximum = max(self.minimum, maximum)
+            self.limit = min(self.limit, self.maximum) if self.throttles else float(self.maximum)
+            self.condition.notify_all()
+
+    def acquire(self):
+        """
+        Blocks until fewer than limit calls are in flight and takes a slot.
+
+        Returns:
+            The number of seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self.condition:
+            while self.in_flight >= max(self.minimum, int(self.limit)):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def release(self, throttled=False):
+        """
+        Frees a slot and adapts the limit to the outcome of the call.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
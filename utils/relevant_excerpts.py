@@ -1,11 +1,19 @@
 """
-Not using this module as of right now
+Embeds text chunks and finds the excerpts most relevant to a set of variables.
+Used to trim long articles down to a token budget before project details are extracted.
 """
 import json
 import numpy as np
 import os
+import re
+import threading
 import tiktoken
 
+from services.openai_calls import get_call_layer
+
+_field_embeddings = {}
+_field_embeddings_lock = threading.Lock()
+
 
 def get_cache_fname(pdf_path, path_fxn):
     pdf_fname = os.path.basename(pdf_path)
@@ -23,7 +31,7 @@ def cache_embeddings(embeddings, text_chunks, pdf_file_path, path_fxn):
 
 
 def generate_embeddings(openai_client, text, model="text-embedding-3-small"):
-    response = openai_client.embeddings.create(model=model, input=text)
+    response = get_call_layer().call(openai_client.embeddings.with_raw_response.create, model=model, input=text)
     return response
 
 
@@ -32,6 +40,36 @@ def generate_embedding(openai_client, text):
     return r.data[0].embedding
 
 
+def batch_texts_by_tokens(texts, token_limit, enc):
+    batches = []
+    current_batch = []
+    current_tokens = 0
+    for text in texts:
+        tokens = len(enc.encode(text))
+        if current_tokens + tokens > token_limit and current_batch:
+            batches.append(current_batch)
+            current_batch = [text]
+            current_tokens = tokens
+        else:
+            current_batch.append(text)
+            current_tokens += tokens
+    if len(current_batch) > 0:
+        batches.append(current_batch)
+    return batches
+
+
+def embed_texts(openai_client, texts, embeddings_model="text-embedding-3-small", token_limit=8000):
+    """
+    Embeds a list of texts in as few requests as the token limit per request allows.
+    """
+    enc = tiktoken.encoding_for_model(embeddings_model)
+    embeddings = []
+    for batch in batch_texts_by_tokens(texts, token_limit, enc):
+        response = generate_embeddings(openai_client, batch, embeddings_model)
+        embeddings.extend([r.embedding for r in response.data])
+    return embeddings
+
+
 def generate_all_embeddings(openai_client, pdf_path, text_chunks, path_fxn):
     embeddings_model, token_limit = "text-embedding-3-small", 8000
     cache_fname = get_cache_fname(pdf_path, path_fxn)
@@ -40,27 +78,7 @@ def generate_all_embeddings(openai_client, pdf_path, text_chunks, path_fxn):
             cached_embeddings = json.load(f)
             return cached_embeddings["embeddings"], cached_embeddings["text_chunks"]
     else:
-        batches = []
-        current_batch = []
-        current_tokens = 0
-        enc = tiktoken.encoding_for_model(embeddings_model)
-        for text in text_chunks:
-            tokens = len(enc.encode(text))
-            if current_tokens + tokens > token_limit:
-                batches.append(current_batch)
-                current_batch = [text]
-                current_tokens = tokens
-            else:
-                current_batch.append(text)
-                current_tokens += tokens
-        if len(current_batch) > 0:
-            batches.append(current_batch)
-
-        embeddings = []
-        for batch in batches:
-            response = generate_embeddings(openai_client, batch, embeddings_model)
-            embeddings.extend([r.embedding for r in response.data])
-
+        embeddings = embed_texts(openai_client, text_chunks, embeddings_model, token_limit)
         cache_embeddings(embeddings, text_chunks, pdf_path, path_fxn)
         return embeddings, text_chunks
 
@@ -116,3 +134,83 @@ def find_top_relevant_texts(
         for i, _ in sorted_embeddings
         if i not in indeces
     ]
+
+
+def chunk_article_text(article_text, max_chunk_size=800):
+    """
+    Splits article text into chunks of whole sentences, each at most max_chunk_size characters
+    (unless a single sentence is longer).
+    """
+    sentences = re.split(r"(?<=[.!?])\s+", re.sub(r"\s+", " ", article_text).strip())
+    chunks = []
+    curr_chunk = ""
+    for sentence in sentences:
+        if curr_chunk and len(curr_chunk) + len(sentence) >= max_chunk_size:
+            chunks.append(curr_chunk.strip())
+            curr_chunk = ""
+        curr_chunk += sentence + " "
+    if curr_chunk.strip():
+        chunks.append(curr_chunk.strip())
+    return chunks
+
+
+def embed_fields(openai_client, fields):
+    """
+    Returns the embedding of each field description, embedding each description only once per process.
+    """
+    with _field_embeddings_lock:
+        missing = [desc for desc in fields.values() if desc not in _field_embeddings]
+    if missing:
+        embeddings = embed_texts(openai_client, missing)
+        with _field_embeddings_lock:
+            _field_embeddings.update(zip(missing, embeddings))
+    with _field_embeddings_lock:
+        return {name: _field_embeddings[desc] for name, desc in fields.items()}
+
+
+def select_relevant_excerpts(openai_client, article_text, fields, token_budget, gpt_model="gpt-4o"):
+    """
+    Trims a long article down to the chunks most relevant to the extraction fields.
+    Articles within token_budget are returned whole. Otherwise the article is chunked, each chunk
+    is ranked against every field with find_top_relevant_texts, and chunks are taken from the
+    fields' rankings in turn until the token budget is full. Chunks keep their original order.
+
+    Args:
+        fields: A dictionary mapping each field name to a description of what to extract.
+
+    Returns:
+        tuple: (text, tokens_saved)
+    """
+    try:
+        enc = tiktoken.encoding_for_model(gpt_model)
+    except KeyError:
+        enc = tiktoken.get_encoding("o200k_base")
+    total_tokens = len(enc.encode(article_text))
+    if total_tokens <= token_budget:
+        return article_text, 0
+
+    chunks = chunk_article_text(article_text)
+    chunk_tokens = [len(enc.encode(chunk)) for chunk in chunks]
+    chunk_embeddings = embed_texts(openai_client, chunks)
+    field_embeddings = embed_fields(openai_client, fields)
+    chunk_positions = {chunk: i for i, chunk in enumerate(chunks)}
+    rankings = [
+        [
+            chunk_positions[chunk]
+            for _, chunk in find_top_relevant_texts(chunk_embeddings, chunks, field_embedding, len(chunks), field_name)
+        ]
+        for field_name, field_embedding in field_embeddings.items()
+    ]
+
+    selected = set()
+    used_tokens = 0
+    for rank in range(len(chunks)):
+        for ranking in rankings:
+            if rank >= len(ranking) or ranking[rank] in selected:
+                continue
+            i = ranking[rank]
+            if used_tokens + chunk_tokens[i] <= token_budget:
+                selected.add(i)
+                used_tokens += chunk_tokens[i]
+    excerpts = "\n...\n".join(chunks[i] for i in sorted(selected))
+    return excerpts, total_tokens - len(enc.encode(excerpts))
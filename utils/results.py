@@ -9,15 +9,21 @@ Functions:
 - format_output_doc: Formats the output Word document with query and variable specifications.
 - output_results: Outputs the results to a Word document.
 - output_metrics: Outputs processing metrics to a Word document.
+- save_output_file: Writes a file to the output directory and uploads it to OneDrive.
+- get_discarded_stage: Returns the outcome shown in the "All Articles" sheet for an article of a ledger bucket.
+- output_results_excel: Writes the results workbook.
+- get_run_report_fname: Returns the name of the run report that goes with a workbook.
+- output_run_report: Writes the metrics of a run as JSON next to its workbook.
 """
 
+from contextlib import nullcontext
 from datetime import datetime
 from docx.shared import Pt
 import os
 import io
+import json
 import pandas as pd
 from utils.validate_results import get_check_results_flag
-import streamlit as st
 from services.onedrive import get_graph_api_token, upload_file_to_onedrive
 import datetime
 # Function to generate the output file name based on the provided path function and file type
@@ -62,21 +68,111 @@ def output_metrics(doc, num_docs, t, num_pages, failed_pdfs):
     )
     if len(failed_pdfs) > 0:
         doc.add_heading(f"Unable to process the following PDFs: {failed_pdfs}", 4)
-def output_results_excel(relevant_articles, irrelevant_articles, output_path):
+def save_output_file(file_bytes, output_path, onedrive_credentials=None, output_dir=None, metrics=None):
     """
-    Writes the results into an Excel file with four worksheets:
+    Writes file_bytes to output_dir/output_path if output_dir is given, and uploads them to
+    OneDrive as output_path if onedrive_credentials are given. With metrics (a
+    utils.metrics.RunMetrics), the upload is timed as the "upload" stage.
+
+    Returns:
+        str: The local path if output_dir is given, else the OneDrive name, or None if the file
+        could not be written.
+    """
+    output_location = None
+    if output_dir:
+        output_location = os.path.join(output_dir, output_path)
+        os.makedirs(os.path.dirname(output_location), exist_ok=True)
+        with open(output_location, "wb") as f:
+            f.write(file_bytes)
+        print(f"Saved to: {output_location}")
+    if onedrive_credentials:
+        with metrics.timer("upload") if metrics else nullcontext():
+            graph_access_token = get_graph_api_token(
+                onedrive_credentials["tenant_id"], onedrive_credentials["client_id"], onedrive_credentials["client_secret"]
+            )
+            if not graph_access_token:
+                print("Could not obtain Graph API token.")
+                return output_location
+            if upload_file_to_onedrive(
+                file_bytes, onedrive_credentials["drive_id"], onedrive_credentials["parent_item_id"], output_path, graph_access_token
+            ):
+                print(f"Saved to OneDrive: {output_path}")
+                output_location = output_location or output_path
+    return output_location
+
+
+# Core extracted details shown for every article in the "All Articles" sheet (column -> article key)
+SUMMARY_DETAIL_COLUMNS = {
+    "Project name": "project_name",
+    "Company": "company",
+    "Country": "country",
+    "Technology to be used": "technology",
+    "Year to be online": "timeline",
+}
+
+
+def get_discarded_stage(bucket, article):
+    """
+    Returns the "Discarded" value of the "All Articles" sheet for an article of a ledger bucket
+    ("relevant", "irrelevant" or "prefiltered"), following the same rules as output_results_excel.
+    """
+    if bucket == "prefiltered":
+        return "Discarded by prefilter"
+    if bucket != "relevant" or article.get("irrelevant"):
+        return "Discarded before Stage 1"
+    if article.get("company", "").strip() and article.get("project_name", "").strip():
+        return ""
+    return "Discarded before Stage 2"
+
+
+def output_results_excel(
+    relevant_articles,
+    irrelevant_articles,
+    output_path,
+    duplicate_articles=None,
+    prefiltered_articles=None,
+    onedrive_credentials=None,
+    output_dir=None,
+    folder_column=False,
+    metrics=None,
+    error_articles=None,
+):
+    """
+    Writes the results into an Excel file with six worksheets:
       - 'Relevant Stage 1': Articles flagged as relevant by the headline but with insufficient extracted core details.
            (Contains only the article title and URL.)
       - 'Relevant Stage 2': Articles flagged as relevant by the headline that contain at least a project name and a company.
            (Includes extra columns such as Project name, Project scale, Year to be online, Technology to be used,
             Company, Potential Partners, Continent, Country, Project status, and a "Check Results" column.)
       - 'Irrelevant': Articles deemed irrelevant.
+      - 'Prefiltered': Headlines dropped by the embedding prefilter before GPT screening, with their
+           similarity scores and the closest exclusion question, so that the thresholds can be audited.
+      - 'Errors': Articles that could not be processed (error_articles), with the stages that
+           failed and their errors in "errors" and the screening verdict, if any, in "relevant".
+           They are neither relevant nor irrelevant.
       - 'All Articles': A combined list of all articles (from irrelevant, Stage 1, and Stage 2) showing
            the article titles, URLs, and if they were discarded before stage 1 or stage 2.
+           Near-duplicate headlines that were not screened themselves (duplicate_articles, each with a
+           "duplicate_of" id) are listed with the outcome and core details of their representative
+           article. A duplicate whose representative is not among the articles (e.g. re-emitted from
+           the processed-item ledger) may carry it as "representative", a dict with its "bucket"
+           and "article" (see utils.ledger.ProcessedLedger.prior_results).
+
+    With folder_column=True (a workbook of several folders), every sheet gets a "folder" column
+    with the "folder" key of the articles.
+
+    The workbook is uploaded to OneDrive as output_path if onedrive_credentials (a dict with the keys
+    of leadit.config.ONEDRIVE_SECRET_KEYS) are given, and written to output_dir if one is given.
+    With metrics (a utils.metrics.RunMetrics), building the workbook is timed as the "excel"
+    stage and uploading it as the "upload" stage.
+
+    Returns:
+        str: Where the workbook was written (the local path if output_dir is given, else its
+        OneDrive name), or None if it could not be written.
     """
 
     # Define simple columns for Stage 1 and Irrelevant sheets.
-    simple_cols = ["title", "url"]
+    simple_cols = ["title", "url"] + (["folder"] if folder_column else [])
 
     # Define detailed columns for the Relevant Stage 2 sheet.
     detailed_cols = [
@@ -118,7 +214,7 @@ def output_results_excel(relevant_articles, irrelevant_articles, output_path):
         "References 1",
         "Reference Article",
         "Check Results"  # New column for validation flag
-    ]
+    ] + (["Folder"] if folder_column else [])
 
     # First, filter out articles that have been flagged as irrelevant via the "irrelevant" key.
     newly_irrelevant = []
@@ -165,10 +261,15 @@ def output_results_excel(relevant_articles, irrelevant_articles, output_path):
         # Basic article info.
         row_data["Reference Article"] = article.get("title", "")
         row_data["References 1"] = article.get("url", "")
+        if folder_column:
+            row_data["Folder"] = article.get("folder", "")
         
         # Use the full article text (if available) for fuzzy-checking.
         print("full text", article.get("full_text"))
-        if "full_text" in article and article["full_text"]:
+        if "check_results" in article:
+            # Already validated by the pipeline
+            row_data["Check Results"] = article["check_results"]
+        elif "full_text" in article and article["full_text"]:
             core_extracted = {
                 "project_name": article.get("project_name", ""),
                 "scale": article.get("scale", ""),
@@ -193,47 +294,92 @@ def output_results_excel(relevant_articles, irrelevant_articles, output_path):
     print("Simple DataFrame:", df_stage1)
 
     # Build DataFrame for "All Articles"
-    # It will contain title, URL, and a "Discarded" column indicating the discard stage.
+    # It will contain title, URL, a "Discarded" column indicating the discard stage and the core
+    # extracted details of relevant articles.
     all_articles = []
-    # For Stage 1 articles, mark as "Discarded before Stage 2".
-    for article in stage1_articles:
+    # Keep each article's row so that its near-duplicates can share its outcome and details.
+    representatives = {}
+
+    def add_all_articles_row(article, discarded):
         all_articles.append({
             "title": article.get("title", ""),
             "url": article.get("url", ""),
-            "Discarded": "Discarded before Stage 2"
+            "folder": article.get("folder", ""),
+            "Discarded": discarded,
+            **{col: article.get(key, "") for col, key in SUMMARY_DETAIL_COLUMNS.items()},
         })
+        representatives[(article.get("folder"), str(article.get("id")))] = all_articles[-1]
+
+    # For Stage 1 articles, mark as "Discarded before Stage 2".
+    for article in stage1_articles:
+        add_all_articles_row(article, "Discarded before Stage 2")
     # For Stage 2 articles, leave the "Discarded" column blank.
     for article in stage2_articles:
-        all_articles.append({
-            "title": article.get("title", ""),
-            "url": article.get("url", ""),
-            "Discarded": ""
-        })
+        add_all_articles_row(article, "")
     # For irrelevant articles, mark as "Discarded before Stage 1".
     for article in irrelevant_articles:
+        add_all_articles_row(article, "Discarded before Stage 1")
+    # For prefiltered headlines, mark as "Discarded by prefilter".
+    for article in prefiltered_articles or []:
+        add_all_articles_row(article, "Discarded by prefilter")
+    # For articles that could not be processed, mark as "Not processed (error)".
+    for article in error_articles or []:
+        add_all_articles_row(article, "Not processed (error)")
+    # For near-duplicates, copy the outcome and details of the representative article. Duplicates
+    # re-emitted from the ledger carry their representative if it is not in this workbook.
+    for article in duplicate_articles or []:
+        representative = representatives.get((article.get("folder"), str(article.get("duplicate_of"))))
+        if representative is None and article.get("representative"):
+            stored = article["representative"]
+            representative = {
+                "title": stored["article"].get("title", ""),
+                "Discarded": get_discarded_stage(stored["bucket"], stored["article"]),
+                **{col: stored["article"].get(key, "") for col, key in SUMMARY_DETAIL_COLUMNS.items()},
+            }
+        representative = representative or {}
         all_articles.append({
             "title": article.get("title", ""),
             "url": article.get("url", ""),
-            "Discarded": "Discarded before Stage 1"
+            "folder": article.get("folder", ""),
+            "Discarded": representative.get("Discarded", ""),
+            **{col: representative.get(col, "") for col in SUMMARY_DETAIL_COLUMNS},
+            "Duplicate of": representative.get("title", "")
         })
-    df_all = pd.DataFrame(all_articles, columns=["title", "url", "Discarded"])
-    tenant_id = st.secrets["od_tenantid"]
-    client_id = st.secrets["od_client_id"]
-    client_secret = st.secrets["od_client_value"]
-    drive_id = st.secrets["od_drive_id"]
-    parent_item_id = st.secrets["od_parent_item"]
+    df_all = pd.DataFrame(all_articles, columns=simple_cols + ["Discarded"] + list(SUMMARY_DETAIL_COLUMNS) + ["Duplicate of"])
+    df_prefiltered = pd.DataFrame(
+        prefiltered_articles or [],
+        columns=simple_cols + ["positive_score", "exclusion_score", "closest_question"],
+    )
+    df_errors = pd.DataFrame(error_articles or [], columns=simple_cols + ["relevant", "errors"])
     buffer = io.BytesIO()
-    # Write all DataFrames to an Excel file with four sheets.
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df_stage1.to_excel(writer, sheet_name="Relevant Stage 1", index=False)
-        df_stage2.to_excel(writer, sheet_name="Relevant Stage 2", index=False)
-        df_irrelevant.to_excel(writer, sheet_name="Irrelevant", index=False)
-        df_all.to_excel(writer, sheet_name="All Articles", index=False)
+    # Write all DataFrames to an Excel file with six sheets.
+    with metrics.timer("excel") if metrics else nullcontext():
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            df_stage1.to_excel(writer, sheet_name="Relevant Stage 1", index=False)
+            df_stage2.to_excel(writer, sheet_name="Relevant Stage 2", index=False)
+            df_irrelevant.to_excel(writer, sheet_name="Irrelevant", index=False)
+            df_prefiltered.to_excel(writer, sheet_name="Prefiltered", index=False)
+            df_errors.to_excel(writer, sheet_name="Errors", index=False)
+            df_all.to_excel(writer, sheet_name="All Articles", index=False)
     buffer.seek(0)
-    file_bytes = buffer.getvalue()
-    graph_access_token = get_graph_api_token(tenant_id, client_id, client_secret)
-    if not graph_access_token:
-        print("Could not obtain Graph API token.")
-        return
-    upload_file_to_onedrive(file_bytes, drive_id, parent_item_id, output_path, graph_access_token)
-    print(f"Excel saved to: {output_path}")
+    return save_output_file(buffer.getvalue(), output_path, onedrive_credentials, output_dir, metrics)
+
+
+def get_run_report_fname(output_fname):
+    """
+    Returns the name of the run report of the workbook output_fname, e.g.
+    LeadIT-Steel/results_20250101_120000_report.json for LeadIT-Steel/results_20250101_120000.xlsx.
+    """
+    return os.path.splitext(output_fname)[0] + "_report.json"
+
+
+def output_run_report(report, output_fname, onedrive_credentials=None, output_dir=None):
+    """
+    Writes report (see utils.metrics.RunMetrics.report) as JSON next to the workbook output_fname,
+    wherever the workbook was written.
+
+    Returns:
+        str: Where the report was written, or None if it could not be written.
+    """
+    file_bytes = json.dumps(report, indent=2, ensure_ascii=False, default=str).encode("utf-8")
+    return save_output_file(file_bytes, get_run_report_fname(output_fname), onedrive_credentials, output_dir)
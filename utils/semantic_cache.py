@@ -0,0 +1,162 @@
+"""
+This module reuses screening verdicts across runs for headlines that are worded slightly
+differently from a headline screened before (e.g. the same story with a different publisher
+suffix), which the exact-prompt response cache misses.
+
+Headline embeddings are shortened to CACHE_DIMENSIONS and normalized (text-embedding-3 vectors
+keep their meaning when truncated), so that a folder's whole cache fits in one float32 matrix and
+a batch of lookups is a single matrix product, even with 100k+ cached headlines.
+
+Verdicts are only reused within their scope, a hash of the screening model and the folder's
+questions, so that a new model or changed questions never inherit verdicts of the old ones.
+
+Classes:
+- SemanticVerdictCache: SQLite-backed store of (headline embedding, verdict) with a NumPy index per folder.
+
+Functions:
+- get_verdict_scope: Returns the scope of verdicts screened with a model for a set of questions.
+"""
+
+from contextlib import closing
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.cache import get_cache_path, hash_key
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_DIMENSIONS = 256
+# Lookups are scored in chunks so that the similarity matrix stays small
+LOOKUP_CHUNK_SIZE = 256
+
+
+def _prepare(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32)[:, :CACHE_DIMENSIONS]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def get_verdict_scope(gpt_model, questions):
+    """
+    Returns the scope of verdicts screened with gpt_model for questions (in any order).
+    """
+    return hash_key({"model": gpt_model, "questions": sorted(questions)})
+
+
+class SemanticVerdictCache:
+    """
+    Stores the screening verdict of every headline screened by GPT with its embedding, per folder
+    and scope (see get_verdict_scope), and finds the closest cached headline of new headlines in
+    the same scope. Entries older than max_age_days are evicted when the cache is opened.
+    """
+
+    def __init__(self, scope, fname="semantic_verdicts.sqlite", max_age_days=60):
+        self.scope = scope
+        self.path = get_cache_path(fname)
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.lock = threading.Lock()
+        # folder -> (embedding matrix, list of (irrelevant, triggered_by))
+        self.indexes = {}
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(verdicts)")]
+            if columns and "scope" not in columns:
+                # Entries of older versions do not record the model and questions they were screened with
+                conn.execute("DROP TABLE verdicts")
+                logger.info("Dropped semantic cache entries without a model and question scope")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "folder TEXT NOT NULL, scope TEXT NOT NULL, headline TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "irrelevant INTEGER NOT NULL, triggered_by TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (folder, scope, headline))"
+            )
+        self.evict()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def evict(self):
+        """
+        Drops entries older than max_age_days.
+        """
+        with self._connect() as conn, conn:
+            evicted = conn.execute(
+                "DELETE FROM verdicts WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            ).rowcount
+        if evicted:
+            logger.info("Evicted %s expired semantic cache entries", evicted)
+            with self.lock:
+                self.indexes.clear()
+
+    def _load_index(self, folder):
+        with self.lock:
+            if folder in self.indexes:
+                return self.indexes[folder]
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT embedding, irrelevant, triggered_by FROM verdicts WHERE folder = ? AND scope = ?",
+                (folder, self.scope),
+            ).fetchall()
+        if rows:
+            matrix = np.frombuffer(b"".join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), CACHE_DIMENSIONS)
+        else:
+            matrix = np.zeros((0, CACHE_DIMENSIONS), dtype=np.float32)
+        index = (matrix, [(bool(row[1]), row[2]) for row in rows])
+        with self.lock:
+            self.indexes[folder] = index
+        return index
+
+    def lookup(self, folder, embeddings, max_distance=0.05):
+        """
+        Finds, for each embedding, the closest cached headline of folder.
+
+        Args:
+            embeddings: A list of headline embeddings.
+            max_distance: Largest cosine distance (1 - cosine similarity) at which a cached verdict is reused.
+
+        Returns:
+            list: For each embedding, a tuple (irrelevant, triggered_by, similarity) of the closest
+            cached headline, or None if no cached headline is close enough.
+        """
+        matrix, verdicts = self._load_index(folder)
+        if len(embeddings) == 0 or len(verdicts) == 0:
+            return [None] * len(embeddings)
+        queries = _prepare(embeddings)
+        results = []
+        for start in range(0, len(queries), LOOKUP_CHUNK_SIZE):
+            similarities = queries[start:start + LOOKUP_CHUNK_SIZE] @ matrix.T
+            best = similarities.argmax(axis=1)
+            for row, i in enumerate(best):
+                similarity = float(similarities[row, i])
+                results.append((*verdicts[i], similarity) if 1 - similarity <= max_distance else None)
+        return results
+
+    def add(self, folder, entries):
+        """
+        Stores the verdicts of newly screened headlines.
+
+        Args:
+            entries: A list of dicts with keys "headline", "embedding", "irrelevant" and "triggered_by".
+        """
+        if not entries:
+            return
+        matrix = _prepare([entry["embedding"] for entry in entries])
+        now = time.time()
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (folder, scope, headline, embedding, irrelevant, triggered_by, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (folder, self.scope, entry["headline"], vector.tobytes(), int(entry["irrelevant"]), entry.get("triggered_by") or "", now)
+                    for entry, vector in zip(entries, matrix)
+                ],
+            )
+        with self.lock:
+            # Reloaded on the next lookup, so replaced headlines are not counted twice
+            self.indexes.pop(folder, None)
+        logger.info("Added %s headlines to the semantic verdict cache for %s", len(entries), folder)